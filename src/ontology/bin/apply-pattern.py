@@ -9,22 +9,35 @@ import yaml
 import json
 import uuid
 import csv
+import heapq
 import itertools
+import io
+import multiprocessing
+import os
 import sys
 from collections import Counter
+from xml.sax.saxutils import escape, quoteattr
+
+# The OWL output helpers shared with the src/ontology/util_*.py scripts
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from util_rdfxml import Namespaces, declaration, parse_class_expression, section, write_property
 
-gcif = None
 synmap = {}
 titlemode = False
 
+CHUNK_SIZE = 500
+WRITE_BUFFER_SIZE = 1 << 20
+
 def main():
 
     parser = argparse.ArgumentParser(description='DOSDB'
                                                  'fooo',
                                      formatter_class=argparse.RawTextHelpFormatter)
 
-    parser.add_argument('-t', '--to', type=str, required=False,
-                        help='Renderer')
+    parser.add_argument('-t', '--to', type=str, required=False, choices=sorted(WRITERS),
+                        help='Renderer: omn (Manchester syntax, the default), owl (RDF/XML)\n'
+                             'or ofn (OWL functional syntax, with GCI axioms inline\n'
+                             'unless --gci is given)')
     parser.add_argument('-n', '--name', type=str, required=False, default='auto',
                         help='Ontology name')
     parser.add_argument('-b', '--base', type=str, required=False, default='http://purl.obolibrary.org/obo/',
@@ -37,21 +50,39 @@ def main():
                         help='Input file for values to be filled in template')
     parser.add_argument('-x', '--xpfiles', nargs='+', required=False,
                         help='Input file for values to be filled in template')
+    parser.add_argument('-f', '--xpfilter', nargs='+', required=False, default=[],
+                        help='Only cross rows of --xpfiles file AXIS (1, 2, ...) whose COLUMN\n'
+                             'matches REGEX, given as AXIS:COLUMN=REGEX')
     parser.add_argument('-a', '--annotate', type=bool, required=False,
                         help='Annotate each generated class with template values')
     parser.add_argument('-U', '--titlemode', type=bool, required=False,
                         help='Auto-uppercasify (e.g. HPO)')
+    parser.add_argument('-o', '--output', type=str, required=False,
+                        help='Output file (default: stdout)')
+    parser.add_argument('-j', '--jobs', type=int, required=False,
+                        help='Render bindings in this many worker processes;\n'
+                             'output keeps input order')
     parser.add_argument('-G', '--gci', type=str, required=False,
                         help='Output file for GCI axioms not expressable in OMN')
     parser.add_argument('-s', '--suppress', nargs='+', required=False, default=[],
                         help='Suppress annotations')
     parser.add_argument('-S', '--synonym', type=str, required=False, default=[],
                         help='json synonym files')
+    parser.add_argument('-m', '--max-synonyms', type=int, required=False, default=100,
+                        help='Most auto-generated synonyms per class, best ranked first\n'
+                             '(0 for no limit)')
+    parser.add_argument('-r', '--synonym-sources', nargs='+', required=False, default=[],
+                        help='Rank synonyms from these json "source" values first, in order')
+    parser.add_argument('-M', '--manifest', type=str, required=False,
+                        help='YAML list of patterns to render, each with its input and\n'
+                             'output files; prefixes and synonyms are loaded once and\n'
+                             'patterns are rendered in --jobs processes')
     args = parser.parse_args()
 
     global titlemode
     titlemode = args.titlemode
 
+    # Shared by every pattern of a --manifest batch: loaded once.
     global synmap
     if args.synonym:
         f = open(args.synonym, 'r')
@@ -61,82 +92,166 @@ def main():
     prefixmap = {}
     if args.prefixes:
         f = open(args.prefixes, 'r')
-        prefixmap = yaml.load(f)
+        prefixmap = yaml.safe_load(f)
         f.close()
 
-    pattern_name = args.pattern
-    f = open(args.pattern, 'r') 
-    tobj = yaml.load(f)
+    if args.manifest:
+        entries = load_manifest(args.manifest)
+        jobs = min(args.jobs or multiprocessing.cpu_count(), len(entries))
+        # One pattern per worker process, each to its own output file.
+        with multiprocessing.Pool(jobs, init_batch_worker, (args, prefixmap, synmap, titlemode)) as pool:
+            for (pattern_path, output, count) in pool.imap_unordered(run_manifest_entry, entries):
+                sys.stderr.write('Rendered %s classes from %s into %s\n' % (count, pattern_path, output))
+        return
+
+    if not args.pattern:
+        sys.exit('Give a --pattern or --manifest')
+
+    bindings_list = []
+    if args.input:
+        bindings_list = parse_bindings_list(args.input)
+    if args.xpfiles:
+        bindings_list = parse_xp_files(args.xpfiles, parse_xp_filters(args.xpfilter))
+    run_pattern(args.pattern, bindings_list, args.output, args.gci, args, prefixmap, args.jobs)
+
+## Renders the pattern file pattern_path for each of bindings_list, to output
+## (stdout if None) and its GCI axioms to gci.  Returns the number of classes.
+def run_pattern(pattern_path, bindings_list, output, gci, args, prefixmap, jobs=None):
+
+    pattern_name = pattern_path
+    f = open(pattern_path, 'r') 
+    tobj = yaml.safe_load(f)
+    f.close()
     if 'pattern_name' not in tobj:
         tobj['pattern_name'] = pattern_name
 
     ontology_iri = args.base + args.name
 
-    global gcif
-    if args.gci:
-        gcif = open(args.gci, 'w')
+    pattern = Pattern(tobj, args.suppress, args.annotate, args.max_synonyms, args.synonym_sources)
+    writer = WRITERS[args.to or 'omn'](pattern, tobj, ontology_iri, args.base, prefixmap)
+
+    if 'axioms' in tobj and not gci and not writer.inline_axioms:
+        sys.exit('Pattern %s has axioms: give a GCI output file for them' % pattern_path)
+
+    gcif = None
+    if gci:
+        gcif = open(gci, 'w')
         gcif.write('Prefix(:=<%s>)\n' % args.base)
         for (k,v) in prefixmap.items():
             gcif.write('Prefix(%s:=<%s>)\n' % (k,v)) 
         gcif.write('Ontology(<%s-gci>\n' % ontology_iri)
         
-    bindings_list = []
-    if args.input:
-        bindings_list = parse_bindings_list(args.input)
-    if args.xpfiles:
-        bindings_list = parse_xp_files(args.xpfiles)
-    print('Prefix: : <%s>' % args.base)
-    print('Prefix: IAO: <http://purl.obolibrary.org/obo/IAO_>')
-    print('Prefix: DOSDP: <http://geneontology.org/foo/>')
-    print('Prefix: oio: <http://www.geneontology.org/formats/oboInOwl#>')
-    for (pfx,uri) in prefixmap.items():
-            print('Prefix: %s: <%s>' % (pfx,uri))
-    
-    print()
-    print(" ## Auto-generated")
-    print()
-    print('Ontology: <%s>' % ontology_iri)
-    if 'imports' in tobj:
-        for uri in tobj['imports']:
-            print('  Import: <%s>' % uri)
-    print('AnnotationProperty: IAO:0000115')
-    for v in tobj['vars']:
-        print('AnnotationProperty: %s' % make_internal_annotation_property(tobj, v))
-    print('AnnotationProperty: %s' % get_applies_pattern_property())
-    print('AnnotationProperty: oio:hasRelatedSynonym')
-    if 'annotations' in tobj:
-        for aobj in tobj['annotations']:
-            print('AnnotationProperty: %s' % aobj['property'])
-
-        
+    # All output goes through one buffered writer
+    out = io.open(output or sys.stdout.fileno(), 'w', buffering=WRITE_BUFFER_SIZE, closefd=bool(output))
+    out.write(writer.header())
+
+    if jobs and jobs > 1:
+        # Chunks are rendered in worker processes; imap hands results back in input order.
+        pool = multiprocessing.Pool(jobs, init_worker, (pattern, writer, synmap, titlemode))
+        rendered = pool.imap(render_chunk, chunks(bindings_list, CHUNK_SIZE))
+    else:
+        init_worker(pattern, writer, synmap, titlemode)
+        rendered = map(render_chunk, chunks(bindings_list, CHUNK_SIZE))
+
+    count = 0
+    for (text, gci_text, chunk_count) in rendered:
+        out.write(text)
+        if gci_text:
+            if gcif:
+                gcif.write(gci_text)
+            else:
+                out.write(gci_text)
+        count += chunk_count
 
-    ##print('AnnotationProperty: %s' % make_internal_annotation_property(tobj['pattern_name']))
-
-    p = tobj
-    # build map of quoted entity replacements
-    qm = {}
-    for k in p['classes']:
-        iri = p['classes'][k]
-        qm[k] = iri
-        print('Class: %s ## %s' % (iri,k))
-    for k in p['relations']:
-        iri = p['relations'][k]
-        qm[k] = iri
-        print('ObjectProperty: %s ## %s' % (iri,k))
-
-    print('## Auto-generated classes')
-    for bindings in bindings_list:
-        cls_iri = uuid_iri()
-        if 'class_iri' in tobj:
-            cls_iri = apply_template(tobj['class_iri'], bindings)
-        if 'iri' in bindings:
-            cls_iri = bindings['iri']
-        apply_pattern(tobj, qm, bindings, cls_iri, args)
+    if jobs and jobs > 1:
+        pool.close()
+        pool.join()
+    out.write(writer.footer())
+    out.close()
 
     if gcif:
         gcif.write(')')
-        gcif.close
-        
+        gcif.close()
+
+    return count
+
+## Reads a --manifest YAML list of patterns to render, e.g.
+##
+##   - pattern: food_process.yaml
+##     input: food_process.tsv
+##     output: food_process.omn
+##   - pattern: food_part.yaml
+##     xpfiles: [foods.tsv, parts.tsv]
+##     xpfilter: ['2:part=^UBERON:']
+##     output: food_part.omn
+##     gci: food_part-gci.ofn
+##
+## Relative paths are taken from the manifest's directory.
+def load_manifest(fn):
+    with open(fn, 'r') as f:
+        entries = yaml.safe_load(f) or []
+    base = os.path.dirname(fn)
+    for entry in entries:
+        if 'pattern' not in entry or 'output' not in entry or not ('input' in entry or 'xpfiles' in entry):
+            sys.exit('Manifest entry needs pattern, output and input or xpfiles: %s' % entry)
+        for key in ('pattern', 'input', 'output', 'gci'):
+            if key in entry:
+                entry[key] = os.path.join(base, entry[key])
+        if 'xpfiles' in entry:
+            entry['xpfiles'] = [os.path.join(base, fn) for fn in entry['xpfiles']]
+        # Check filters now rather than in a worker.
+        parse_xp_filters(entry.get('xpfilter', []))
+    return entries
+
+## --manifest worker state: options and resources shared by all patterns
+batch_args = None
+batch_prefixmap = None
+
+def init_batch_worker(args, prefixmap, synonyms, title):
+    global batch_args, batch_prefixmap, synmap, titlemode
+    batch_args = args
+    batch_prefixmap = prefixmap
+    synmap = synonyms
+    titlemode = title
+
+def run_manifest_entry(entry):
+    if 'xpfiles' in entry:
+        bindings_list = parse_xp_files(entry['xpfiles'], parse_xp_filters(entry.get('xpfilter', [])))
+    else:
+        bindings_list = parse_bindings_list(entry['input'])
+    count = run_pattern(entry['pattern'], bindings_list, entry['output'], entry.get('gci'), batch_args, batch_prefixmap)
+    return (entry['pattern'], entry['output'], count)
+
+
+## Rendering --jobs worker state: the compiled pattern and its writer
+worker_pattern = None
+worker_writer = None
+
+def init_worker(pattern, writer, synonyms, title):
+    global worker_pattern, worker_writer, synmap, titlemode
+    worker_pattern = pattern
+    worker_writer = writer
+    synmap = synonyms
+    titlemode = title
+
+## Returns (output text, GCI text, count) for a list of bindings
+def render_chunk(bindings_chunk):
+    texts = []
+    gci_texts = []
+    for bindings in bindings_chunk:
+        (text, gci_text) = worker_writer.record(worker_pattern.make_record(bindings))
+        texts.append(text)
+        gci_texts.append(gci_text)
+    return (''.join(texts), ''.join(gci_texts), len(bindings_chunk))
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
 def uuid_iri():
     return format('urn:uuid:%s' % str(uuid.uuid4()))
 
@@ -149,148 +264,237 @@ def parse_bindings_list(fn):
     delimiter='\t'
     if fn.endswith("csv"):
         delimiter=','
-    input_file = csv.DictReader(open(fn), delimiter=delimiter)
-    bindings_list = [row for row in input_file]
-    return bindings_list
-
-## reeads tabular files and applies cross-product
-def parse_xp_files(fns):
-    lists = []
-    for fn in fns:
-        delimiter='\t'
-        if fn.endswith("csv"):
-            delimiter=','
-        input_file = csv.DictReader(open(fn), delimiter=delimiter)
-        lists.append( [row for row in input_file] )
-    bindings_list = []
-    # assume pairwise: TODO: recurse for len>2
-    for i in lists[0]:
-        for j in lists[1]:
+    with open(fn) as f:
+        for row in csv.DictReader(f, delimiter=delimiter):
+            yield row
+
+## parses --xpfilter AXIS:COLUMN=REGEX options into {axis: [(column, regex), ...]}
+def parse_xp_filters(filters):
+    axis_filters = {}
+    for xpfilter in filters:
+        (axis, _, condition) = xpfilter.partition(':')
+        (column, _, regex) = condition.partition('=')
+        if not axis.isdigit() or not column:
+            sys.exit('Bad --xpfilter "%s": expected AXIS:COLUMN=REGEX' % xpfilter)
+        axis_filters.setdefault(int(axis) - 1, []).append((column, re.compile(regex)))
+    return axis_filters
+
+## rows of axis file fn matching all of its [(column, regex), ...] filters
+def filter_bindings(fn, filters):
+    for row in parse_bindings_list(fn):
+        if all(regex.search(row.get(column) or '') for (column, regex) in filters):
+            yield row
+
+## reads tabular files and lazily applies their N-ary cross-product: one row
+## per combination, first file varying slowest.  The first file is streamed;
+## later ones are held in memory, so memory grows with the sum of their
+## sizes rather than with the product.
+def parse_xp_files(fns, axis_filters={}):
+    first = filter_bindings(fns[0], axis_filters.get(0, []))
+    rest = [list(filter_bindings(fn, axis_filters.get(axis, []))) for (axis, fn) in enumerate(fns) if axis > 0]
+    for i in first:
+        for combo in itertools.product(*rest):
             m = i.copy()
-            m.update(j)
-            bindings_list.append(m)
-    return bindings_list
-
-## Returns an array of length N,
-## where N is the same length as the number of vars in the template object
-## [ [v1syn1, v1syn2, ...], ..., [vNsyn1, vNsyn2, ...]
-def get_synonym_combos(tobj, bindings, synmap, label):
-    lvars = tobj['vars']
+            for j in combo:
+                m.update(j)
+            yield m
+
+## Returns the ranked options for each template variable: its label first,
+## then its synmap synonyms ordered by source (sources listed in source_rank
+## first, in that order, others after in file order), dropping repeats
+def get_synonym_options(template, bindings, synmap, source_rank={}):
     vals = []
-    for v in lvars:
+    for (lk, v) in template.label_keys:
         syns = []
-        id = bindings[v]
-        lk = v+" label"
         if lk in bindings:
             syns.append(bindings[lk])
-        if id in synmap:
-            for s in synmap[id]:
-                syns.append(s['synonym'])
-        vals.append(syns)
-    combos = list(itertools.product(*vals))
-    textt = tobj['text']
+        entries = synmap.get(bindings[v], [])
+        entries = sorted(entries, key=lambda s: source_rank.get(s.get('source'), len(source_rank)))
+        syns.extend(s['synonym'] for s in entries)
+        seen = set()
+        options = []
+        for syn in syns:
+            if syn and normalize_text(syn) not in seen:
+                seen.add(normalize_text(syn))
+                options.append(syn)
+        vals.append(options)
+    return vals
+
+## Lazily yields index tuples into vals, best first: lowest total rank, then
+## earliest variable options.  Only as many combinations as are consumed are
+## ever made.
+def iter_ranked_combos(vals):
+    if not vals or not all(vals):
+        return
+    start = (0,) * len(vals)
+    heap = [(0, start)]
+    queued = {start}
+    while heap:
+        (rank, indexes) = heapq.heappop(heap)
+        yield tuple(vals[i][j] for (i, j) in enumerate(indexes))
+        for i in range(len(indexes)):
+            if indexes[i] + 1 < len(vals[i]):
+                successor = indexes[:i] + (indexes[i] + 1,) + indexes[i+1:]
+                if successor not in queued:
+                    queued.add(successor)
+                    heapq.heappush(heap, (rank + 1, successor))
+
+def normalize_text(text):
+    return ' '.join(text.casefold().split())
+
+## Returns the list of (property, synonym text) for the label template
+## filled with combinations of variable labels and synonyms, best ranked
+## first, other than label itself and texts differing only in case or
+## spacing.  At most limit texts are made (no limit if 0).
+def get_synonym_combos(template, bindings, synmap, label, limit=0, source_rank={}):
+    vals = get_synonym_options(template, bindings, synmap, source_rank)
+    seen = {normalize_text(label)}
     texts = []
-    for combo in combos:
-        text = format(textt % combo)
-        if text != label:
+    for combo in iter_ranked_combos(vals):
+        text = template.text % combo
+        if normalize_text(text) not in seen:
+            seen.add(normalize_text(text))
             texts.append( ('oio:hasRelatedSynonym', text) )
+            if len(texts) == limit:
+                break
     return texts
 
 
-def get_values(tobj, bindings, isLabel=False):
-    lvars = tobj['vars']
-    vals = []
-    for v in lvars:
-        varval = ""
-        if isLabel:
-            k = v+" label"
+class Template(object):
+    """
+    One text template of a pattern (name, def, an annotation or axiom),
+    compiled once: its format string, and for each variable the bindings
+    keys its IRI and label are read from.
+    """
+
+    def __init__(self, tobj):
+        self.text = tobj['text']
+        self.vars = list(tobj['vars'])
+        self.label_keys = [(v + " label", v) for v in self.vars]
+
+    def render(self, bindings):
+        return self.text % tuple(render_iri(bindings[v]) for v in self.vars)
+
+    def render_labels(self, bindings):
+        vals = []
+        for (k, v) in self.label_keys:
             varval = bindings[k] if k in bindings else bindings[v]
             if varval == None:
                 varval = bindings[v]
-        else:
-            varval = render_iri(bindings[v])
-        vals.append(varval)
-    return vals
-
-def apply_template(tobj, bindings, isLabel=False):
-    textt = tobj['text']
-    vals = get_values(tobj, bindings, isLabel)
-    text = format(textt % tuple(vals))
-    return text
+            vals.append(varval)
+        return self.text % tuple(vals)
+
+
+class Pattern(object):
+    """
+    A DOSDP pattern compiled for rendering many bindings: its templates, and
+    one regex replacing every 'quoted entity' of its classes and relations.
+    """
+
+    def __init__(self, tobj, suppress=(), annotate=False, max_synonyms=0, synonym_sources=()):
+        self.name = tobj['pattern_name']
+        self.vars = tobj['vars']
+        self.suppress = suppress
+        self.annotate = annotate
+        self.max_synonyms = max_synonyms
+        self.source_rank = {source: rank for (rank, source) in enumerate(synonym_sources)}
+
+        self.class_iri = Template(tobj['class_iri']) if 'class_iri' in tobj else None
+        self.label = Template(tobj['name']) if 'name' in tobj else None
+        self.definition = Template(tobj['def']) if 'def' in tobj else None
+        self.annotations = [(aobj['property'], Template(aobj)) for aobj in tobj.get('annotations', [])]
+        self.expressions = [(keyword, Template(tobj[key]))
+            for (key, keyword) in (('equivalentTo', 'EquivalentTo'), ('subClassOf', 'SubClassOf')) if key in tobj]
+        self.axioms = [Template(aobj) for aobj in tobj.get('axioms', [])]
+
+        # build map of quoted entity replacements
+        self.qm = {}
+        self.qm.update(tobj['classes'])
+        self.qm.update(tobj['relations'])
+        # Longest names first, so 'part of' isn't taken for 'part'
+        names = sorted(self.qm, key=len, reverse=True)
+        self.quoted = re.compile("'(" + '|'.join(map(re.escape, names)) + ")'") if names else None
+
+        self.internal_properties = {v: make_internal_annotation_property(tobj, v) for v in self.vars}
+
+    def replace_quoted_entities(self, text):
+        if self.quoted is None:
+            return text
+        return self.quoted.sub(lambda match: self.qm[match.group(1)], text)
+
+    def make_record(self, bindings):
+        """
+        Returns everything generated for one row of bindings, for a writer:
+        the class IRI, the filler classes [(iri, label)], the variable
+        bindings, the annotations and synonyms [(property, text)], and the
+        class expressions [(keyword, expression, comment)] and GCI axioms
+        [(axiom, comment)] with quoted entities replaced.
+        """
+        cls_iri = uuid_iri()
+        if self.class_iri:
+            cls_iri = self.class_iri.render(bindings)
+        if 'iri' in bindings:
+            cls_iri = bindings['iri']
 
-def apply_pattern(p, qm, bindings, cls_iri, args):
-    print("")
-    var_bindings = {}
-    for v in p['vars']:
-        if v not in bindings:
-            sys.stderr.write("variable "+v+" is specified in vars: but is not in bindings:\n")
-        iri = bindings[v]
-        var_bindings[v] = iri
-        vl = v + " label"
-        lbl = bindings[vl] if vl in bindings else ''
-        if not lbl:
-            lbl = iri
-        print('Class: %s ## %s' % (iri,lbl))
-
-    print("## "+str(json.dumps(var_bindings)))
-    
-    print('Class: %s' % render_iri(cls_iri))
-    label = ""
-    if 'name' in p:
-        tobj = p['name']
-        text = apply_template(tobj, bindings, True)
-        if 'label' not in args.suppress:
-            ##TODO
-            if 'iri label' in bindings and bindings['iri label']:
-                label = bindings['iri label']
-            else:
-                label = text
-            write_annotation('rdfs:label', label, bindings)
-    if 'def' in p:
-        tobj = p['def']
-        text = apply_template(tobj, bindings, True)
-        # todo: protect against special characters
-        write_annotation('IAO:0000115', text, bindings)
-    if 'annotations' in p:
-        tanns = p['annotations']
-        for tobj in tanns:
-            ap = tobj['property']
-            text = apply_template(tobj, bindings, True)
+        fillers = []
+        var_bindings = {}
+        for v in self.vars:
+            if v not in bindings:
+                sys.stderr.write("variable "+v+" is specified in vars: but is not in bindings:\n")
+            iri = bindings[v]
+            var_bindings[v] = iri
+            vl = v + " label"
+            lbl = bindings[vl] if vl in bindings else ''
+            if not lbl:
+                lbl = iri
+            fillers.append((iri, lbl))
+
+        annotations = []
+        label = ""
+        if self.label:
+            text = self.label.render_labels(bindings)
+            if 'label' not in self.suppress:
+                ##TODO
+                if 'iri label' in bindings and bindings['iri label']:
+                    label = bindings['iri label']
+                else:
+                    label = text
+                annotations.append(('rdfs:label', annotation_text('rdfs:label', label, bindings)))
+        if self.definition:
+            text = self.definition.render_labels(bindings)
             # todo: protect against special characters
-            write_annotation(ap, text, bindings)
-    if 'equivalentTo' in p:
-        tobj = p['equivalentTo']
-        expr_text = apply_template(tobj, bindings)
-        expr_cmt = apply_template(tobj, bindings,True).replace("\n", "")
-        expr_text = replace_quoted_entities(qm, expr_text)
-        print(' EquivalentTo: %s ## %s' % (expr_text,expr_cmt))
-    if 'subClassOf' in p:
-        tobj = p['subClassOf']
-        expr_text = apply_template(tobj, bindings)
-        expr_cmt = apply_template(tobj, bindings,True).replace("\n", "")
-        expr_text = replace_quoted_entities(qm, expr_text)
-        print(' SubClassOf: %s ## %s' % (expr_text,expr_cmt))
-    if 'axioms' in p:
-        for tobj in p['axioms']:
-            expr_text = apply_template(tobj, bindings)
-            expr_cmt = apply_template(tobj, bindings,True).replace("\n", "")
-            expr_text = replace_quoted_entities(qm, expr_text)
-            gcif.write(' %s ## %s\n' % (expr_text,expr_cmt))
-    if len(synmap.keys()) > 0:
-        if 'name' in p:
-            tobj = p['name']
-            texts = get_synonym_combos(tobj, bindings, synmap, label)
-            if len(texts) > 0:
-                print("  ## Auto-syns\n")
-                for (prop,text) in texts:
-                    write_annotation(prop, text, bindings)
-        
-    if args.annotate:
-        pn = p['pattern_name']
-    
-        print('  Annotations: %s "%s"' % (get_applies_pattern_property(), pn))
-        for (k,v) in var_bindings.items():
-            print('  Annotations: %s %s' % (make_internal_annotation_property(p, k), v))
+            annotations.append(('IAO:0000115', annotation_text('IAO:0000115', text, bindings)))
+        for (ap, template) in self.annotations:
+            text = template.render_labels(bindings)
+            # todo: protect against special characters
+            annotations.append((ap, annotation_text(ap, text, bindings)))
+
+        expressions = []
+        for (keyword, template) in self.expressions:
+            expr_text = self.replace_quoted_entities(template.render(bindings))
+            expr_cmt = template.render_labels(bindings).replace("\n", "")
+            expressions.append((keyword, expr_text, expr_cmt))
+        axioms = []
+        for template in self.axioms:
+            expr_text = self.replace_quoted_entities(template.render(bindings))
+            expr_cmt = template.render_labels(bindings).replace("\n", "")
+            axioms.append((expr_text, expr_cmt))
+
+        synonyms = []
+        if len(synmap.keys()) > 0:
+            if self.label:
+                texts = get_synonym_combos(self.label, bindings, synmap, label, self.max_synonyms, self.source_rank)
+                synonyms = [(prop, annotation_text(prop, text, bindings)) for (prop,text) in texts]
+
+        return {
+            'iri': cls_iri,
+            'fillers': fillers,
+            'var_bindings': var_bindings,
+            'annotations': annotations,
+            'expressions': expressions,
+            'axioms': axioms,
+            'synonyms': synonyms
+        }
 
 def get_applies_pattern_property():
     return 'DOSDP:applies-pattern'
@@ -298,7 +502,7 @@ def get_applies_pattern_property():
 def make_internal_annotation_property(p, s):
     return p['pattern_name'] + "/"+s
 
-def write_annotation(ap, text, bindings={}):
+def annotation_text(ap, text, bindings={}):
     if titlemode:
         toks = text.split(" ")
         toks[0] = toks[0].title()
@@ -308,21 +512,303 @@ def write_annotation(ap, text, bindings={}):
         if bindings[ap] != '':
             text = bindings[ap]
 
-    # todo: allow non-literal annotations
-    print(' Annotations: %s %s' % (ap,safe_quote(text)))
+    return text
 
 def safe_quote(text):
     text = text.replace("\n"," ").replace('"','\\"')
     return format('"%s"' % text)
 
-# Stolen from DOS' code
-def replace_quoted_entities(qm, text):
-    for k in qm:
-        v = qm[k]
-        text = re.sub("\'"+k+"\'", v, text)  # Suspect this not Pythonic. Could probably be done with a fancy map lambda combo.  
-    return text
 
 
+## Manchester syntax output, with the GCI axioms of each class for --gci
+class ManchesterWriter(object):
+
+    inline_axioms = False
+
+    def __init__(self, pattern, tobj, ontology_iri, base, prefixmap):
+        self.pattern = pattern
+        self.tobj = tobj
+        self.ontology_iri = ontology_iri
+        self.base = base
+        self.prefixmap = prefixmap
+
+    def header(self):
+        tobj = self.tobj
+        lines = []
+        lines.append('Prefix: : <%s>' % self.base)
+        lines.append('Prefix: IAO: <http://purl.obolibrary.org/obo/IAO_>')
+        lines.append('Prefix: DOSDP: <http://geneontology.org/foo/>')
+        lines.append('Prefix: oio: <http://www.geneontology.org/formats/oboInOwl#>')
+        for (pfx,uri) in self.prefixmap.items():
+            lines.append('Prefix: %s: <%s>' % (pfx,uri))
+        lines.append('')
+        lines.append(" ## Auto-generated")
+        lines.append('')
+        lines.append('Ontology: <%s>' % self.ontology_iri)
+        if 'imports' in tobj:
+            for uri in tobj['imports']:
+                lines.append('  Import: <%s>' % uri)
+        lines.append('AnnotationProperty: IAO:0000115')
+        for v in tobj['vars']:
+            lines.append('AnnotationProperty: %s' % make_internal_annotation_property(tobj, v))
+        lines.append('AnnotationProperty: %s' % get_applies_pattern_property())
+        lines.append('AnnotationProperty: oio:hasRelatedSynonym')
+        if 'annotations' in tobj:
+            for aobj in tobj['annotations']:
+                lines.append('AnnotationProperty: %s' % aobj['property'])
+        ##lines.append('AnnotationProperty: %s' % make_internal_annotation_property(tobj['pattern_name']))
+        for k in tobj['classes']:
+            lines.append('Class: %s ## %s' % (tobj['classes'][k],k))
+        for k in tobj['relations']:
+            lines.append('ObjectProperty: %s ## %s' % (tobj['relations'][k],k))
+        lines.append('## Auto-generated classes')
+        return '\n'.join(lines) + '\n'
+
+    def record(self, record):
+        lines = [""]
+        for (iri, lbl) in record['fillers']:
+            lines.append('Class: %s ## %s' % (iri,lbl))
+        lines.append("## "+str(json.dumps(record['var_bindings'])))
+        lines.append('Class: %s' % render_iri(record['iri']))
+        for (ap, text) in record['annotations']:
+            # todo: allow non-literal annotations
+            lines.append(' Annotations: %s %s' % (ap,safe_quote(text)))
+        for (keyword, expr_text, expr_cmt) in record['expressions']:
+            lines.append(' %s: %s ## %s' % (keyword,expr_text,expr_cmt))
+        if record['synonyms']:
+            lines.append("  ## Auto-syns\n")
+            for (prop, text) in record['synonyms']:
+                lines.append(' Annotations: %s %s' % (prop,safe_quote(text)))
+        if self.pattern.annotate:
+            lines.append('  Annotations: %s "%s"' % (get_applies_pattern_property(), self.pattern.name))
+            for (k,v) in record['var_bindings'].items():
+                lines.append('  Annotations: %s %s' % (self.pattern.internal_properties[k], v))
+
+        gci_text = ''.join(' %s ## %s\n' % (expr_text,expr_cmt) for (expr_text,expr_cmt) in record['axioms'])
+        return ('\n'.join(lines) + '\n', gci_text)
+
+    def footer(self):
+        return ''
+
+
+## Expands a Manchester entity name (CURIE, bare name or <IRI>) to an IRI.
+## Names without a known prefix are taken as OBO ids, e.g. FOODON:123 to
+## http://purl.obolibrary.org/obo/FOODON_123
+class Expander(object):
+
+    STANDARD_PREFIXES = {
+        'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+        'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+        'owl': 'http://www.w3.org/2002/07/owl#',
+        'xsd': 'http://www.w3.org/2001/XMLSchema#',
+        'IAO': 'http://purl.obolibrary.org/obo/IAO_',
+        'DOSDP': 'http://geneontology.org/foo/',
+        'oio': 'http://www.geneontology.org/formats/oboInOwl#'
+    }
+
+    def __init__(self, base, prefixmap):
+        self.prefixes = dict(self.STANDARD_PREFIXES)
+        self.prefixes.update(prefixmap)
+        self.prefixes[''] = base
+
+    def expand(self, name):
+        if name.startswith('<') and name.endswith('>'):
+            return name[1:-1]
+        if name.startswith("urn:") or name.startswith("http"):
+            return name
+        if ':' not in name:
+            return self.prefixes[''] + name
+        (prefix, local) = name.split(':', 1)
+        if prefix in self.prefixes:
+            return self.prefixes[prefix] + local
+        return 'http://purl.obolibrary.org/obo/' + prefix + '_' + local
+
+
+## OWL functional syntax output.  Entities are written as full IRIs,
+## including those of the GCI axioms (already functional syntax), which go
+## inline unless --gci is given.
+class FunctionalWriter(ManchesterWriter):
+
+    inline_axioms = True
+
+    NARY = {'and': 'ObjectIntersectionOf', 'or': 'ObjectUnionOf'}
+    RESTRICTIONS = {'some': 'ObjectSomeValuesFrom', 'only': 'ObjectAllValuesFrom'}
+    CARDINALITIES = {'min': 'ObjectMinCardinality', 'max': 'ObjectMaxCardinality', 'exactly': 'ObjectExactCardinality'}
+    # Literals and full IRIs, or else a CURIE (group 1) to expand
+    AXIOM_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|<[^>]*>|(?<![\w@])((?:[A-Za-z_][\w.-]*)?:[^\s()"<>]*)')
+
+    def __init__(self, pattern, tobj, ontology_iri, base, prefixmap):
+        ManchesterWriter.__init__(self, pattern, tobj, ontology_iri, base, prefixmap)
+        self.expander = Expander(base, prefixmap)
+
+    def iri(self, name):
+        return '<%s>' % self.expander.expand(name)
+
+    ## A Manchester syntax class expression parsed by util_rdfxml, with its
+    ## names expanded to IRIs
+    def class_expression(self, text):
+        return parse_class_expression(text, self.expander.expand)
+
+    def expression(self, node):
+        kind = node[0]
+        if kind == 'class':
+            return '<%s>' % node[1]
+        if kind in self.NARY:
+            return '%s(%s)' % (self.NARY[kind], ' '.join(self.expression(item) for item in node[1]))
+        if kind == 'not':
+            return 'ObjectComplementOf(%s)' % self.expression(node[1])
+        if kind in self.RESTRICTIONS:
+            return '%s(<%s> %s)' % (self.RESTRICTIONS[kind], node[1], self.expression(node[2]))
+        if kind == 'value':
+            return 'ObjectHasValue(<%s> <%s>)' % (node[1], node[2])
+        filler = ' ' + self.expression(node[3]) if node[3] else ''
+        return '%s(%d <%s>%s)' % (self.CARDINALITIES[kind], node[2], node[1], filler)
+
+    def literal(self, text):
+        return '"%s"' % text.replace('\\', '\\\\').replace('"', '\\"')
+
+    ## A functional syntax axiom with its CURIEs written as full IRIs
+    def axiom(self, text):
+        return self.AXIOM_TOKEN.sub(lambda match: self.iri(match.group(1)) if match.group(1) else match.group(), text)
+
+    def header(self):
+        tobj = self.tobj
+        lines = ['Prefix(:=<%s>)' % self.base]
+        for (pfx, uri) in self.prefixmap.items():
+            lines.append('Prefix(%s:=<%s>)' % (pfx, uri))
+        lines.append('')
+        lines.append('Ontology(<%s>' % self.ontology_iri)
+        for uri in tobj.get('imports', []):
+            lines.append('Import(<%s>)' % uri)
+        properties = ['IAO:0000115', get_applies_pattern_property(), 'oio:hasRelatedSynonym']
+        properties += [make_internal_annotation_property(tobj, v) for v in tobj['vars']]
+        properties += [aobj['property'] for aobj in tobj.get('annotations', [])]
+        for ap in properties:
+            lines.append('Declaration(AnnotationProperty(%s))' % self.iri(ap))
+        for k in tobj['classes']:
+            lines.append('Declaration(Class(%s))' % self.iri(tobj['classes'][k]))
+        for k in tobj['relations']:
+            lines.append('Declaration(ObjectProperty(%s))' % self.iri(tobj['relations'][k]))
+        return '\n'.join(lines) + '\n'
+
+    def record(self, record):
+        cls = self.iri(record['iri'])
+        lines = ['']
+        for (iri, lbl) in record['fillers']:
+            lines.append('Declaration(Class(%s))' % self.iri(iri))
+        lines.append('Declaration(Class(%s))' % cls)
+        for (ap, text) in record['annotations'] + record['synonyms']:
+            lines.append('AnnotationAssertion(%s %s %s)' % (self.iri(ap), cls, self.literal(text)))
+        for (keyword, expr_text, expr_cmt) in record['expressions']:
+            axiom = 'EquivalentClasses' if keyword == 'EquivalentTo' else 'SubClassOf'
+            lines.append('%s(%s %s)' % (axiom, cls, self.expression(self.class_expression(expr_text))))
+        if self.pattern.annotate:
+            lines.append('AnnotationAssertion(%s %s %s)' % (self.iri(get_applies_pattern_property()), cls, self.literal(self.pattern.name)))
+            for (k,v) in record['var_bindings'].items():
+                lines.append('AnnotationAssertion(%s %s %s)' % (self.iri(self.pattern.internal_properties[k]), cls, self.iri(v)))
+
+        gci_text = ''.join('%s\n' % self.axiom(expr_text) for (expr_text, expr_cmt) in record['axioms'])
+        return ('\n'.join(lines) + '\n', gci_text)
+
+    def footer(self):
+        return ')\n'
+
+
+## RDF/XML output laid out like the OWLAPI files FoodOn imports are made of
+## (see imports/langual/template_import_header.txt), so it can be placed in
+## imports/ directly.  GCI axioms still need --gci.
+class RdfXmlWriter(FunctionalWriter):
+
+    inline_axioms = False
+
+    NAMESPACES = [
+        ('rdf', 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'),
+        ('owl', 'http://www.w3.org/2002/07/owl#'),
+        ('oboInOwl', 'http://www.geneontology.org/formats/oboInOwl#'),
+        ('xml', 'http://www.w3.org/XML/1998/namespace'),
+        ('xsd', 'http://www.w3.org/2001/XMLSchema#'),
+        ('taxon', 'http://purl.obolibrary.org/obo/NCBITaxon#'),
+        ('rdfs', 'http://www.w3.org/2000/01/rdf-schema#'),
+        ('obo', 'http://purl.obolibrary.org/obo/'),
+        ('dc', 'http://purl.org/dc/elements/1.1/')
+    ]
+
+    def __init__(self, pattern, tobj, ontology_iri, base, prefixmap):
+        FunctionalWriter.__init__(self, pattern, tobj, ontology_iri, base, prefixmap)
+        self.namespaces = Namespaces(dict(self.NAMESPACES))
+
+        # Element names for every annotation property the pattern can write
+        self.properties = ['rdfs:label', 'IAO:0000115', get_applies_pattern_property(), 'oio:hasRelatedSynonym']
+        self.properties += [make_internal_annotation_property(tobj, v) for v in tobj['vars']]
+        self.properties += [aobj['property'] for aobj in tobj.get('annotations', [])]
+        self.qnames = {ap: self.namespaces.qname(self.expander.expand(ap)) for ap in self.properties}
+
+    def about(self, name):
+        return quoteattr(self.expander.expand(name))
+
+    def entity(self, element, name, content=()):
+        iri = self.expander.expand(name)
+        lines = []
+        if not content:
+            declaration(lines, element, iri)
+            return lines
+        lines += ['    <!-- %s -->' % escape(iri), '']
+        lines += ['    <%s rdf:about=%s>' % (element, quoteattr(iri))] + list(content) + ['    </%s>' % element]
+        return lines + ['    ', '', '']
+
+    def header(self):
+        tobj = self.tobj
+        lines = ['<?xml version="1.0"?>', '<!DOCTYPE rdf:RDF [']
+        for (prefix, uri) in self.NAMESPACES:
+            lines.append('    <!ENTITY %s "%s" >' % (prefix, uri))
+        lines += [']>', '', '']
+        lines.append('<rdf:RDF xmlns=%s' % quoteattr(self.ontology_iri + '#'))
+        lines.append('     xml:base=%s' % quoteattr(self.ontology_iri))
+        extra = sorted((prefix, uri) for (prefix, uri) in self.namespaces.used.items() if prefix not in dict(self.NAMESPACES))
+        lines += ['     xmlns:%s=%s' % (prefix, quoteattr(uri)) for (prefix, uri) in self.NAMESPACES + extra]
+        lines[-1] += '>'
+        lines += self.entity('owl:Ontology', self.ontology_iri,
+            ['        <owl:imports rdf:resource=%s/>' % quoteattr(uri) for uri in tobj.get('imports', [])])[2:]
+
+        lines += section('Annotation properties')
+        for ap in self.properties[1:]:
+            lines += self.entity('owl:AnnotationProperty', ap)
+        lines += section('Object Properties')
+        for k in tobj['relations']:
+            lines += self.entity('owl:ObjectProperty', tobj['relations'][k])
+        lines += section('Classes')
+        for k in tobj['classes']:
+            lines += self.entity('owl:Class', tobj['classes'][k])
+        return '\n'.join(lines) + '\n'
+
+    def record(self, record):
+        lines = []
+        for (iri, lbl) in record['fillers']:
+            lines += self.entity('owl:Class', iri)
+
+        content = []
+        for (keyword, expr_text, expr_cmt) in record['expressions']:
+            element = 'owl:equivalentClass' if keyword == 'EquivalentTo' else 'rdfs:subClassOf'
+            write_property(content, element, self.class_expression(expr_text), 8)
+        for (ap, text) in record['annotations'] + record['synonyms']:
+            content.append('        <%s>%s</%s>' % (self.qnames[ap], escape(text), self.qnames[ap]))
+        if self.pattern.annotate:
+            ap = self.qnames[get_applies_pattern_property()]
+            content.append('        <%s>%s</%s>' % (ap, escape(self.pattern.name), ap))
+            for (k,v) in record['var_bindings'].items():
+                ap = self.qnames[self.pattern.internal_properties[k]]
+                content.append('        <%s rdf:resource=%s/>' % (ap, self.about(v)))
+        lines += self.entity('owl:Class', record['iri'], content)
+
+        gci_text = ''.join(' %s ## %s\n' % (expr_text,expr_cmt) for (expr_text,expr_cmt) in record['axioms'])
+        return ('\n'.join(lines) + '\n', gci_text)
+
+    def footer(self):
+        return '</rdf:RDF>\n'
+
+
+WRITERS = {'omn': ManchesterWriter, 'ofn': FunctionalWriter, 'owl': RdfXmlWriter}
+
 
 if __name__ == "__main__":
     main()
@@ -29,28 +29,19 @@ OUTPUT:
 """
 
 
-with open('./ancestro_import.owl.txt', 'r') as handle:
-    ontology = handle.read()
-
-# Perform search and replace on all Ancestro geo ids to Gazetteer ids:
-with open('./ancestro_gaz_conversion.txt', 'r') as handle:
-	for line in handle:
-		(search, replace) = line.strip().split('\t') #tab delimited
-		searchURI = 'http://www.ebi.ac.uk/ancestro/' + search
-		replaceURI = 'http://purl.obolibrary.org/obo/' + replace 
-		ontology = ontology.replace( searchURI + '"', replaceURI + '"')
-
-		# Now make an alternate label IAO_00001118 out of all GAZ class rdfs:label tags.
-		# <rdfs:label rdf:datatype="http://www.w3.org/2001/XMLSchema#string">South-Eastern Asia</rdfs:label>
-		startClass = ontology.find('<owl:Class rdf:about="' + replaceURI)
-		#ontology = ontology[0:startClass] + ontology[startClass:].replace('rdfs:label','obo:IAO_0000118',2)
-		endClass = ontology.find('</owl:Class>', startClass)
-
-		# OR ELIMINATE All Ancestro labels, since they will be replaced with Gaz labels
-		startLabel = ontology.find('<rdfs:label', startClass)
-		if startLabel < endClass:
-			endLabel = ontology.find('</rdfs:label>', startLabel) + 13
-			ontology = ontology[0:startLabel] + ontology[endLabel:]
-
-with open('../ancestro_import.owl', 'w') as handle:
-    handle.write(ontology)
\ No newline at end of file
+import os
+import sys
+
+# Shared rewrite engine lives in src/ontology
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from util_id_remap import IdRemapper
+
+# All Ancestro geo ids are swapped for Gazetteer ids in one pass over the
+# file. All Ancestro labels of swapped classes are eliminated too, since they
+# will be replaced with Gaz labels.
+remapper = IdRemapper.from_table('./ancestro_gaz_conversion.txt',
+	'http://www.ebi.ac.uk/ancestro/', 'http://purl.obolibrary.org/obo/')
+
+counts = remapper.rewrite_file('./ancestro_import.owl.txt', '../ancestro_import.owl', strip_tags=['rdfs:label'])
+
+print ('Replaced', counts['replaced'], 'ancestro references, removed', counts['stripped'], 'labels.')
@@ -31,6 +31,10 @@ OUTPUT
     All references should just be to files in the /imports folder directly,
     so if using it, move output file up to /imports and rename.
 
+    The SIREN subset run also regenerates ../siren_augment.owl via the
+    adjust_siren.py augmentation stage, when ../siren_augment.owl.old.txt
+    is there to augment.
+
 **************************************************
 """
 import json
@@ -42,6 +46,8 @@ import re
 import time
 import requests
 
+from adjust_siren import augment_siren
+
 try: #Python 2.7
     from collections import OrderedDict
 except ImportError: # Python 2.6
@@ -91,11 +97,11 @@ class Langual(object):
         self.ontology_name = subsetName
         self.subsetIdStart = subsetIdStart # Slim entries start from here
 
-        print "Generating subset " + self.ontology_name
+        print ("Generating subset " + self.ontology_name)
 
         owl_output_rdf = ''
 
-        with (open(subsetInputFilePath, 'U')) as input_handle:
+        with (open(subsetInputFilePath, 'r')) as input_handle:
             for line in input_handle:
                 # Lines in input are :Database native id[tab]label[tab]LanguaL ids.
                 params = line.strip().split('\t')
@@ -114,7 +120,7 @@ class Langual(object):
                         entity['language'] = language
                         owl_output_rdf += self.subset_entry_render(entity)
 
-        print "Saving ../" + self.ontology_name + '_import.owl'
+        print ("Saving ../" + self.ontology_name + '_import.owl')
         
         self.save_subset_owl(owl_output_rdf)
 
@@ -135,7 +141,7 @@ class Langual(object):
 
             # Lookup existing LanguaL entity if any.
             if not (langual_id in self.database['index']):
-                print 'Unable to find id "' + langual_id + '" in LanguaL database.'
+                print ('Unable to find id "' + langual_id + '" in LanguaL database.')
                 continue
 
             refEntity = self.database['index'][langual_id]
@@ -148,7 +154,7 @@ class Langual(object):
             label = refEntity['label']['value'].lower()
             if refEntity['status'] == 'deprecated':
                 if refEntity['database_id'][0] == 'H' and label[-6:] == ' added' and label[0:-6] in self.label_reverse_lookup:
-                    print "Replaced secondary ingredient with ", label[0:-6]
+                    print ("Replaced secondary ingredient with ", label[0:-6])
                     refEntity = self.label_reverse_lookup[ label[0:-6] ]
                 # These are junky parts of conjunction
                 elif label[0:3] == 'no ' or label[-10:] == ' not known' or label[-14:] == 'not applicable': 
@@ -379,6 +385,13 @@ if __name__ == '__main__':
     # See http://www.langual.org/langual_indexed_datasets.asp for list of indexed food databases
     # A version of the SIREN food index has been done and moved to imports folder
     foodstruct.__main__('subset_siren', './DBFSIREN.TXT', 3300000, 'en') #F1000 - F17788 
+    # Then regenerate ../siren_augment.owl labels and comments for it, from
+    # ../siren_augment.owl.old.txt if there is one.
+    augment_source = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'siren_augment.owl.old.txt')
+    if os.path.exists(augment_source):
+        augment_siren()
+    else:
+        sys.stderr.write("Skipping siren_augment.owl: no %s\n" % os.path.normpath(augment_source))
 
     # Main LanguaL import facet terms occupy FoodOn ids in range 3,400,000 -> 3,420,000
 
@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+test_util_term_service.py
+Project: FoodOn
+
+Run from the src/ontology/ folder:
+
+    python -m unittest test_util_term_service
+"""
+
+import http.client
+import json
+import threading
+import unittest
+from http.server import ThreadingHTTPServer
+
+from util_term_service import TermRequestHandler, TermService
+
+IRI = 'http://purl.obolibrary.org/obo/FOODON_03304344'
+
+
+class Labels(object):
+
+    def __len__(self):
+        return 1
+
+    def get_label(self, iri):
+        return 'tempura batter' if iri == IRI else None
+
+    def get_iris(self, label):
+        return [IRI] if label.casefold() == 'tempura batter' else []
+
+
+class Matcher(object):
+
+    phrases = []
+
+    def match(self, text, limit):
+        return []
+
+
+class TermServiceTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        TermRequestHandler.service = TermService(Labels(), Matcher(), {IRI: ['http://purl.obolibrary.org/obo/FOODON_00001002']})
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), TermRequestHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def post(self, path, request):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.server_address[1])
+        connection.request('POST', path, json.dumps(request), {'Content-Type': 'application/json'})
+        response = connection.getresponse()
+        content = json.loads(response.read().decode('utf-8'))
+        connection.close()
+        return (response.status, content)
+
+    def test_lookups(self):
+        self.assertEqual(self.post('/labels', {'iris': [IRI]}), (200, {IRI: 'tempura batter'}))
+        self.assertEqual(self.post('/iris', {'labels': ['Tempura Batter']}), (200, {'Tempura Batter': [IRI]}))
+
+    def test_non_string_items(self):
+        for (path, request) in [('/iris', {'labels': [None]}), ('/labels', {'iris': [5]}),
+            ('/ancestors', {'iris': [['x']]}), ('/match', {'texts': [{}]}), ('/labels', {'iris': IRI}),
+            ('/labels', [IRI])]:
+            (status, content) = self.post(path, request)
+            self.assertEqual(status, 400, request)
+            self.assertIn('error', content)
+
+    def test_missing_field(self):
+        (status, content) = self.post('/labels', {'labels': [IRI]})
+        self.assertEqual(status, 400)
+        self.assertIn('iris', content['error'])
+
+
+if __name__ == '__main__':
+    unittest.main()
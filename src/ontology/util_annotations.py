@@ -0,0 +1,94 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_annotations.py
+Project: FoodOn
+
+Streaming scan of annotation values (labels, synonyms, ...) on the named
+entities of an OWL RDF/XML file.  Only one top level entity is held in memory
+at a time, so even the largest import files scan in bounded memory.
+
+    for (iri, prop, text, language) in iter_annotations('imports/general_import.owl', SYNONYMS):
+        ...
+
+Properties are given as ElementTree '{namespace}name' tags; the common ones
+are defined below.  iter_subclass_edges() scans asserted named superclasses
+the same way.
+"""
+
+import xml.etree.ElementTree as ET
+
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+RDFS = '{http://www.w3.org/2000/01/rdf-schema#}'
+OWL = '{http://www.w3.org/2002/07/owl#}'
+OBO_IN_OWL = '{http://www.geneontology.org/formats/oboInOwl#}'
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+
+LABEL = RDFS + 'label'
+SUBCLASS_OF = RDFS + 'subClassOf'
+EQUIVALENT_CLASS = OWL + 'equivalentClass'
+EXACT_SYNONYM = OBO_IN_OWL + 'hasExactSynonym'
+NARROW_SYNONYM = OBO_IN_OWL + 'hasNarrowSynonym'
+SYNONYMS = (EXACT_SYNONYM, NARROW_SYNONYM)
+
+
+def iter_entities(path):
+    """
+    Generator of the complete top level elements of path that have an
+    rdf:about, as (IRI, element).  Each element is discarded once the
+    generator moves on, so take what is needed from it right away.
+    """
+    depth = 0
+    root = None
+
+    for (event, elem) in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+        if depth != 1:
+            continue
+
+        # elem is a complete top level entity, e.g. owl:Class
+        iri = elem.get(RDF + 'about')
+        if iri:
+            yield (iri, elem)
+
+        # Done with it: drop it to keep memory bounded.
+        root.clear()
+
+
+def iter_annotations(path, properties=(LABEL,)):
+    """
+    Generator of (IRI, property, text, language) for every literal value of
+    properties directly on a top level entity with an rdf:about.  language
+    is '' when the value has no xml:lang.
+    """
+    properties = frozenset(properties)
+    for (iri, elem) in iter_entities(path):
+        for child in elem:
+            if child.tag in properties and child.text and child.get(RDF + 'resource') is None:
+                yield (iri, child.tag, child.text, child.get(XML_LANG, ''))
+
+
+def iter_subclass_edges(path, intersections=False):
+    """
+    Generator of (IRI, parent IRI) for every asserted rdfs:subClassOf a named
+    class.  With intersections, also for each named class in an
+    owl:intersectionOf the entity is a subclass or equivalent of, e.g.
+    'food' in "cheese EquivalentTo food and (has ingredient some milk)".
+    """
+    for (iri, elem) in iter_entities(path):
+        for child in elem:
+            if child.tag == SUBCLASS_OF and child.get(RDF + 'resource'):
+                yield (iri, child.get(RDF + 'resource'))
+            elif intersections and child.tag in (SUBCLASS_OF, EQUIVALENT_CLASS):
+                for members in child.iterfind('*/' + OWL + 'intersectionOf'):
+                    for member in members:
+                        parent = member.get(RDF + 'about')
+                        if parent and parent != iri:
+                            yield (iri, parent)
@@ -0,0 +1,524 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_build.py
+Project: FoodOn
+
+Build orchestrator for the FoodOn pipeline.  Each step below is rebuilt only
+when the content of its inputs or outputs, or its commands, differ from what
+they were when it last succeeded; timestamps don't matter, so touching or
+re-saving a file unchanged rebuilds nothing.  Independent steps run in
+parallel.  Run from the src/ontology/ folder (the Makefile's "all" and
+import targets call it):
+
+    python util_build.py                   # every step
+    python util_build.py merge labels      # these steps and the steps they come after
+    python util_build.py --dry-run         # show what would run
+    python util_build.py --list
+
+Steps, in pipeline order:
+
+    langual           imports/langual/langual.py: LanguaL import and OntoFox specs
+    subsets           imports/langual_subsets/subset.py: SIREN subset and siren_augment.owl
+    ontofox_<name>    imports/<name>_import.owl from its _ontofox.txt, by
+                      util_ontofox.py if imports/sources/ has its source
+                      ontologies, otherwise from the OntoFox service
+    robot_templates   util_robot_template.py: imports/robot_*.owl
+    obsoletion        util_obsoletion_update.py on foodon-edit.owl
+    merge             foodon.owl and foodon-merged.owl
+    labels            util_label_extract.py: foodon-labels.tsv and .idx
+    closure           util_subclass_closure.py: foodon-closure.idx
+
+Build state, including the file digests, is kept in .build_state.json.
+Files are only re-hashed when their size or modification time changes, so a
+run with nothing to do finishes in a fraction of a second.  A step missing
+one of its inputs (e.g. the LanguaL XML, which isn't in the repository) is
+skipped, and steps after it go ahead with the files already present; steps
+after a failed step are not run.
+
+ROBOT commands a step runs on the same ontology are chained into one ROBOT
+invocation (see RobotChain), so the JVM starts and foodon-edit.owl and its
+imports are parsed once per step rather than once per command.  ROBOT is
+bin/robot when its robot.jar is present, otherwise robot on the PATH; set
+ROBOT to use another.  Each step reports how long it and each of its
+commands took, and --list shows the times of the last successful run.
+
+Outputs of the labels step feed robot_templates and subsets on the next run;
+since steps compare content, that loop settles as soon as the labels stop
+changing.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import hashlib
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from util_labels import ONTOLOGY_DIR
+from util_ontofox import SpecError, parse_spec, source_path
+from util_rdfxml import atomic_write
+
+STATE_PATH = os.path.join(ONTOLOGY_DIR, '.build_state.json')
+STATE_VERSION = 1
+
+OBO = 'http://purl.obolibrary.org/obo'
+BASE = OBO + '/foodon'
+
+# Command placeholders, filled in when a step runs.  They aren't part of a
+# step's key, so e.g. a new {date} alone doesn't make a step out of date.
+TOOLS = {
+    'python': sys.executable,
+    'python2': 'python2', # langual.py is still Python 2
+    'robot': os.environ.get('ROBOT') or (os.path.join(ONTOLOGY_DIR, 'bin', 'robot')
+        if os.path.exists(os.path.join(ONTOLOGY_DIR, 'bin', 'robot.jar')) else 'robot'),
+    'curl': 'curl'
+}
+
+IMPORTS = ['chebi', 'envo', 'gaz', 'general', 'ncbitaxon']
+
+ROBOT_TEMPLATES = ['wine', 'pasta', 'fdc', 'organismal_materials', 'process']
+ROBOT_OUTPUTS = ['imports/robot_wine.owl', 'imports/robot_pasta.owl', 'imports/robot_fdc.owl',
+    'imports/robot_organismal_materials.owl', 'imports/robot_process_import.owl']
+
+
+class RobotChain(object):
+    """
+    ROBOT commands run in one JVM, each on the ontology the one before it
+    left in memory, e.g.
+
+        RobotChain(['reduce', '-i', 'in.owl'], ['annotate', ..., '-o', 'out.owl'])
+
+    Only the first command takes an --input; any may write an --output.
+    """
+
+    def __init__(self, *commands):
+        self.commands = commands
+        self.__name__ = 'robot ' + ' '.join(command[0] for command in commands)
+
+    def argv(self):
+        return ['{robot}'] + [argument for command in self.commands for argument in command]
+
+
+class Step(object):
+    """
+    One node of the pipeline.  Paths are relative to ONTOLOGY_DIR; inputs
+    may be glob patterns.  commands are run in order in cwd; each is an
+    argument list with {placeholders}, a RobotChain, or a function given
+    the Step.
+    after names the steps that must finish first.
+    """
+
+    def __init__(self, name, inputs, outputs, commands, after=(), cwd='.'):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.commands = commands
+        self.after = after
+        self.cwd = cwd
+
+    def key(self):
+        """
+        Digest of the step's definition: its commands, cwd and file lists.
+        """
+        commands = [command if isinstance(command, list) else
+            command.argv() if isinstance(command, RobotChain) else command.__name__ for command in self.commands]
+        definition = [STATE_VERSION, self.cwd, self.inputs, self.outputs, commands]
+        return hashlib.sha256(json.dumps(definition).encode('utf-8')).hexdigest()
+
+    def input_paths(self):
+        """
+        Return (existing input paths, missing input paths).
+        """
+        found = []
+        missing = []
+        for pattern in self.inputs:
+            if glob.has_magic(pattern):
+                found.extend(sorted(glob.glob(os.path.join(ONTOLOGY_DIR, pattern))))
+            elif os.path.exists(os.path.join(ONTOLOGY_DIR, pattern)):
+                found.append(os.path.join(ONTOLOGY_DIR, pattern))
+            else:
+                missing.append(pattern)
+        return (found, missing)
+
+    def output_paths(self):
+        return [os.path.join(ONTOLOGY_DIR, output) for output in self.outputs]
+
+
+def comment_annotation_properties(step):
+    """
+    Comment out the annotation property declarations OntoFox adds to an
+    import; they belong in ontology-metadata.owl and bfo.owl.  (OWLAPI
+    misparses one line comments, so this runs after "robot reduce".)
+    """
+    # Lines already commented out are left alone.
+    rules = [(re.compile(r'(?<!<!-- )<owl:AnnotationProperty[^>]*/>'), r'<!-- \g<0> -->'),
+        (re.compile(r'</owl:AnnotationProperty>(?! -->)'), r'\g<0> -->'),
+        (re.compile(r'(?<!<!-- )<owl:AnnotationProperty[^>]*">'), r'<!-- \g<0>')]
+    for output_path in step.output_paths():
+        rewrite_lines(output_path, rules)
+
+
+def comment_imports(step):
+    """
+    Comment out the owl:imports of foodon-merged.owl, which contains them.
+    """
+    rewrite_lines(os.path.join(ONTOLOGY_DIR, 'foodon-merged.owl'),
+        [(re.compile(r'<owl:imports[^>]*/>'), r'<!-- \g<0> -->')])
+
+
+def rewrite_lines(file_path, rules):
+    # As sed 's/.../.../;' applies them: the first match of each rule per line.
+    with open(file_path, 'r', encoding='utf-8') as handle:
+        lines = handle.readlines()
+    with atomic_write(file_path, encoding='utf-8') as handle:
+        for line in lines:
+            for (pattern, replacement) in rules:
+                line = pattern.sub(replacement, line, count=1)
+            handle.write(line)
+
+
+def ontofox_sources(spec):
+    """
+    The local source ontologies util_ontofox.py needs for spec, or None if
+    any of them isn't in imports/sources/.
+    """
+    try:
+        sections = parse_spec(os.path.join(ONTOLOGY_DIR, spec)).sections
+    except (OSError, SpecError):
+        return None
+    paths = sorted({source_path(section.source, {}) for section in sections})
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    return [os.path.relpath(path, ONTOLOGY_DIR) for path in paths]
+
+
+def ontofox_step(name):
+    """
+    An import is extracted offline by util_ontofox.py when all its source
+    ontologies are in imports/sources/, otherwise fetched from OntoFox.
+    """
+    spec = 'imports/%s_ontofox.txt' % name
+    output = 'imports/%s_import.owl' % name
+    sources = ontofox_sources(spec)
+    if sources:
+        inputs = [spec, 'util_ontofox.py', 'util_rdfxml.py'] + sources
+        fetch = ['{python}', 'util_ontofox.py', spec]
+    else:
+        inputs = [spec]
+        fetch = ['{curl}', '-s', '-f', '-F', 'file=@' + spec, '-o', output, 'http://ontofox.hegroup.org/service.php']
+    return Step('ontofox_' + name, inputs, [output], [
+        fetch,
+        RobotChain(['reduce', '-i', output, '-r', 'ELK', '-o', output]),
+        comment_annotation_properties
+    ], after=['langual'])
+
+
+STEPS = [
+    Step('langual',
+        ['imports/langual/langual.py', 'imports/langual/langual2017.xml', 'imports/langual/database.json',
+         'imports/langual/lookup.txt', 'imports/langual/template_*.txt'],
+        ['imports/langual_import.owl', 'imports/langual/database.json', 'imports/ncbitaxon_ontofox.txt',
+         'imports/chebi_ontofox.txt', 'imports/gaz_ontofox.txt', 'imports/uberon_ontofox.txt'],
+        [['{python2}', 'langual.py']], cwd='imports/langual'),
+
+    Step('subsets',
+        ['imports/langual_subsets/subset.py', 'imports/langual_subsets/adjust_siren.py',
+         'imports/langual_subsets/DBFSIREN.TXT', 'imports/langual_subsets/template_import_header.txt',
+         'imports/langual/database.json', 'imports/langual/langual_facet_a.json',
+         'imports/siren_labels.txt', 'imports/siren_augment.owl.old.txt', 'foodon-labels.tsv', 'util_labels.py'],
+        ['imports/langual_subsets/subset_siren_import.owl.txt', 'imports/siren_augment.owl'],
+        [['{python}', 'subset.py']], after=['langual'], cwd='imports/langual_subsets')
+
+] + [ontofox_step(name) for name in IMPORTS] + [
+
+    Step('robot_templates',
+        ['util_robot_template.py', 'util_labels.py', 'util_annotations.py', 'util_rdfxml.py', 'foodon-labels.tsv',
+         'foodon-edit.owl'] + ['imports/robot/%s.tsv' % name for name in ROBOT_TEMPLATES]
+         + ['imports/%s_import.owl' % name for name in IMPORTS],
+        ROBOT_OUTPUTS,
+        [['{python}', 'util_robot_template.py', '-i', 'foodon-edit.owl'] + ['imports/%s_import.owl' % name for name in IMPORTS]],
+        after=['obsoletion'] + ['ontofox_' + name for name in IMPORTS]),
+
+    Step('obsoletion',
+        ['util_obsoletion_update.py', 'util_rdfxml.py', 'imports/deprecation_import.owl', 'foodon-edit.owl'],
+        ['foodon-edit.owl'],
+        [['{python}', 'util_obsoletion_update.py', '-d', 'imports/deprecation_import.owl', '-t', 'foodon-edit.owl']],
+        after=['langual']),
+
+    Step('merge',
+        ['foodon-edit.owl', 'catalog-v001.xml', 'imports/*.owl'],
+        ['foodon.owl', 'foodon-merged.owl'],
+        [RobotChain(['reduce', '-i', 'foodon-edit.owl', '-r', 'ELK'],
+            ['annotate', '--xml-entities', '-V', BASE + '/releases/{date}/foodon.owl',
+             '--typed-annotation', 'http://purl.org/dc/terms/date', '{date}', 'xsd:date', '-o', 'foodon.owl'],
+            ['merge', '--xml-entities', '--output', 'foodon-merged.owl']),
+         comment_imports],
+        after=['subsets', 'robot_templates', 'obsoletion'] + ['ontofox_' + name for name in IMPORTS]),
+
+    # Read from foodon.owl and its imports rather than queried from
+    # foodon-merged.owl by ROBOT.
+    Step('labels',
+        ['foodon.owl', 'catalog-v001.xml', 'imports/*.owl', 'util_label_extract.py', 'util_labels.py',
+         'util_annotations.py'],
+        ['foodon-labels.tsv', 'foodon-labels.idx'],
+        [['{python}', 'util_label_extract.py']],
+        after=['merge']),
+
+    Step('closure',
+        ['foodon-merged.owl', 'util_subclass_closure.py', 'util_annotations.py'],
+        ['foodon-closure.idx'],
+        [['{python}', 'util_subclass_closure.py', '--rebuild', '-i', 'foodon-merged.owl']],
+        after=['merge'])
+]
+
+
+class FileDigests(object):
+    """
+    sha256 digests of files, cached by (size, modification time) in the
+    build state so unchanged files aren't read.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache # relative path -> [size, mtime_ns, digest]
+
+    def digest(self, file_path):
+        relative = os.path.relpath(file_path, ONTOLOGY_DIR)
+        status = os.stat(file_path)
+        cached = self.cache.get(relative)
+        if cached and cached[0] == status.st_size and cached[1] == status.st_mtime_ns:
+            return cached[2]
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as handle:
+            for block in iter(lambda: handle.read(1 << 20), b''):
+                digest.update(block)
+        self.cache[relative] = [status.st_size, status.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def snapshot(self, file_paths):
+        return {os.path.relpath(file_path, ONTOLOGY_DIR): self.digest(file_path) if os.path.exists(file_path) else None
+            for file_path in file_paths}
+
+
+#
+# State file: {
+#   "version": 1,
+#   "files": {path: [size, mtime_ns, digest], ...},
+#   "steps": {name: {"key": Step.key(), "files": {input or output path: digest},
+#       "times": [[command, seconds], ...]}}
+# }
+# A step's "files" and "times" are taken right after it last succeeded.
+#
+def load_state(state_path):
+    if state_path and os.path.exists(state_path):
+        with open(state_path, 'r') as handle:
+            state = json.load(handle)
+        if state.get('version') == STATE_VERSION:
+            return state
+    return {'version': STATE_VERSION, 'files': {}, 'steps': {}}
+
+
+def save_state(state_path, state):
+    with atomic_write(state_path) as handle:
+        json.dump(state, handle, indent=1, sort_keys=True)
+
+
+def select_steps(names):
+    """
+    Return the steps named, plus every step they come after, in STEPS order.
+    """
+    by_name = {step.name: step for step in STEPS}
+    for name in names:
+        if name not in by_name:
+            sys.exit('Unknown step: ' + name + ' (see --list)')
+
+    selected = set()
+    pending = list(names or by_name)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.add(name)
+            pending.extend(by_name[name].after)
+    return [step for step in STEPS if step.name in selected]
+
+
+def run_step(step, placeholders):
+    """
+    Run a step's commands.  Returns (step, error message or None, output,
+    [(command name, seconds), ...]).
+    """
+    output = []
+    times = []
+    cwd = os.path.join(ONTOLOGY_DIR, step.cwd)
+    for command in step.commands:
+        start = time.perf_counter()
+        if not isinstance(command, (list, RobotChain)):
+            try:
+                command(step)
+            except (OSError, ValueError) as e:
+                return (step, '%s: %s' % (command.__name__, e), ''.join(output), times)
+            times.append((command.__name__, time.perf_counter() - start))
+            continue
+
+        argv = command.argv() if isinstance(command, RobotChain) else command
+        argv = [argument.format(**placeholders) for argument in argv]
+        try:
+            result = subprocess.run(argv, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                universal_newlines=True)
+        except OSError as e:
+            return (step, '%s: %s' % (argv[0], e), ''.join(output), times)
+        output.append(result.stdout)
+        times.append((command_name(command), time.perf_counter() - start))
+        if result.returncode:
+            return (step, '"%s" exited with %d' % (' '.join(argv), result.returncode), ''.join(output), times)
+
+    for output_path in step.output_paths():
+        if not os.path.exists(output_path):
+            return (step, 'did not make ' + os.path.relpath(output_path, ONTOLOGY_DIR), ''.join(output), times)
+    return (step, None, ''.join(output), times)
+
+
+def command_name(command):
+    """
+    Short name of a command for timings, e.g. "python util_labels.py".
+    """
+    if isinstance(command, RobotChain):
+        return command.__name__
+    scripts = [argument for argument in command[1:] if argument.endswith('.py')]
+    return ' '.join([command[0].strip('{}')] + scripts[:1])
+
+
+def format_times(times):
+    total = sum(seconds for (name, seconds) in times)
+    return '%.1fs (%s)' % (total, ', '.join('%s %.1fs' % (name, seconds) for (name, seconds) in times))
+
+
+def build(steps, state, jobs=None, dry_run=False, force=False, verbose=False):
+    """
+    Bring steps up to date, running those whose dependencies are done in
+    parallel.  Returns the number of steps that failed.
+    """
+    digests = FileDigests(state['files'])
+    placeholders = dict(TOOLS, date=datetime.date.today().isoformat())
+    names = {step.name for step in steps}
+
+    done = set()      # succeeded, up to date or skipped
+    blocked = set()   # failed, or after a failed step
+    waiting = list(steps)
+    running = {}
+    failures = 0
+
+    def check(step):
+        """
+        Return 'run', 'current' or a reason to skip.
+        """
+        (inputs, missing) = step.input_paths()
+        if missing:
+            return 'missing ' + ', '.join(missing)
+        recorded = state['steps'].get(step.name)
+        if force or not recorded or recorded['key'] != step.key():
+            return 'run'
+        if digests.snapshot(inputs + step.output_paths()) != recorded['files']:
+            return 'run'
+        return 'current'
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        while waiting or running:
+            remaining = len(waiting)
+            for step in list(waiting):
+                after = [name for name in step.after if name in names]
+                if any(name in blocked for name in after):
+                    waiting.remove(step)
+                    blocked.add(step.name)
+                    print('Not running', step.name + ': a step it comes after failed.')
+                    continue
+                if not all(name in done for name in after):
+                    continue
+
+                waiting.remove(step)
+                status = check(step)
+                if status == 'current':
+                    done.add(step.name)
+                    if verbose:
+                        print('Up to date:', step.name)
+                elif status != 'run':
+                    done.add(step.name)
+                    print('Skipping', step.name + ':', status)
+                elif dry_run:
+                    done.add(step.name)
+                    print('Would run', step.name)
+                else:
+                    print('Running', step.name)
+                    running[executor.submit(run_step, step, placeholders)] = step
+
+            if not running:
+                if len(waiting) == remaining:
+                    raise ValueError('Steps wait on each other: ' + ', '.join(step.name for step in waiting))
+                continue
+
+            finished = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)[0]
+            for future in finished:
+                del running[future]
+                (step, error, output, times) = future.result()
+                if verbose or error:
+                    sys.stdout.write(output)
+                if error:
+                    failures += 1
+                    blocked.add(step.name)
+                    print('Failed', step.name, 'after', format_times(times) + ':', error)
+                    continue
+
+                done.add(step.name)
+                inputs = step.input_paths()[0]
+                state['steps'][step.name] = {'key': step.key(), 'files': digests.snapshot(inputs + step.output_paths()),
+                    'times': times}
+                print('Built', step.name, 'in', format_times(times))
+
+    return failures
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Rebuild the FoodOn pipeline steps whose inputs changed.')
+    parser.add_argument('steps', nargs='*',
+        help='Steps to bring up to date, with the steps they come after (default: all)')
+    parser.add_argument('-j', '--jobs', type=int, required=False,
+        help='Steps run in parallel (default: one per CPU)')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+        help='Show which steps would run, without running them')
+    parser.add_argument('-B', '--force', action='store_true',
+        help='Run the steps even if they are up to date')
+    parser.add_argument('-l', '--list', action='store_true',
+        help='List the steps, with how long each last took to build, and exit')
+    parser.add_argument('-v', '--verbose', action='store_true',
+        help='Show command output and up to date steps')
+    parser.add_argument('-s', '--state', type=str, required=False, default=STATE_PATH,
+        help='Build state file (default: .build_state.json)')
+    args = parser.parse_args()
+
+    state = load_state(args.state)
+    if args.list:
+        for step in STEPS:
+            times = state['steps'].get(step.name, {}).get('times')
+            print(step.name + (' (after ' + ', '.join(step.after) + ')' if step.after else '')
+                + (': last built in ' + format_times(times) if times else ''))
+        return
+
+    try:
+        failures = build(select_steps(args.steps), state, args.jobs, args.dry_run, args.force, args.verbose)
+    finally:
+        if not args.dry_run:
+            save_state(args.state, state)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
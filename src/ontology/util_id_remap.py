@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_id_remap.py
+Project: FoodOn
+
+A reusable single-pass IRI rewriting engine for OWL RDF/XML files in the
+imports tree.  All search -> replace IRI pairs are compiled into one
+alternation regex, so a file is rewritten in one streaming pass no matter
+how many rows the lookup table has.  Optionally, annotation tags (e.g.
+rdfs:label) can be dropped from the owl:Class blocks of rewritten terms, as
+gaz_conversion.py does so that gazetteer labels take over from ancestro ones.
+
+Usage as a library:
+
+    remapper = IdRemapper.from_table('ancestro_gaz_conversion.txt',
+        'http://www.ebi.ac.uk/ancestro/', 'http://purl.obolibrary.org/obo/')
+    remapper.rewrite_file('ancestro_import.owl.txt', '../ancestro_import.owl',
+        strip_tags=['rdfs:label'])
+
+Usage from the command line:
+
+    python util_id_remap.py [lookup table] [input .owl] [output .owl] \
+        [search prefix] [replace prefix]
+
+The lookup table is tab delimited: [search id]\t[replacement id].  When an
+id appears more than once as a search term, the first row wins.
+"""
+
+import re
+import sys
+import io
+
+# Matches an owl:Class start or end tag; group 1 is rdf:about if present, and
+# group 2 is "/" for self-closing tags.
+CLASS_TAG = re.compile(r'<owl:Class(?:\s+rdf:about="([^"]*)")?[^>]*?(/?)>|</owl:Class>')
+
+
+class IdRemapper(object):
+
+    def __init__(self, mapping, terminator='"'):
+        """
+        mapping: dictionary of search IRI -> replacement IRI.
+        terminator: text that must follow a search IRI for it to match.  The
+        default '"' restricts matches to complete attribute values, so that
+        e.g. ancestro_01 doesn't match inside ancestro_0122.
+        """
+        self.mapping = mapping
+        self.targets = set(mapping.values())
+        self.counts = {'replaced': 0, 'stripped': 0}
+
+        # Longest first so that no key shadows a longer key it prefixes.
+        keys = sorted(mapping, key=len, reverse=True)
+        if keys:
+            self.pattern = re.compile('(' + '|'.join(map(re.escape, keys)) + ')' + '(?=' + re.escape(terminator) + ')')
+        else:
+            self.pattern = None
+
+
+    @classmethod
+    def from_table(cls, table_path, search_prefix='', replace_prefix='', terminator='"'):
+        """
+        Load a tab delimited [search id]\t[replacement id] lookup table.
+        """
+        mapping = {}
+        with open(table_path, 'r') as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                (search, replace) = line.split('\t')
+                search = search_prefix + search
+                if search not in mapping:
+                    mapping[search] = replace_prefix + replace
+
+        return cls(mapping, terminator)
+
+
+    def _substitute(self, match):
+        self.counts['replaced'] += 1
+        return self.mapping[match.group(1)]
+
+
+    def rewrite(self, text):
+        """
+        Replace all search IRIs in a string.
+        """
+        if self.pattern is None:
+            return text
+        return self.pattern.sub(self._substitute, text)
+
+
+    def rewrite_lines(self, lines, strip_tags=()):
+        """
+        Generator yielding rewritten lines.  If strip_tags is given, direct
+        child tags with those names are dropped from any top level owl:Class
+        whose (rewritten) rdf:about is a replacement IRI.  A stripped tag may
+        span several lines.
+        """
+        strip_starts = tuple('<' + tag for tag in strip_tags)
+        strip_ends = tuple('</' + tag + '>' for tag in strip_tags)
+
+        depth = 0         # owl:Class nesting depth
+        stripping = False # inside a rewritten class that needs tags dropped
+        skipping = None   # end tag of the multi-line tag being dropped
+
+        for line in lines:
+            line = self.rewrite(line)
+
+            if skipping:
+                if skipping in line:
+                    skipping = None
+                continue
+
+            if stripping and depth == 1:
+                content = line.lstrip()
+                if content.startswith(strip_starts):
+                    self.counts['stripped'] += 1
+                    if not content.rstrip().endswith('/>'):
+                        end_tag = strip_ends[[content.startswith(start) for start in strip_starts].index(True)]
+                        if end_tag not in line:
+                            skipping = end_tag
+                    continue
+
+            if strip_starts:
+                for match in CLASS_TAG.finditer(line):
+                    if match.group(0).startswith('</'):
+                        depth -= 1
+                        if depth == 0:
+                            stripping = False
+                    elif not match.group(2):
+                        depth += 1
+                        if depth == 1:
+                            stripping = match.group(1) in self.targets
+
+            yield line
+
+
+    def rewrite_file(self, input_path, output_path, strip_tags=()):
+        """
+        Stream input_path through rewrite_lines() into output_path.
+        """
+        with open(input_path, 'r') as input_handle:
+            with io.open(output_path, 'w', buffering=1 << 20) as output_handle:
+                output_handle.writelines(self.rewrite_lines(input_handle, strip_tags))
+
+        return self.counts
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) < 4:
+        sys.exit('Help Info:\n util_id_remap.py [lookup table] [input .owl] [output .owl] [search prefix] [replace prefix]')
+
+    search_prefix = sys.argv[4] if len(sys.argv) > 4 else ''
+    replace_prefix = sys.argv[5] if len(sys.argv) > 5 else ''
+
+    remapper = IdRemapper.from_table(sys.argv[1], search_prefix, replace_prefix)
+    counts = remapper.rewrite_file(sys.argv[2], sys.argv[3])
+    print ('Replaced', counts['replaced'], 'IRI references.')
@@ -0,0 +1,214 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_label_extract.py
+Project: FoodOn
+
+Writes foodon-labels.tsv, and its foodon-labels.idx index (see
+util_labels.py), straight from the RDF/XML of foodon.owl and the files it
+imports, in place of
+
+    robot query --format TSV --input foodon-merged.owl -s owl_get_labels.sparql foodon-labels.tsv
+
+which loads the whole merged ontology into a triple store to answer
+"?subject rdfs:label ?label".  Run from the src/ontology/ folder:
+
+    python util_label_extract.py                     # foodon.owl and its imports
+    python util_label_extract.py -s foodon-synonyms.tsv
+    python util_label_extract.py foodon-edit.owl imports/chebi_import.owl --no-imports -o /tmp/labels.tsv
+
+owl:imports are followed as ROBOT follows them: through catalog-v001.xml,
+or failing that to imports/ by file name.  Imports with no local file are
+reported and skipped.  Each file is scanned by its own worker process with
+util_annotations.iter_entities(), so only one entity per file is in memory
+at a time.
+
+The TSV is written as ROBOT writes it, e.g.
+
+    <http://purl.obolibrary.org/obo/FOODON_03304344>	"tempura batter"@en
+    <http://purl.obolibrary.org/obo/NCBITaxon_37176>	"Ovibos moschatus"^^<http://www.w3.org/2001/XMLSchema#string>
+    <http://purl.obolibrary.org/obo/ENVO_01000417>	"house"
+
+(an explicit rdf:datatype is kept, and a label with neither language nor
+datatype is written bare), with each distinct label once, in file order.
+Labels of blank nodes, which util_labels.py skips anyway, aren't written.
+With -s, synonyms (the SYNONYM_PROPERTIES below) go to a second TSV of
+subject, property and literal.  The index is written beside the TSV, e.g.
+/tmp/labels.idx for -o /tmp/labels.tsv, so only a foodon-labels.tsv run
+replaces foodon-labels.idx.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+from util_annotations import LABEL, OBO_IN_OWL, OWL, RDF, SYNONYMS, XML_LANG, iter_entities
+from util_labels import INDEX_PATH, LABELS_PATH, ONTOLOGY_DIR, build_label_index
+from util_rdfxml import atomic_write
+
+DEFAULT_INPUT = os.path.join(ONTOLOGY_DIR, 'foodon.owl')
+CATALOG_PATH = os.path.join(ONTOLOGY_DIR, 'catalog-v001.xml')
+CATALOG = '{urn:oasis:names:tc:entity:xmlns:xml:catalog}'
+
+SYNONYM_PROPERTIES = SYNONYMS + (OBO_IN_OWL + 'hasSynonym', '{http://purl.obolibrary.org/obo/}IAO_0000118')
+
+# As Jena escapes TSV literals.
+LITERAL_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r', '\t': '\\t'})
+
+
+def read_catalog(catalog_path=CATALOG_PATH):
+    """
+    Return {ontology IRI: local file path} from a Protege / ROBOT XML catalog.
+    """
+    folder = os.path.dirname(os.path.abspath(catalog_path))
+    locations = {}
+    for elem in ET.parse(catalog_path).iter(CATALOG + 'uri'):
+        name = elem.get('name', '')
+        location = os.path.join(folder, elem.get('uri'))
+        if name.startswith('duplicate:'):
+            locations.setdefault(name[len('duplicate:'):], location)
+        else:
+            locations[name] = location
+    return locations
+
+
+def ontology_imports(path):
+    """
+    The IRIs path's owl:Ontology header imports.
+    """
+    for (iri, elem) in iter_entities(path):
+        if elem.tag == OWL + 'Ontology':
+            return [child.get(RDF + 'resource') for child in elem.iterfind(OWL + 'imports')]
+    return []
+
+
+def import_closure(input_paths, catalog):
+    """
+    input_paths and, in breadth first order, the local files of everything
+    they import.  Returns (paths, [unresolved import IRI, ...]).
+    """
+    paths = []
+    missing = []
+    pending = [os.path.abspath(path) for path in input_paths]
+    while pending:
+        path = pending.pop(0)
+        if path in paths:
+            continue
+        paths.append(path)
+        for iri in ontology_imports(path):
+            location = catalog.get(iri) or os.path.join(ONTOLOGY_DIR, 'imports', iri.rstrip('/').rpartition('/')[2])
+            if os.path.exists(location):
+                pending.append(os.path.abspath(location))
+            elif iri not in missing:
+                missing.append(iri)
+    return (paths, missing)
+
+
+def format_literal(text, language, datatype):
+    """
+    text as a TSV literal: tagged with its language or explicit rdf:datatype
+    if it has one, otherwise bare.
+    """
+    literal = '"' + text.translate(LITERAL_ESCAPES) + '"'
+    if language:
+        return literal + '@' + language
+    if datatype:
+        return literal + '^^<' + datatype + '>'
+    return literal
+
+
+def scan_file(job):
+    """
+    Read one (file path, with synonyms) job's labels.  Returns (file path,
+    [(IRI, label, language, datatype), ...], [(IRI, property IRI, text,
+    language, datatype), ...]).
+    """
+    (path, with_synonyms) = job
+    synonym_properties = frozenset(SYNONYM_PROPERTIES if with_synonyms else ())
+    labels = []
+    synonyms = []
+    for (iri, elem) in iter_entities(path):
+        for child in elem:
+            if child.text is None or child.get(RDF + 'resource') is not None:
+                continue
+            if child.tag == LABEL:
+                labels.append((iri, child.text, child.get(XML_LANG, ''), child.get(RDF + 'datatype')))
+            elif child.tag in synonym_properties:
+                synonyms.append((iri, child.tag[1:].replace('}', '', 1), child.text,
+                    child.get(XML_LANG, ''), child.get(RDF + 'datatype')))
+    return (path, labels, synonyms)
+
+
+def write_tsv(path, header, rows):
+    with atomic_write(path, encoding='utf-8') as handle:
+        handle.write(header + '\n')
+        for row in rows:
+            handle.write('\t'.join(row) + '\n')
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Write foodon-labels.tsv and its index from OWL files, without ROBOT.')
+    parser.add_argument('inputs', nargs='*',
+        help='Ontology files (default: foodon.owl)')
+    parser.add_argument('-o', '--output', type=str, required=False, default=LABELS_PATH,
+        help='Labels TSV file (default: foodon-labels.tsv)')
+    parser.add_argument('-x', '--index', type=str, required=False,
+        help='Label index file, or "" for none (default: the output file with an .idx extension)')
+    parser.add_argument('-s', '--synonyms', type=str, required=False,
+        help='Also write synonyms to this TSV file')
+    parser.add_argument('-c', '--catalog', type=str, required=False, default=CATALOG_PATH,
+        help='XML catalog locating imported ontologies (default: catalog-v001.xml)')
+    parser.add_argument('--no-imports', action='store_true',
+        help='Read only the given files, not what they import')
+    parser.add_argument('-j', '--jobs', type=int, required=False,
+        help='Files read in parallel (default: one per CPU)')
+    args = parser.parse_args()
+
+    if args.index is None:
+        if os.path.abspath(args.output) == os.path.abspath(LABELS_PATH):
+            args.index = INDEX_PATH
+        else:
+            args.index = os.path.splitext(args.output)[0] + '.idx'
+
+    input_paths = args.inputs or [DEFAULT_INPUT]
+    for path in input_paths:
+        if not os.path.exists(path):
+            sys.exit('Unable to locate ontology file: ' + path)
+
+    if args.no_imports:
+        file_paths = [os.path.abspath(path) for path in input_paths]
+    else:
+        catalog = read_catalog(args.catalog) if os.path.exists(args.catalog) else {}
+        (file_paths, missing) = import_closure(input_paths, catalog)
+        for iri in missing:
+            print('Skipped import with no local file:', iri, file=sys.stderr)
+
+    label_rows = {}   # (IRI, label, language, datatype) -> None, in order
+    synonym_rows = {}
+    with multiprocessing.Pool(min(args.jobs or multiprocessing.cpu_count(), len(file_paths))) as pool:
+        # imap rather than imap_unordered, so the TSV is in file order.
+        for (path, labels, synonyms) in pool.imap(scan_file, [(path, bool(args.synonyms)) for path in file_paths]):
+            print('Read', os.path.relpath(path) + ':', len(labels), 'labels' + (', %d synonyms' % len(synonyms) if args.synonyms else '') + '.')
+            label_rows.update(dict.fromkeys(labels))
+            synonym_rows.update(dict.fromkeys(synonyms))
+
+    write_tsv(args.output, '?subject\t?label', (('<' + iri + '>', format_literal(label, language, datatype))
+        for (iri, label, language, datatype) in label_rows))
+    print('Wrote', len(label_rows), 'labels from', len(file_paths), 'files to', args.output)
+
+    if args.synonyms:
+        write_tsv(args.synonyms, '?subject\t?property\t?synonym', (('<' + iri + '>', '<' + prop + '>',
+            format_literal(text, language, datatype)) for (iri, prop, text, language, datatype) in synonym_rows))
+        print('Wrote', len(synonym_rows), 'synonyms to', args.synonyms)
+
+    if args.index:
+        build_label_index(((iri, label, language) for (iri, label, language, datatype) in label_rows), args.index)
+        print('Indexed them into', args.index)
+
+
+if __name__ == '__main__':
+    main()
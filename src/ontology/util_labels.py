@@ -0,0 +1,311 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_labels.py
+Project: FoodOn
+
+Shared IRI <-> label index built from foodon-labels.tsv, as written by
+util_label_extract.py, or by
+
+    robot query --format TSV --input foodon-merged.owl -s owl_get_labels.sparql foodon-labels.tsv
+
+Each TSV line is "<IRI>\t[SPARQL literal]", e.g.
+
+    <http://purl.obolibrary.org/obo/FOODON_03304344>	"tempura batter"@en
+
+Blank node subjects are skipped.  The TSV is compiled once into a compact
+binary file, foodon-labels.idx, which scripts memory-map rather than parse:
+
+    from util_labels import open_label_index
+    index = open_label_index()
+    index.get_label('http://purl.obolibrary.org/obo/FOODON_03304344')
+    index.get_iris('tempura batter')
+
+open_label_index() rebuilds the .idx file whenever the TSV is newer.  It can
+also be built directly with:
+
+    python util_labels.py [foodon-labels.tsv] [foodon-labels.idx]
+
+Index file layout; every number is a native-order unsigned 32 bit integer:
+
+    header          MAGIC, byte order mark, FORMAT_VERSION, iri count,
+                    string count, entry count
+    string_offsets  string count + 1 offsets into string data
+    entry_start     iri count + 1; entries of IRI i are entry_start[i] ..
+                    entry_start[i+1] - 1
+    entry_label     string id of each entry's label
+    entry_lang      string id of each entry's language tag ('' if none)
+    entry_iri       IRI id of each entry
+    label_order     entry ids sorted by casefolded label
+    string data     UTF-8 bytes of all interned strings
+
+Strings are interned.  IRIs are string ids 0 .. iri count - 1, sorted by
+their UTF-8 bytes, so an IRI's id is found by binary search.
+"""
+
+import array
+import mmap
+import os
+import re
+import sys
+
+from util_rdfxml import atomic_write
+
+ONTOLOGY_DIR = os.path.dirname(os.path.abspath(__file__))
+LABELS_PATH = os.path.join(ONTOLOGY_DIR, 'foodon-labels.tsv')
+INDEX_PATH = os.path.join(ONTOLOGY_DIR, 'foodon-labels.idx')
+
+MAGIC = b'FOODONLX'
+BYTE_ORDER_MARK = 0x01020304
+FORMAT_VERSION = 1
+HEADER_INTS = 6 # after MAGIC
+
+# "label"@lang or "label"^^<datatype> or plain "label".
+LITERAL = re.compile(r'^"((?:[^"\\]|\\.)*)"(?:@([A-Za-z0-9-]+)|\^\^<[^>]*>)?$')
+ESCAPE = re.compile(r'\\(.)')
+
+_index_cache = {}
+
+
+def parse_literal(literal):
+    """
+    Return (text, language) for a SPARQL TSV literal; language is '' when the
+    literal has none.  Anything that isn't a quoted literal is returned as is.
+    """
+    match = LITERAL.match(literal)
+    if not match:
+        return (literal, '')
+    return (ESCAPE.sub(r'\1', match.group(1)), match.group(2) or '')
+
+
+def read_labels(path=LABELS_PATH):
+    """
+    Generator of (IRI, label, language) tuples from a labels TSV file.
+    """
+    with open(path, 'r', encoding='utf-8') as handle:
+        for line in handle:
+            if line[0] != '<':
+                continue # Header, blank node or empty line
+            (subject, _, literal) = line.rstrip('\n').partition('\t')
+            (label, language) = parse_literal(literal)
+            yield (subject[1:-1], label, language)
+
+
+def build_label_index(labels, index_path=INDEX_PATH):
+    """
+    Write an index file from an iterable of (IRI, label, language) tuples.
+    Repeated (IRI, label, language) tuples are stored once; otherwise an IRI's
+    labels keep their input order.
+    """
+    by_iri = {}
+    for (iri, label, language) in labels:
+        entries = by_iri.setdefault(iri, [])
+        if (label, language) not in entries:
+            entries.append((label, language))
+
+    iris = sorted(by_iri, key=lambda iri: iri.encode('utf-8'))
+
+    # Intern strings: IRIs first, in sorted order, then labels and languages.
+    string_ids = {iri: i for (i, iri) in enumerate(iris)}
+    strings = list(iris)
+    def intern(text):
+        if text not in string_ids:
+            string_ids[text] = len(strings)
+            strings.append(text)
+        return string_ids[text]
+
+    entry_start = array.array('I', [0])
+    entry_label = array.array('I')
+    entry_lang = array.array('I')
+    entry_iri = array.array('I')
+    for (iri_id, iri) in enumerate(iris):
+        for (label, language) in by_iri[iri]:
+            entry_label.append(intern(label))
+            entry_lang.append(intern(language))
+            entry_iri.append(iri_id)
+        entry_start.append(len(entry_label))
+
+    label_order = array.array('I', sorted(range(len(entry_label)),
+        key=lambda entry: (strings[entry_label[entry]].casefold(), entry)))
+
+    string_offsets = array.array('I', [0])
+    data = bytearray()
+    for text in strings:
+        data += text.encode('utf-8')
+        string_offsets.append(len(data))
+
+    header = array.array('I', [BYTE_ORDER_MARK, FORMAT_VERSION, len(iris), len(strings), len(entry_label), 0])
+
+    # Write to a temporary file of its own first, so readers never map a
+    # partial index and concurrent builders don't write into one file.
+    with atomic_write(index_path, 'wb') as handle:
+        handle.write(MAGIC)
+        for table in (header, string_offsets, entry_start, entry_label, entry_lang, entry_iri, label_order):
+            table.tofile(handle)
+        handle.write(data)
+
+
+class LabelIndex(object):
+    """
+    Read-only, memory-mapped view of an index file.  Lookups decode only the
+    strings they touch.
+    """
+
+    def __init__(self, index_path):
+        self.path = index_path
+        with open(index_path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[0:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a FoodOn label index: ' + index_path)
+
+        ints = memoryview(self._map)[len(MAGIC):].cast('B')
+        size = (len(ints) // 4) * 4
+        ints = ints[:size].cast('I')
+        (bom, version, self.iri_count, string_count, entry_count, _) = ints[0:HEADER_INTS]
+        if bom != BYTE_ORDER_MARK or version != FORMAT_VERSION:
+            raise ValueError('Incompatible FoodOn label index (rebuild it): ' + index_path)
+
+        position = HEADER_INTS
+        def table(length):
+            nonlocal position
+            view = ints[position: position + length]
+            position += length
+            return view
+
+        self._string_offsets = table(string_count + 1)
+        self._entry_start = table(self.iri_count + 1)
+        self._entry_label = table(entry_count)
+        self._entry_lang = table(entry_count)
+        self._entry_iri = table(entry_count)
+        self._label_order = table(entry_count)
+        self._data_start = len(MAGIC) + position * 4
+
+
+    def close(self):
+        for name in ('_string_offsets', '_entry_start', '_entry_label', '_entry_lang', '_entry_iri', '_label_order'):
+            getattr(self, name).release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _bytes(self, string_id):
+        start = self._data_start + self._string_offsets[string_id]
+        return self._map[start: self._data_start + self._string_offsets[string_id + 1]]
+
+    def _string(self, string_id):
+        return self._bytes(string_id).decode('utf-8')
+
+
+    def iri_id(self, iri):
+        """
+        Return the interned id of iri, or None if it has no labels.
+        """
+        key = iri.encode('utf-8')
+        low = 0
+        high = self.iri_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.iri_count and self._bytes(low) == key:
+            return low
+        return None
+
+
+    def __len__(self):
+        return self.iri_count
+
+    def __contains__(self, iri):
+        return self.iri_id(iri) is not None
+
+    def __getitem__(self, iri):
+        label = self.get_label(iri)
+        if label is None:
+            raise KeyError(iri)
+        return label
+
+    def __iter__(self):
+        for iri_id in range(self.iri_count):
+            yield self._string(iri_id)
+
+
+    def get_labels(self, iri):
+        """
+        Return [(label, language), ...] for iri, in TSV order.
+        """
+        iri_id = self.iri_id(iri)
+        if iri_id is None:
+            return []
+        return [(self._string(self._entry_label[entry]), self._string(self._entry_lang[entry]))
+            for entry in range(self._entry_start[iri_id], self._entry_start[iri_id + 1])]
+
+
+    def get_label(self, iri, language='en'):
+        """
+        Return iri's first label in language, else its first label of any
+        language, else None.
+        """
+        labels = self.get_labels(iri)
+        for (label, label_language) in labels:
+            if label_language == language:
+                return label
+        return labels[0][0] if labels else None
+
+
+    def get_iris(self, label):
+        """
+        Return IRIs having label, matched case insensitively.
+        """
+        key = label.casefold()
+        order = self._label_order
+        low = 0
+        high = len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self._string(self._entry_label[order[middle]]).casefold() < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        iris = []
+        while low < len(order) and self._string(self._entry_label[order[low]]).casefold() == key:
+            iri = self._string(self._entry_iri[order[low]])
+            if iri not in iris:
+                iris.append(iri)
+            low += 1
+        return iris
+
+
+def open_label_index(index_path=INDEX_PATH, labels_path=LABELS_PATH):
+    """
+    Return a shared LabelIndex for index_path, first (re)building it from
+    labels_path if it is missing or older than the TSV.
+    """
+    index_path = os.path.abspath(index_path)
+    if os.path.exists(labels_path) and (not os.path.exists(index_path)
+        or os.path.getmtime(index_path) < os.path.getmtime(labels_path)):
+        build_label_index(read_labels(labels_path), index_path)
+
+    key = (index_path, os.path.getmtime(index_path))
+    if key not in _index_cache:
+        _index_cache[key] = LabelIndex(index_path)
+
+    return _index_cache[key]
+
+
+if __name__ == '__main__':
+
+    labels_path = sys.argv[1] if len(sys.argv) > 1 else LABELS_PATH
+    index_path = sys.argv[2] if len(sys.argv) > 2 else INDEX_PATH
+
+    build_label_index(read_labels(labels_path), index_path)
+    print ('Indexed', labels_path, 'into', index_path)
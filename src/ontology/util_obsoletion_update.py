@@ -7,6 +7,13 @@
 # with the new "replaced by" (IAO:0100001) term, and saves result.
 # 
 # This file can be run repeatedly to keep up to date on deprecations.
+# Replacement chains (A replaced by B, B replaced by C) are resolved up front
+# so A references go straight to C in a single pass; replacement cycles are
+# reported and left alone.
+#
+# The target file is streamed through util_rdfxml.py, which rewrites only the
+# changed rdf:resource values and leaves every other byte as it was, so no
+# "robot reduce" pass is needed afterwards to restore Protege formatting.
 #
 # Command line parameters:
 # argv[0]: path to deprecated terms .owl file.
@@ -16,118 +23,272 @@
 # python util_obsoletion_update.py imports/deprecation_import.owl foodon-edit.owl
 # python util_obsoletion_update.py imports/deprecation_import.owl imports/foodon_product_import.owl
 #
+# Batch mode reads any number of deprecation files once and updates any number
+# of target files in parallel processes:
+#
+# python util_obsoletion_update.py \
+#   -d imports/deprecation_import.owl imports/langual_deprecated_import.owl \
+#   -t foodon-edit.owl imports/foodon_product_import.owl [-j 4]
+#
+# Runs are incremental: a state file (--state, default .obsoletion_state.json)
+# records a digest of each deprecation file and of each target as last
+# written, along with the replacements already propagated into it.  A later
+# run only parses deprecation files that changed, skips targets that are
+# unchanged and fully up to date, and applies only new replacements to
+# targets that haven't been edited since.  Use --full to ignore the state.
+#
 
 
 
-# For CRUD see https://stackabuse.com/reading-and-writing-xml-files-in-python/
-import xml.etree.ElementTree as ET
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
 import sys
 from os import path
-import os
 
-if len(sys.argv) < 2:
-	sys.exit('Help Info:\n util_obsoletion_update.py [deprecated term .owl file path] [path of ontology to update rdf:resource links in]')
-
-deprecated_file_path = sys.argv[1];
-input_file_path = sys.argv[2];
-output_file_path = sys.argv[2];
-
-if not path.exists(deprecated_file_path):
-	sys.exit('Unable to locate deprecated ontology term file: ' + deprecated_file_path);
-
-if not path.exists(input_file_path):
-	sys.exit('Unable to locate ontology update file: ' + input_file_path);
+from util_rdfxml import atomic_write, iter_nodes, rewrite_file
 
+#
+# Returns dictionary of deprecated class iri -> "replaced by" (IAO:0100001) iri
+# for all deprecated classes in deprecated_file_path that have a replacement.
+#
+def get_replacements(deprecated_file_path):
 
-# Had to dig for this code to re-establish namespace from given XML file:
-# Have to fetch existing file's dictionary of prefix:uri namespaces
-namespace = dict([
-    node for (_, node) in ET.iterparse(input_file_path, events=['start-ns'])
-]);
-for prefix in namespace:
-	ET.register_namespace(prefix, namespace[prefix]);
+	replaced_by = {}
+	# Look in all deprecated .owl file classes that have a replacement iri,
+	for deprecated_cursor in iter_nodes(deprecated_file_path):
+		if not deprecated_cursor.is_a('owl:Class'):
+			continue
 
+		# Find any that are mentioned to be deprecated (not bothering with boolean value).
+		if deprecated_cursor.find('owl:deprecated') is None:
+			continue
+
+		# Term replaced by IRI
+		# Note that sometimes an "X or Y ..." disjunction term can have two or
+		# more replacement axioms. Not sure whats best for that case.
+		owl_replacement = deprecated_cursor.find('obo:IAO_0100001')
+		if owl_replacement is not None:
+			# Almost all deprecations have only one replacement
+			about = deprecated_cursor.get('rdf:about')
+			if owl_replacement.text:
+				replaced_by[about] = owl_replacement.text.strip()
+			else:
+				replaced_by[about] = owl_replacement.get('rdf:resource')
 
-deprecations = ET.parse(deprecated_file_path);
-deprecation_root = deprecations.getroot();
+	return replaced_by
 
-tree = ET.parse(input_file_path);
-root = tree.getroot();
+#
+# Resolve replacement chains A -> B -> C into their transitive closure A -> C,
+# B -> C with a union-find style "find" that compresses each walked path onto
+# its final (non-deprecated) replacement, so every iri is walked only once.
+# Returns (resolved, chains, cycles):
+#  resolved: deprecated iri -> final replacement iri, or None if it leads into a cycle.
+#  chains: [[A, B, C], ...] for each walked path of two or more hops; when a
+#    path joins one resolved earlier, only the joining iri and final one are listed.
+#  cycles: [[A, B], ...] for each replacement cycle A -> B -> A found.
+#
+def resolve_replacements(replaced_by):
+
+	resolved = {}
+	chains = []
+	cycles = []
+
+	for start in replaced_by:
+		if start in resolved:
+			continue
+
+		path = []
+		on_path = set()
+		node = start
+		while node in replaced_by and node not in resolved and node not in on_path:
+			path.append(node)
+			on_path.add(node)
+			node = replaced_by[node]
+
+		if node in on_path:
+			cycles.append(path[path.index(node):])
+			final = None
+		elif node in resolved:
+			# Path joins one already compressed: node is deprecated too.
+			final = resolved[node]
+			if final:
+				chains.append(path + [node, final])
+		else:
+			final = node
+			if len(path) > 1:
+				chains.append(path + [final])
+
+		# Path compression
+		for iri in path:
+			resolved[iri] = final
+
+	return (resolved, chains, cycles)
 
-print ("Using deprecated terms from:", deprecated_file_path)
-print ("Updating ontology:", input_file_path)
+#
+# Rewrite each rdf:resource reference to a deprecated iri in input_file_path
+# with its final replacement, streaming the result to output_file_path.
+# Returns count of references updated.
+#
+def update_references(input_file_path, output_file_path, resolved):
 
-# For working with ElementTree attributes, it seems we need to use this format of namespace:
-ns = {
-	'owl':  '{http://www.w3.org/2002/07/owl#}',
-	'rdfs': '{http://www.w3.org/2000/01/rdf-schema#}',
-	'rdf':  '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}',
-	'obo':  '{http://purl.obolibrary.org/obo/}'
-}
+	count = 0
+	def update(node):
+		nonlocal count
+		for tag in node.iter_tags():
+			target = tag.get('rdf:resource')
+			if target is not None and resolved.get(target):
+				tag.set('rdf:resource', resolved[target])
+				count += 1
+		return node
 
-change = True;
-any_output = False;
-while change:
+	rewrite_file(input_file_path, output_file_path, update)
+	return count
 
-	rdf_resource_lookup = {};
-	# Create index on all rdf:resource tags
-	# Issue: search string is a bit odd because it looks for all children with // 
-	# but adds * children because error generated if you don't mention a tag name.
-	#
-	for tag in root.findall('.//*[@rdf:resource]', namespace):
 
-		# Somehow some tags are matching above, but tag.attrib doesn't work, esp.
-		# with "someValuesFrom" tags?
-		try: 
-			target = tag.attrib['{rdf}resource'.format(**ns)];
-			if target in rdf_resource_lookup:
-				rdf_resource_lookup[target].push(tag)
-			else:
-				rdf_resource_lookup[target] = [tag];
-			#print ("adding", target)
-		except:
-			continue;
+STATE_VERSION = 1
 
-	change = False;
-	count = 0;
+def file_digest(file_path):
+	digest = hashlib.sha256()
+	with open(file_path, 'rb') as handle:
+		for block in iter(lambda: handle.read(1 << 20), b''):
+			digest.update(block)
+	return digest.hexdigest()
 
-	# Look in all deprecated .owl file classes that have a replacement iri,
-	for deprecated_cursor in deprecation_root.findall('owl:Class', namespace):
-		about = deprecated_cursor.attrib['{rdf}about'.format(**ns)];
+def replacements_digest(resolved):
+	return hashlib.sha256(json.dumps(sorted(resolved.items())).encode('utf-8')).hexdigest()
 
-		# Find any that are mentioned to be deprecated (not bothering with boolean value).
-		for owl_deprecated in deprecated_cursor.findall('owl:deprecated', namespace):
-			# Term replaced by IRI
-			# Note that sometimes an "X or Y ..." disjunction term can have two or
-			# more replacement axioms. Not sure whats best for that case.
-
-			owl_replacements = deprecated_cursor.findall('obo:IAO_0100001', namespace);
-			if owl_replacements:
-				# Almost all deprecations have only one replacement
-				if owl_replacements[0].text:
-					replaced_iri = owl_replacements[0].text;
-				else:	
-					replaced_iri = owl_replacements[0].attrib['{rdf}resource'.format(**ns)]
-
-				if (about in rdf_resource_lookup):
-					# Look in target ontology for resource iri to replace
-					for tag in rdf_resource_lookup[about]:
-						# Replace existing rdf:resource tag:
-						tag.attrib.pop('{rdf}resource'.format(**ns), None)
-						tag.set('rdf:resource', replaced_iri);
-						#print ('Updated', about, 'to', replaced_iri);
-						change = True;
-						any_output = True;
-						count += 1;
-
-	print ('Updated', count , 'rdf:resource references.');
-
-if (any_output):
-	tree.write(output_file_path, xml_declaration=True, encoding='utf-8', method="xml");
-	# This reestablishes OWL-API comments etc. as though saved by protege, to cut down on git diff.
-	cmd = f'robot reduce -i {output_file_path} -r ELK -o {output_file_path}'; # Note no --xml-entities
-	print (cmd)
-	os.system(cmd)
+#
+# State file: {
+#   "version": 1,
+#   "sources": {deprecation file path: digest, ...},
+#   "resolved": digest of the replacements resolved from those sources,
+#   "targets": {target path: {"digest": file digest, "replacements": digest}},
+#   "replacements": {digest: {deprecated iri: final replacement iri}, ...}
+# }
+# Replacement maps are stored once per digest, since targets usually share one.
+#
+def load_state(state_path):
+	if state_path and path.exists(state_path):
+		with open(state_path, 'r') as handle:
+			state = json.load(handle)
+		if state.get('version') == STATE_VERSION:
+			return state
+	return {'version': STATE_VERSION, 'sources': {}, 'resolved': None, 'targets': {}, 'replacements': {}}
+
+def save_state(state_path, state):
+	# Drop replacement maps no longer referenced.
+	used = {target['replacements'] for target in state['targets'].values()}
+	used.add(state['resolved'])
+	state['replacements'] = {key: value for (key, value) in state['replacements'].items() if key in used}
+
+	with atomic_write(state_path) as handle:
+		json.dump(state, handle, indent=1, sort_keys=True)
+
+
+def _update_target(task):
+	(target_path, replacements) = task
+	return (target_path, update_references(target_path, target_path, replacements), file_digest(target_path))
+
+
+def main():
+
+	parser = argparse.ArgumentParser(description='Replace references to deprecated terms with their "replaced by" terms.')
+	parser.add_argument('files', nargs='*',
+		help='[deprecated term .owl file path] [path of ontology to update rdf:resource links in] ...')
+	parser.add_argument('-d', '--deprecated', nargs='+', required=False, default=[],
+		help='Deprecated term .owl files; the first to give a term a replacement wins')
+	parser.add_argument('-t', '--targets', nargs='+', required=False, default=[],
+		help='Ontology files to update rdf:resource links in')
+	parser.add_argument('-j', '--jobs', type=int, required=False,
+		help='Parallel target updates (default: one per CPU)')
+	parser.add_argument('-s', '--state', type=str, required=False, default='.obsoletion_state.json',
+		help='State file of propagated deprecations, for incremental runs')
+	parser.add_argument('-f', '--full', action='store_true',
+		help='Ignore the state file and check every target against every deprecation')
+	args = parser.parse_args()
+
+	deprecated_file_paths = args.deprecated
+	target_file_paths = args.targets + args.files
+	if not deprecated_file_paths and len(args.files) >= 2:
+		deprecated_file_paths = args.files[:1]
+		target_file_paths = args.targets + args.files[1:]
+
+	if not deprecated_file_paths or not target_file_paths:
+		sys.exit('Help Info:\n util_obsoletion_update.py [deprecated term .owl file path] [path of ontology to update rdf:resource links in]')
+
+	for deprecated_file_path in deprecated_file_paths:
+		if not path.exists(deprecated_file_path):
+			sys.exit('Unable to locate deprecated ontology term file: ' + deprecated_file_path);
+
+	for target_file_path in target_file_paths:
+		if not path.exists(target_file_path):
+			sys.exit('Unable to locate ontology update file: ' + target_file_path);
+
+	state = load_state(None if args.full else args.state)
+
+	sources = {deprecated_file_path: file_digest(deprecated_file_path) for deprecated_file_path in deprecated_file_paths}
+	if sources == state['sources'] and state['resolved'] in state['replacements']:
+		# Deprecation files unchanged since last run.
+		resolved = state['replacements'][state['resolved']]
+		print ('Deprecation files unchanged; reusing', len(resolved), 'resolved replacements.')
+	else:
+		replaced_by = {}
+		for deprecated_file_path in deprecated_file_paths:
+			print ("Using deprecated terms from:", deprecated_file_path)
+			for (about, replacement) in get_replacements(deprecated_file_path).items():
+				replaced_by.setdefault(about, replacement)
+
+		(resolved, chains, cycles) = resolve_replacements(replaced_by)
+
+		for chain in chains:
+			print ('Replacement chain:', ' -> '.join(chain))
+		for cycle in cycles:
+			print ('Replacement cycle (left alone):', ' -> '.join(cycle + [cycle[0]]))
+		print ('Resolved', len(replaced_by), 'replacements,', len(chains), 'chains,', len(cycles), 'cycles.')
+
+		resolved = {about: final for (about, final) in resolved.items() if final}
+
+	resolved_digest = replacements_digest(resolved)
+	state['sources'] = sources
+	state['resolved'] = resolved_digest
+	state['replacements'][resolved_digest] = resolved
+
+	# Work out which replacements each target still needs.
+	tasks = []
+	for target_file_path in target_file_paths:
+		target = state['targets'].get(target_file_path)
+		if target and target['digest'] == file_digest(target_file_path) and target['replacements'] in state['replacements']:
+			if target['replacements'] == resolved_digest:
+				print ("Up to date:", target_file_path)
+				continue
+			# Unedited since last run: only new or re-resolved deprecations matter.
+			synced = state['replacements'][target['replacements']]
+			replacements = {about: final for (about, final) in resolved.items() if synced.get(about) != final}
+		else:
+			replacements = resolved
+		tasks.append((target_file_path, replacements))
+
+	if len(tasks) == 1:
+		results = [_update_target(tasks[0])]
+	elif tasks:
+		with multiprocessing.Pool(min(args.jobs or os.cpu_count(), len(tasks))) as pool:
+			results = pool.map(_update_target, tasks)
+	else:
+		results = []
+
+	for (target_file_path, count, digest) in results:
+		print ("Updated ontology:", target_file_path, count, 'rdf:resource references.')
+		state['targets'][target_file_path] = {'digest': digest, 'replacements': resolved_digest}
+
+	if args.state:
+		save_state(args.state, state)
+
+
+if __name__ == '__main__':
+	main()
 
 """
 
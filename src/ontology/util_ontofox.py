@@ -0,0 +1,1016 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_ontofox.py
+Project: FoodOn
+
+Offline stand-in for the OntoFox web service: reads an imports/*_ontofox.txt
+spec and extracts the import module it describes from local copies of the
+source ontologies, so import refreshes need no network and run in parallel.
+Run from the src/ontology/ folder:
+
+    python util_ontofox.py                               # every imports/*_ontofox.txt
+    python util_ontofox.py imports/gaz_ontofox.txt       # -> imports/gaz_import.owl
+    python util_ontofox.py imports/chebi_ontofox.txt -o /tmp/chebi_import.owl
+    python util_ontofox.py --source NCBITaxon=/data/ncbitaxon.owl
+
+A spec's [Source ontology] NAME is read from imports/sources/name.owl (the
+file at http://purl.obolibrary.org/obo/name.owl) unless --source says
+otherwise.  The spec sections are those OntoFox accepts:
+
+    [Low level source term URIs]    terms, each optionally followed by
+                                    includeAllChildren
+    [Top level source term URIs and target direct superclass URIs]
+                                    terms, each optionally followed by
+                                    subClassOf <target superclass>
+    [Source term retrieval setting] includeAllIntermediates,
+                                    includeComputedIntermediates (only
+                                    intermediates where the hierarchy
+                                    branches) or includeNoIntermediates
+    [Source annotation URIs]        annotation properties to copy, or
+                                    includeAllAnnotationProperties,
+                                    includeAllAxioms or
+                                    includeAllAxiomsRecursively
+    [Source annotation URIs to be excluded]
+
+and a spec may repeat them from [Source ontology] on, once per source.
+Every extracted term is annotated as imported from its source, and the
+annotation properties used are declared; util_build.py then "robot reduce"s
+the module and comments those declarations out, as it does for OntoFox.
+
+Each source ontology is scanned once into an sqlite index under
+.ontofox_cache/ holding its named superclass / superproperty edges and the
+byte span of every entity, so an extraction reads only the terms it keeps.
+The index is rebuilt when the source file changes.  Finished modules are
+cached there too, keyed by the digest of the spec, its source indexes and
+this script, so an unchanged spec is just copied back.
+
+When only a spec's term lists have changed, its last module is patched
+rather than extracted again: the terms are selected from the index as
+usual, but a term selected by the same sections with the same parents as
+last time keeps its lines from the last module, so only added terms (and
+those whose place in the hierarchy moved) are read from the source, and
+dropped terms simply aren't written.  What each term was built from is kept
+beside the cached module in a .json file.  A changed source ontology or
+spec setting means a full extraction, as does --full.
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import sys
+import xml.parsers.expat
+
+from util_labels import ONTOLOGY_DIR
+from util_rdfxml import PREFIXES, Document, Namespaces, atomic_write, declaration, escape, header, make_element, \
+    parse_fragment, section
+
+CACHE_DIR = os.path.join(ONTOLOGY_DIR, '.ontofox_cache')
+SOURCE_DIR = os.path.join(ONTOLOGY_DIR, 'imports', 'sources')
+STATE_VERSION = 1
+
+OBO = PREFIXES['obo']
+OWL = PREFIXES['owl']
+RDF = PREFIXES['rdf']
+RDFS = PREFIXES['rdfs']
+IMPORTED_FROM = OBO + 'IAO_0000412'
+
+ALL_INTERMEDIATES = 'includeAllIntermediates'
+COMPUTED_INTERMEDIATES = 'includeComputedIntermediates'
+NO_INTERMEDIATES = 'includeNoIntermediates'
+ALL_CHILDREN = 'includeAllChildren'
+ALL_ANNOTATIONS = 'includeAllAnnotationProperties'
+ALL_AXIOMS = 'includeAllAxioms'
+ALL_AXIOMS_RECURSIVELY = 'includeAllAxiomsRecursively'
+
+# Spec section headers, lowercased, in the order OntoFox documents them.
+OUTPUT_HEADER = 'uri of the owl(rdf/xml) output file'
+SOURCE_HEADER = 'source ontology'
+LOW_HEADER = 'low level source term uris'
+TOP_HEADER = 'top level source term uris'
+SETTING_HEADER = 'source term retrieval setting'
+ANNOTATION_HEADER = 'source annotation uris'
+EXCLUDED_HEADER = 'source annotation uris to be excluded'
+
+HEADER = re.compile(r'(\[[^\]]*\])')
+COMMENT = re.compile(r'(^|\s)#.*$')
+ENTITY_COMMENT = re.compile(r'^    <!-- (\S+) -->$')
+
+# Entity kinds, with their tag, the property naming their parents and the
+# title of their section of the module, in OWLAPI order.
+KINDS = [
+    (OWL + 'AnnotationProperty', 'owl:AnnotationProperty', RDFS + 'subPropertyOf', 'Annotation properties'),
+    (OWL + 'ObjectProperty', 'owl:ObjectProperty', RDFS + 'subPropertyOf', 'Object Properties'),
+    (OWL + 'DatatypeProperty', 'owl:DatatypeProperty', RDFS + 'subPropertyOf', 'Data properties'),
+    (OWL + 'Class', 'owl:Class', RDFS + 'subClassOf', 'Classes'),
+    (OWL + 'NamedIndividual', 'owl:NamedIndividual', None, 'Individuals')
+]
+KIND_TAGS = {kind: (tag, parent) for (kind, tag, parent, title) in KINDS}
+PARENT_PROPERTIES = frozenset((RDFS + 'subClassOf', RDFS + 'subPropertyOf'))
+
+# Entity properties that state logical axioms rather than annotations.
+AXIOM_PROPERTIES = frozenset([RDF + 'type', RDFS + 'subClassOf', RDFS + 'subPropertyOf', RDFS + 'domain',
+    RDFS + 'range'] + [OWL + name for name in ('equivalentClass', 'disjointWith', 'disjointUnionOf', 'hasKey',
+    'inverseOf', 'equivalentProperty', 'propertyDisjointWith', 'propertyChainAxiom', 'sameAs', 'differentFrom')])
+
+INDEX_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE entity (iri TEXT, kind TEXT, start INTEGER, end INTEGER);
+CREATE TABLE edge (child TEXT, parent TEXT);
+"""
+INDEX_INDEXES = """
+CREATE INDEX entity_iri ON entity (iri);
+CREATE INDEX edge_child ON edge (child);
+CREATE INDEX edge_parent ON edge (parent);
+"""
+
+
+class SpecError(ValueError):
+    pass
+
+
+class Section(object):
+    """
+    One [Source ontology] part of a spec.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.low_terms = []    # (IRI, include all children)
+        self.top_terms = []    # (IRI, target superclass IRI or None)
+        self.setting = ALL_INTERMEDIATES
+        self.annotations = []  # property IRIs, or one of the ALL_ settings
+        self.excluded = set()
+
+    def annotation_mode(self):
+        for mode in (ALL_AXIOMS_RECURSIVELY, ALL_AXIOMS, ALL_ANNOTATIONS):
+            if mode in self.annotations:
+                return mode
+        return None
+
+
+class Spec(object):
+
+    def __init__(self, output_iri=None):
+        self.output_iri = output_iri
+        self.sections = []
+
+
+def parse_spec(spec_path):
+    """
+    Read an OntoFox input file into a Spec.  Raises SpecError.
+    """
+    with open(spec_path, 'r', encoding='utf-8') as handle:
+        text = handle.read()
+
+    spec = Spec()
+    current = None # Section
+    heading = None
+    for (number, line) in enumerate(text.splitlines(), 1):
+        for part in HEADER.split(COMMENT.sub('', line)):
+            if HEADER.match(part):
+                heading = ' '.join(part[1:-1].lower().split())
+                if heading == SOURCE_HEADER:
+                    current = None
+                elif heading not in (OUTPUT_HEADER, LOW_HEADER, SETTING_HEADER, ANNOTATION_HEADER, EXCLUDED_HEADER) \
+                    and not heading.startswith(TOP_HEADER):
+                    raise SpecError('%s:%d: unknown section %s' % (spec_path, number, part))
+                continue
+
+            value = part.strip()
+            if not value:
+                continue
+            if heading is None:
+                raise SpecError('%s:%d: "%s" is outside any section' % (spec_path, number, value))
+
+            if heading == OUTPUT_HEADER:
+                spec.output_iri = value
+            elif heading == SOURCE_HEADER:
+                current = Section(value)
+                spec.sections.append(current)
+            elif current is None:
+                raise SpecError('%s:%d: "%s" comes before [Source ontology]' % (spec_path, number, value))
+            elif heading == LOW_HEADER:
+                if value == ALL_CHILDREN:
+                    if not current.low_terms:
+                        raise SpecError('%s:%d: %s follows no term' % (spec_path, number, value))
+                    current.low_terms[-1] = (current.low_terms[-1][0], True)
+                else:
+                    current.low_terms.append((value, False))
+            elif heading.startswith(TOP_HEADER):
+                words = value.split()
+                if words[0] == 'subClassOf':
+                    if not current.top_terms or len(words) != 2:
+                        raise SpecError('%s:%d: misplaced "%s"' % (spec_path, number, value))
+                    current.top_terms[-1] = (current.top_terms[-1][0], words[1])
+                else:
+                    current.top_terms.append((value, None))
+            elif heading == SETTING_HEADER:
+                if value not in (ALL_INTERMEDIATES, COMPUTED_INTERMEDIATES, NO_INTERMEDIATES):
+                    raise SpecError('%s:%d: unknown retrieval setting %s' % (spec_path, number, value))
+                current.setting = value
+            elif heading == ANNOTATION_HEADER:
+                current.annotations.append(value)
+            elif heading == EXCLUDED_HEADER:
+                current.excluded.add(value)
+
+    if not spec.output_iri:
+        raise SpecError(spec_path + ': no [URI of the OWL(RDF/XML) output file]')
+    if not spec.sections:
+        raise SpecError(spec_path + ': no [Source ontology]')
+    return spec
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_index(source_path, index_path):
+    """
+    Scan source_path once, recording each top level entity's kind, byte span
+    and named parents in a new sqlite index at index_path.
+    """
+    tmp_path = '%s.%d.tmp' % (index_path, os.getpid())
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    connection.executescript(INDEX_SCHEMA)
+
+    # expat reports names as 'namespace}local'.
+    about = RDF + '}about'
+    resource = RDF + '}resource'
+    parent_names = {name.replace('#', '#}', 1) for name in PARENT_PROPERTIES}
+    type_name = RDF + '}type'
+
+    namespaces = {}
+    entities = {}
+    entity_rows = []
+    edge_rows = []
+    current = [] # [IRI, kind, start]
+    depth = 0
+
+    parser = xml.parsers.expat.ParserCreate(namespace_separator='}')
+
+    def close(end):
+        if current and current[0]:
+            entity_rows.append((current[0], current[1], current[2], end))
+        del current[:]
+
+    def start(name, attributes):
+        nonlocal depth
+        if depth == 1:
+            close(parser.CurrentByteIndex)
+            current.extend([attributes.get(about), name.replace('}', '', 1), parser.CurrentByteIndex])
+        elif depth == 2 and current and current[0]:
+            target = attributes.get(resource)
+            if target and name in parent_names:
+                edge_rows.append((current[0], target))
+            elif target and name == type_name and current[1] == RDF + 'Description':
+                current[1] = target
+        depth += 1
+
+    def end(name):
+        nonlocal depth
+        depth -= 1
+        if depth == 0:
+            close(parser.CurrentByteIndex)
+        if len(entity_rows) >= 100000:
+            flush()
+
+    def flush():
+        connection.executemany('INSERT INTO entity VALUES (?, ?, ?, ?)', entity_rows)
+        connection.executemany('INSERT INTO edge VALUES (?, ?)', edge_rows)
+        del entity_rows[:]
+        del edge_rows[:]
+
+    def namespace(prefix, uri):
+        if depth == 0:
+            namespaces[prefix or ''] = uri
+
+    def entity(name, is_parameter, value, *rest):
+        if not is_parameter and value is not None:
+            entities[name] = value
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.StartNamespaceDeclHandler = namespace
+    parser.EntityDeclHandler = entity
+
+    digest = hashlib.sha256()
+    status = os.stat(source_path)
+    with open(source_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+            parser.Parse(block, False)
+    parser.Parse(b'', True)
+    flush()
+
+    meta = {'version': STATE_VERSION, 'path': os.path.abspath(source_path), 'size': status.st_size,
+        'mtime_ns': status.st_mtime_ns, 'digest': digest.hexdigest(),
+        'namespaces': namespaces, 'entities': entities}
+    connection.executemany('INSERT INTO meta VALUES (?, ?)', [(key, json.dumps(value)) for (key, value) in meta.items()])
+    connection.executescript(INDEX_INDEXES)
+    connection.commit()
+    connection.close()
+    os.replace(tmp_path, index_path)
+
+
+class SourceIndex(object):
+    """
+    Read access to a source ontology through its index: entity kinds,
+    parents, children and parsed entity Nodes.
+    """
+
+    def __init__(self, source_path, index_path):
+        self.source_path = source_path
+        self.connection = sqlite3.connect(index_path)
+        self.meta = {key: json.loads(value) for (key, value) in self.connection.execute('SELECT key, value FROM meta')}
+        self.document = Document()
+        self.document.namespaces.update(self.meta['namespaces'])
+        self.document.entities.update(self.meta['entities'])
+        self.handle = open(source_path, 'rb')
+        self._parents = {}
+
+    @classmethod
+    def open(cls, source_path, cache_dir=CACHE_DIR):
+        """
+        Open source_path's index in cache_dir, (re)building it first if it
+        is missing or the source has changed since.
+        """
+        source_path = os.path.abspath(source_path)
+        name = os.path.basename(source_path)
+        index_path = os.path.join(cache_dir, '%s.%s.sqlite' % (name, hashlib.sha1(source_path.encode('utf-8')).hexdigest()[:8]))
+        status = os.stat(source_path)
+        if os.path.exists(index_path):
+            index = cls(source_path, index_path)
+            if index.meta.get('version') == STATE_VERSION and index.meta['size'] == status.st_size \
+                and index.meta['mtime_ns'] == status.st_mtime_ns:
+                return index
+            index.close()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        build_index(source_path, index_path)
+        return cls(source_path, index_path)
+
+    def close(self):
+        self.connection.close()
+        self.handle.close()
+
+    @property
+    def digest(self):
+        return self.meta['digest']
+
+    def kind(self, iri):
+        """
+        The IRI of iri's owl: type, or None if the source has no such entity.
+        """
+        kinds = [kind for (kind,) in self.connection.execute('SELECT kind FROM entity WHERE iri = ?', (iri,))]
+        for kind in kinds:
+            if kind in KIND_TAGS:
+                return kind
+        return OWL + 'Class' if kinds else None
+
+    def parents(self, iri):
+        parents = self._parents.get(iri)
+        if parents is None:
+            parents = tuple(sorted(parent for (parent,) in self.connection.execute('SELECT parent FROM edge WHERE child = ?', (iri,))))
+            self._parents[iri] = parents
+        return parents
+
+    def children(self, iri):
+        return [child for (child,) in self.connection.execute('SELECT child FROM edge WHERE parent = ?', (iri,))]
+
+    def descendants(self, iri):
+        found = set()
+        pending = [iri]
+        while pending:
+            for child in self.children(pending.pop()):
+                if child not in found:
+                    found.add(child)
+                    pending.append(child)
+        found.discard(iri)
+        return found
+
+    def nodes(self, iri):
+        """
+        The source's top level Nodes describing iri.
+        """
+        nodes = []
+        for (start, end) in self.connection.execute('SELECT start, end FROM entity WHERE iri = ? ORDER BY start', (iri,)):
+            self.handle.seek(start)
+            nodes.append(parse_fragment(self.handle.read(end - start).decode('utf-8'), self.document))
+        return nodes
+
+
+def expanded_iri(node):
+    """
+    The IRI an element name stands for.
+    """
+    name = node.tag.expanded()
+    return name[1:].replace('}', '', 1) if name.startswith('{') else name
+
+
+def resources(node):
+    """
+    IRIs node and its descendants refer to, by rdf:resource or as nested
+    rdf:Descriptions.
+    """
+    for tag in node.iter_tags():
+        target = tag.get('rdf:resource') or tag.get('rdf:about')
+        if target:
+            yield target
+
+
+class Term(object):
+    """
+    An entity of the module being built, and what it was built from.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.sections = set()  # numbers of the spec sections selecting it
+        self.parents = set()
+        self.content = []      # Nodes: axioms and annotations
+        self.refs = {}         # IRI -> kind, of entities its axioms refer to
+        self.expand = set()    # refs to extract too (includeAllAxiomsRecursively)
+        self.properties = set() # annotation properties its content uses
+        self.block = None      # its lines in the previous extraction, if unchanged
+
+    def record(self):
+        """
+        What the term was built from, as saved in the extraction state.
+        """
+        return {'kind': self.kind, 'sections': sorted(self.sections), 'parents': sorted(self.parents),
+            'refs': self.refs, 'expand': sorted(self.expand), 'properties': sorted(self.properties)}
+
+
+class Module(object):
+    """
+    The entities extracted from every section of a spec.
+    """
+
+    def __init__(self, ontology_iri):
+        self.ontology_iri = ontology_iri
+        self.terms = {}       # IRI -> Term
+        self.declared = {}    # IRI -> kind, for entities only referred to
+        self.properties = {}  # annotation property IRI -> [label Node, ...]
+        self.prefixes = {}    # source prefix -> namespace, for writing
+        self.selections = {}  # section number -> (kept, within, tops)
+        self.warnings = []
+        self.reused = 0       # terms copied from the previous extraction
+
+    def term(self, iri, kind):
+        term = self.terms.get(iri)
+        if term is None:
+            term = self.terms[iri] = Term(kind)
+        return term
+
+
+def nearest(index, iri, kept, within=None):
+    """
+    The closest ancestors of iri in kept, climbing only through entities in
+    within (or any, if None).
+    """
+    found = set()
+    seen = set()
+    pending = list(index.parents(iri))
+    while pending:
+        parent = pending.pop()
+        if parent in seen:
+            continue
+        seen.add(parent)
+        if parent in kept:
+            found.add(parent)
+        elif within is None or parent in within:
+            pending.extend(index.parents(parent))
+    return found
+
+
+def intermediates(index, low, tops):
+    """
+    low and tops, plus every ancestor of a low term on a path up to a top
+    term.  As with OntoFox, a low term under none of the top terms keeps
+    all its ancestors.
+    """
+    reaches = {} # IRI -> on a path to a top term
+    def reaching(iri):
+        if iri not in reaches:
+            reaches[iri] = False # Until shown otherwise; breaks cycles.
+            reaches[iri] = iri in tops or not tops or any(reaching(parent) for parent in index.parents(iri))
+        return reaches[iri]
+
+    selected = set(low) | set(tops)
+    pending = list(low)
+    while pending:
+        iri = pending.pop()
+        if iri in tops:
+            continue
+        under_top = reaching(iri)
+        for parent in index.parents(iri):
+            if parent not in selected and (reaching(parent) or not under_top):
+                selected.add(parent)
+                pending.append(parent)
+    return selected
+
+
+def carried_content(spec_section, node):
+    """
+    The children of a source entity Node the spec section keeps.  Named parents
+    are left out; the module's hierarchy is worked out separately.
+    """
+    mode = spec_section.annotation_mode()
+    allowed = frozenset(spec_section.annotations)
+    content = []
+    for child in node.children():
+        iri = expanded_iri(child)
+        if iri in spec_section.excluded or (iri in PARENT_PROPERTIES and child.get('rdf:resource')):
+            continue
+        annotation = iri not in AXIOM_PROPERTIES
+        if mode in (ALL_AXIOMS, ALL_AXIOMS_RECURSIVELY) or (annotation and (mode == ALL_ANNOTATIONS or iri in allowed)):
+            content.append(child)
+    return content
+
+
+def select_section(module, number, spec_section, index):
+    """
+    Add the entities spec section number selects from its source to module,
+    with their parents.  Their content is read by describe().
+    """
+    low = set()
+    for (iri, all_children) in spec_section.low_terms:
+        if index.kind(iri) is None:
+            module.warnings.append('%s has no term %s' % (spec_section.source, iri))
+            continue
+        low.add(iri)
+        if all_children:
+            low.update(index.descendants(iri))
+
+    tops = {}
+    for (iri, target) in spec_section.top_terms:
+        if index.kind(iri) is None:
+            module.warnings.append('%s has no top level term %s' % (spec_section.source, iri))
+        else:
+            tops[iri] = target
+
+    if spec_section.setting == NO_INTERMEDIATES:
+        kept = low | set(tops)
+        within = None
+    else:
+        within = intermediates(index, low, tops)
+        kept = within
+        if spec_section.setting == COMPUTED_INTERMEDIATES:
+            # Keep an intermediate only where the hierarchy branches.
+            children = {}
+            for iri in within:
+                for parent in index.parents(iri):
+                    children[parent] = children.get(parent, 0) + 1
+            kept = low | set(tops) | {iri for iri in within if children.get(iri, 0) > 1}
+
+    for (prefix, namespace) in index.document.namespaces.items():
+        if prefix:
+            module.prefixes.setdefault(prefix, namespace)
+
+    module.selections[number] = (kept, within, tops)
+    for iri in sorted(kept):
+        add_term(module, number, index, iri)
+
+
+def add_term(module, number, index, iri):
+    (kept, within, tops) = module.selections[number]
+    term = module.term(iri, index.kind(iri))
+    term.sections.add(number)
+    term.parents.update(nearest(index, iri, kept, within))
+    if tops.get(iri):
+        term.parents.add(tops[iri])
+        module.declared.setdefault(tops[iri], OWL + 'Class')
+    return term
+
+
+def read_content(term, iri, spec, indexes):
+    """
+    Read term's axioms and annotations from the sources of its sections.
+    """
+    for number in sorted(term.sections):
+        spec_section = spec.sections[number]
+        index = indexes[number]
+        recursive = spec_section.annotation_mode() == ALL_AXIOMS_RECURSIVELY
+        term.content.append(parse_fragment(make_element('obo:IAO_0000412',
+            {'rdf:resource': OBO + spec_section.source.lower() + '.owl'})))
+        for node in index.nodes(iri):
+            for child in carried_content(spec_section, node):
+                term.content.append(child)
+                prop = expanded_iri(child)
+                if prop not in AXIOM_PROPERTIES:
+                    term.properties.add(prop)
+                    continue
+                # Entities the axiom refers to are declared, or with
+                # includeAllAxiomsRecursively extracted as well.
+                for target in resources(child):
+                    kind = index.kind(target)
+                    if kind is not None and target != iri:
+                        term.refs[target] = kind
+                        if recursive:
+                            term.expand.add(target)
+
+
+def describe(module, spec, indexes, previous=None, blocks=None):
+    """
+    Fill in the content of module's terms: a term selected exactly as in the
+    previous extraction (previous: IRI -> Term.record(); blocks: IRI -> its
+    lines in that module) keeps its lines, and only the rest are read from
+    the sources.
+    """
+    previous = previous or {}
+    blocks = blocks or {}
+    pending = sorted(module.terms)
+    done = set()
+    while pending:
+        iri = pending.pop()
+        if iri in done:
+            continue
+        done.add(iri)
+        term = module.terms[iri]
+        record = previous.get(iri)
+        if iri in blocks and record and record['kind'] == term.kind \
+            and record['sections'] == sorted(term.sections) and record['parents'] == sorted(term.parents):
+            term.block = blocks[iri]
+            term.refs = record['refs']
+            term.expand = set(record['expand'])
+            term.properties = set(record['properties'])
+            module.reused += 1
+        else:
+            read_content(term, iri, spec, indexes)
+
+        for target in sorted(term.expand):
+            if target in module.terms:
+                continue
+            number = min(number for number in term.sections
+                if spec.sections[number].annotation_mode() == ALL_AXIOMS_RECURSIVELY)
+            module.selections[number][0].add(target)
+            add_term(module, number, indexes[number], target)
+            pending.append(target)
+
+    for term in module.terms.values():
+        for (target, kind) in term.refs.items():
+            module.declared.setdefault(target, kind)
+        for prop in term.properties:
+            module.properties.setdefault(prop, None)
+    module.properties.setdefault(IMPORTED_FROM, None)
+
+    # Label the annotation properties the sources define.
+    for prop in module.properties:
+        for index in indexes:
+            if module.properties[prop] is None and index.kind(prop):
+                module.properties[prop] = [label for node in index.nodes(prop) for label in node.findall('rdfs:label')]
+
+
+def write_node(lines, node, namespaces, indent):
+    """
+    Write node, and its children, in OWLAPI layout with this module's
+    prefixes.
+    """
+    def qname(expanded):
+        if not expanded.startswith('{'):
+            return expanded
+        (namespace, local) = expanded[1:].split('}', 1)
+        return namespaces.prefix(namespace) + ':' + local
+
+    document = node.tag.document
+    name = qname(node.tag.expanded())
+    attributes = ''.join(' %s="%s"' % (qname(document.expand(key)), escape(value, True))
+        for (key, value) in node.tag.attributes().items() if not key.startswith('xmlns'))
+    children = node.children()
+    if children:
+        lines.append(' ' * indent + '<' + name + attributes + '>')
+        for child in children:
+            write_node(lines, child, namespaces, indent + 4)
+        lines.append(' ' * indent + '</' + name + '>')
+    elif node.end is None:
+        lines.append(' ' * indent + '<' + name + attributes + '/>')
+    else:
+        text = escape(node.text).replace('"', '&quot;').replace("'", '&apos;')
+        lines.append(' ' * indent + '<' + name + attributes + '>' + text + '</' + name + '>')
+
+
+def serialize(module):
+    """
+    Return the RDF/XML text of a module.
+    """
+    namespaces = Namespaces(PREFIXES)
+    for (prefix, namespace) in sorted(module.prefixes.items()):
+        if namespace not in namespaces.prefixes and prefix not in namespaces.prefixes.values():
+            namespaces.prefixes[namespace] = prefix
+
+    entities = {} # kind -> {IRI: Term or None}
+    for (iri, kind) in module.declared.items():
+        if iri not in module.terms:
+            entities.setdefault(kind, {})[iri] = None
+    for (iri, term) in module.terms.items():
+        entities.setdefault(term.kind if term.kind in KIND_TAGS else OWL + 'Class', {})[iri] = term
+    annotation_properties = entities.setdefault(OWL + 'AnnotationProperty', {})
+    for prop in module.properties:
+        annotation_properties.setdefault(prop, None)
+
+    body = []
+    for (kind, tag, parent_property, title) in KINDS:
+        if not entities.get(kind):
+            continue
+        body.extend(section(title))
+        for (iri, term) in sorted(entities[kind].items()):
+            labels = module.properties.get(iri) if kind == OWL + 'AnnotationProperty' and term is None else None
+            if term is None and not labels:
+                declaration(body, tag, iri)
+                continue
+
+            if term is not None and term.block is not None:
+                body.extend(term.block + ['    ', '', ''])
+                continue
+
+            lines = []
+            if term is not None:
+                if parent_property:
+                    parent_tag = 'rdfs:subPropertyOf' if parent_property == RDFS + 'subPropertyOf' else 'rdfs:subClassOf'
+                    for parent in sorted(term.parents):
+                        lines.append('        <' + parent_tag + ' rdf:resource="' + escape(parent, True) + '"/>')
+                axioms = []
+                annotations = []
+                for node in term.content:
+                    rendered = []
+                    write_node(rendered, node, namespaces, 8)
+                    if expanded_iri(node) in AXIOM_PROPERTIES:
+                        if rendered not in axioms:
+                            axioms.append(rendered)
+                    else:
+                        # Ordered as OWLAPI does, by property then value.
+                        value = node.get('rdf:resource') or node.text or ''
+                        annotations.append((expanded_iri(node), value, rendered))
+                for rendered in axioms:
+                    lines.extend(rendered)
+                seen = set()
+                for (prop, value, rendered) in sorted(annotations):
+                    if tuple(rendered) not in seen:
+                        seen.add(tuple(rendered))
+                        lines.extend(rendered)
+            else:
+                for label in labels:
+                    write_node(lines, label, namespaces, 8)
+
+            body.extend(['    <!-- ' + escape(iri) + ' -->', ''])
+            if lines:
+                body.append('    <' + tag + ' rdf:about="' + escape(iri, True) + '">')
+                body.extend(lines)
+                body.extend(['    </' + tag + '>', '    ', '', ''])
+            else:
+                body.extend(['    <' + tag + ' rdf:about="' + escape(iri, True) + '"/>', '    ', '', ''])
+
+    while body and body[-1].strip() == '':
+        body.pop()
+
+    return '\n'.join(header(namespaces, module.ontology_iri) + body
+        + ['</rdf:RDF>', '', '', '', '<!-- Generated by util_ontofox.py -->', ''])
+
+
+def read_blocks(module_path):
+    """
+    Split a module this script wrote into its entities' blocks of lines.
+    Returns {IRI: [line, ...]}, each from the entity's comment to its
+    closing tag.
+    """
+    blocks = {}
+    current = None
+    with open(module_path, 'r', encoding='utf-8') as handle:
+        for line in handle:
+            line = line.rstrip('\n')
+            match = ENTITY_COMMENT.match(line)
+            if match:
+                current = blocks[Document().unescape(match.group(1))] = [line]
+            elif line.startswith('    <!--') or line.startswith('</rdf:RDF>'):
+                current = None
+            elif current is not None:
+                current.append(line)
+    for lines in blocks.values():
+        while lines[-1].strip() == '':
+            lines.pop()
+    return blocks
+
+
+def source_path(name, sources, source_dir=SOURCE_DIR):
+    return sources.get(name.lower()) or os.path.join(source_dir, name.lower() + '.owl')
+
+
+def open_indexes(spec, sources, source_dir=SOURCE_DIR, cache_dir=CACHE_DIR):
+    """
+    The SourceIndex of each spec section's source, in section order.
+    """
+    indexes = {}
+    try:
+        for spec_section in spec.sections:
+            path = source_path(spec_section.source, sources, source_dir)
+            if path not in indexes:
+                indexes[path] = SourceIndex.open(path, cache_dir)
+    except Exception:
+        for index in indexes.values():
+            index.close()
+        raise
+    return [indexes[source_path(spec_section.source, sources, source_dir)] for spec_section in spec.sections]
+
+
+def extract(spec, indexes, previous=None, blocks=None):
+    """
+    Build the module a parsed Spec describes from its section indexes,
+    reusing the unchanged terms of a previous extraction (see describe()).
+    Returns the Module.
+    """
+    module = Module(spec.output_iri)
+    for (number, spec_section) in enumerate(spec.sections):
+        select_section(module, number, spec_section, indexes[number])
+    describe(module, spec, indexes, previous, blocks)
+    return module
+
+
+def base_key(spec, indexes):
+    """
+    Digest of everything a spec's module depends on but its term lists: its
+    sources (by their index digests), settings and this code.  Extractions
+    with the same base differ only in which terms they select.
+    """
+    settings = [spec.output_iri] + [(spec_section.source, spec_section.setting, spec_section.annotations,
+        sorted(spec_section.excluded), index.digest) for (spec_section, index) in zip(spec.sections, indexes)]
+    digest = hashlib.sha256(str(STATE_VERSION).encode('utf-8'))
+    digest.update(file_digest(__file__).encode('utf-8'))
+    digest.update(json.dumps(settings).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def spec_key(spec_path, spec, indexes):
+    """
+    Digest of everything a spec's module depends on: the spec, its source
+    ontologies (by their index digests) and this code.
+    """
+    digest = hashlib.sha256(base_key(spec, indexes).encode('utf-8'))
+    digest.update(file_digest(spec_path).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def write_if_changed(text, output_path):
+    """
+    Write text to output_path unless it already holds exactly that.
+    Returns True if written.
+    """
+    data = text.encode('utf-8') if isinstance(text, str) else text
+    if os.path.exists(output_path) and file_digest(output_path) == hashlib.sha256(data).hexdigest():
+        return False
+    with atomic_write(output_path, 'wb') as handle:
+        handle.write(data)
+    return True
+
+
+def refresh(job):
+    """
+    Bring one (spec, output, sources, source dir, cache dir, full) job's
+    module up to date.  Returns (spec, output, counts or None if not
+    extracted, warnings, status or error message) where status is
+    'extracted', 'cached' or 'current', and counts is (entities, terms
+    added, removed, re-read and kept from the previous extraction).
+    """
+    (spec_path, output_path, sources, source_dir, cache_dir, full) = job
+    try:
+        spec = parse_spec(spec_path)
+        for spec_section in spec.sections:
+            path = source_path(spec_section.source, sources, source_dir)
+            if not os.path.exists(path):
+                raise SpecError('no local copy of %s: download %s%s.owl to %s, or give --source %s=PATH'
+                    % (spec_section.source, OBO, spec_section.source.lower(), path, spec_section.source))
+
+        indexes = open_indexes(spec, sources, source_dir, cache_dir)
+        try:
+            key = spec_key(spec_path, spec, indexes)
+            cache_path = os.path.join(cache_dir, '%s.%s.owl' % (os.path.basename(spec_path), key))
+            if not full and os.path.exists(cache_path):
+                with open(cache_path, 'rb') as handle:
+                    data = handle.read()
+                return (spec_path, output_path, None, [], 'cached' if write_if_changed(data, output_path) else 'current')
+
+            # The previous extraction of this spec, if its sources and
+            # settings are the same, is patched rather than redone.
+            base = base_key(spec, indexes)
+            old_paths = glob.glob(os.path.join(cache_dir, glob.escape(os.path.basename(spec_path)) + '.*.owl'))
+            previous = {}
+            blocks = {}
+            for old_path in old_paths:
+                try:
+                    with open(old_path[:-4] + '.json', 'r', encoding='utf-8') as handle:
+                        state = json.load(handle)
+                except (OSError, ValueError):
+                    continue
+                if not full and state.get('base') == base:
+                    previous = state['terms']
+                    blocks = read_blocks(old_path)
+
+            module = extract(spec, indexes, previous, blocks)
+        finally:
+            for index in set(indexes):
+                index.close()
+
+        text = serialize(module)
+        status = 'extracted' if write_if_changed(text, output_path) else 'current'
+
+        # One cached module, and its state, per spec.
+        for old_path in old_paths:
+            for path in (old_path, old_path[:-4] + '.json'):
+                if os.path.exists(path):
+                    os.remove(path)
+        state = {'version': STATE_VERSION, 'base': base,
+            'terms': {iri: term.record() for (iri, term) in module.terms.items()}}
+        for (path, content) in ((cache_path[:-4] + '.json', json.dumps(state)), (cache_path, text)):
+            with atomic_write(path, encoding='utf-8') as handle:
+                handle.write(content)
+
+        added = len(set(module.terms) - set(previous)) if previous else len(module.terms)
+        removed = len(set(previous) - set(module.terms))
+        counts = (len(module.terms) + len(module.declared), added, removed,
+            len(module.terms) - added - module.reused, module.reused)
+        return (spec_path, output_path, counts, module.warnings, status)
+
+    except (OSError, SpecError, sqlite3.Error, xml.parsers.expat.ExpatError) as e:
+        return (spec_path, output_path, None, [], 'error: ' + str(e))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Extract OntoFox import modules from local copies of their source ontologies.')
+    parser.add_argument('specs', nargs='*',
+        help='OntoFox spec files (default: imports/*_ontofox.txt)')
+    parser.add_argument('-o', '--output', type=str, required=False,
+        help='Output .owl file, for a single spec (default: imports/X_import.owl for X_ontofox.txt)')
+    parser.add_argument('-S', '--source-dir', type=str, required=False, default=SOURCE_DIR,
+        help='Folder of source ontologies named as at OBO, e.g. ncbitaxon.owl (default: imports/sources)')
+    parser.add_argument('--source', action='append', default=[], metavar='NAME=PATH',
+        help='Local copy of the [Source ontology] NAME')
+    parser.add_argument('-c', '--cache-dir', type=str, required=False, default=CACHE_DIR,
+        help='Folder for source indexes and extracted modules (default: .ontofox_cache)')
+    parser.add_argument('-f', '--full', action='store_true',
+        help='Read every term from the sources, even if a module for the same spec and sources is cached or the last one could be patched')
+    parser.add_argument('-j', '--jobs', type=int, required=False,
+        help='Specs extracted in parallel (default: one per CPU)')
+    args = parser.parse_args()
+
+    sources = {}
+    for source in args.source:
+        (name, _, path) = source.partition('=')
+        if not path:
+            sys.exit('--source needs NAME=PATH: ' + source)
+        sources[name.lower()] = os.path.abspath(path)
+
+    spec_paths = args.specs or sorted(glob.glob(os.path.join(ONTOLOGY_DIR, 'imports', '*_ontofox.txt')))
+    if args.output and len(spec_paths) != 1:
+        sys.exit('--output needs a single spec.')
+    jobs = []
+    for spec_path in spec_paths:
+        if not os.path.exists(spec_path):
+            sys.exit('Unable to locate OntoFox spec: ' + spec_path)
+        output_path = args.output or os.path.join(os.path.dirname(spec_path),
+            os.path.basename(spec_path).replace('_ontofox.txt', '_import.owl'))
+        if os.path.abspath(output_path) == os.path.abspath(spec_path):
+            sys.exit('Spec file names should end in _ontofox.txt: ' + spec_path)
+        jobs.append((spec_path, output_path, sources, args.source_dir, args.cache_dir, args.full))
+    if not jobs:
+        sys.exit('No OntoFox specs to extract.')
+
+    os.makedirs(args.cache_dir, exist_ok=True)
+    failures = 0
+    with multiprocessing.Pool(min(args.jobs or multiprocessing.cpu_count(), len(jobs))) as pool:
+        for (spec_path, output_path, counts, warnings, status) in pool.imap_unordered(refresh, jobs):
+            for warning in warnings:
+                print('%s: warning: %s' % (spec_path, warning), file=sys.stderr)
+            if status.startswith('error: '):
+                failures += 1
+                print('%s: %s' % (spec_path, status[7:]), file=sys.stderr)
+            elif status == 'current':
+                print('Up to date:', output_path)
+            elif status == 'cached':
+                print('Restored', output_path, 'from the cached extraction of', spec_path)
+            else:
+                (entities, added, removed, reread, kept) = counts
+                if kept or removed:
+                    print('Patched %s from %s: %d entities; %d terms added, %d removed, %d re-read, %d unchanged.'
+                        % (output_path, spec_path, entities, added, removed, reread, kept))
+                else:
+                    print('Extracted %s into %s: %d entities.' % (spec_path, output_path, entities))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,769 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_rdfxml.py
+Project: FoodOn
+
+A streaming, formatting preserving rewriter for OWLAPI style RDF/XML files.
+
+The file is split into raw tokens (tags, text, comments, ...) and each top
+level entity under rdf:RDF (an owl:Class, owl:Axiom, ...) is read as a small
+tree of Nodes that keep their original token text.  Only one entity is in
+memory at a time.  A document is written back by concatenating the raw
+tokens, so every byte that an edit doesn't touch - indentation, comments,
+entity references, attribute quoting - is left as it was.  This makes a
+"robot reduce" round trip to restore Protege formatting unnecessary.
+
+    def update(node):
+        for tag in node.iter_tags():
+            if tag.get('rdf:resource') == old_iri:
+                tag.set('rdf:resource', new_iri)
+        return node
+
+    rewrite_file('foodon-edit.owl', 'foodon-edit.owl', update)
+
+Element names are compared as expanded {namespace}name pairs: names given to
+find(), get() etc. use the usual OWL prefixes (PREFIXES), whatever prefixes
+the document itself declares.
+
+The scripts that write OWLAPI style RDF/XML from scratch
+(util_robot_template.py, util_ontofox.py and bin/apply-pattern.py) share the
+rest: Manchester syntax class expressions parsed by parse_class_expression()
+and written by write_property(), and header(), section() and declaration()
+for the layout.
+"""
+
+import contextlib
+import html.entities
+import io
+import os
+import re
+import shutil
+import tempfile
+
+PREFIXES = {
+    'owl': 'http://www.w3.org/2002/07/owl#',
+    'rdf': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'rdfs': 'http://www.w3.org/2000/01/rdf-schema#',
+    'xsd': 'http://www.w3.org/2001/XMLSchema#',
+    'xml': 'http://www.w3.org/XML/1998/namespace',
+    'obo': 'http://purl.obolibrary.org/obo/',
+    'oboInOwl': 'http://www.geneontology.org/formats/oboInOwl#',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+    'dcterms': 'http://purl.org/dc/terms/'
+}
+
+TOKEN = re.compile(r'<!--.*?-->|<\?.*?\?>|<!\[CDATA\[.*?\]\]>|<!DOCTYPE(?:[^\[>]|\[.*?\])*>|<[^>]*>|[^<]+', re.S)
+TAG_NAME = re.compile(r'</?([^\s/>]+)')
+ATTRIBUTE = re.compile(r'([^\s=/>]+)(\s*=\s*)(["\'])(.*?)\3', re.S)
+ENTITY_DECLARATION = re.compile(r'<!ENTITY\s+(\S+)\s+["\']([^"\']*)["\']\s*>')
+REFERENCE = re.compile(r'&(#x[0-9a-fA-F]+|#[0-9]+|[^;\s&]+);')
+
+READ_SIZE = 1 << 20
+
+# Manchester syntax class expressions: 'quoted labels', <IRI>s, parentheses
+# and other names or keywords.
+MANCHESTER_TOKEN = re.compile(r"'[^']*'|<[^>]*>|\(|\)|[^\s()']+")
+MANCHESTER_KEYWORDS = frozenset(['and', 'or', 'that', 'not', 'some', 'only', 'value', 'min', 'max', 'exactly'])
+
+RESTRICTIONS = {'some': 'owl:someValuesFrom', 'only': 'owl:allValuesFrom'}
+CARDINALITIES = {'min': 'owl:minQualifiedCardinality', 'max': 'owl:maxQualifiedCardinality',
+    'exactly': 'owl:qualifiedCardinality'}
+
+# The OWL API's order of class expression types.
+EXPRESSION_ORDER = {'class': 0, 'and': 1, 'or': 2, 'not': 3, 'some': 5, 'only': 6, 'value': 7,
+    'min': 8, 'exactly': 9, 'max': 10}
+
+# Header namespaces always written, in the OWL API's order.
+HEADER_PREFIXES = ['obo', 'owl', 'rdf', 'xml', 'xsd', 'rdfs']
+SECTION_RULE = '/' * 87
+LOCAL_NAME = re.compile(r'[A-Za-z_][\w.-]*$')
+
+XML_ESCAPES = {'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'"}
+
+# Read once, as os.umask() can only be read by setting it.
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+
+def escape(text, quote=False):
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    if quote:
+        text = text.replace('"', '&quot;')
+    return text
+
+
+class Document(object):
+    """
+    Per file context: declared namespace prefixes and DTD entities.
+    """
+
+    def __init__(self):
+        self.namespaces = dict(PREFIXES)
+        self.entities = dict(XML_ESCAPES)
+
+    def unescape(self, text):
+        def reference(match):
+            name = match.group(1)
+            if name[0:2] == '#x':
+                return chr(int(name[2:], 16))
+            if name[0] == '#':
+                return chr(int(name[1:]))
+            if name in self.entities:
+                return self.entities[name]
+            if name in html.entities.name2codepoint:
+                return chr(html.entities.name2codepoint[name])
+            return match.group(0)
+        return REFERENCE.sub(reference, text) if '&' in text else text
+
+    def expand(self, qname, namespaces=None):
+        (prefix, _, local) = qname.rpartition(':')
+        namespaces = namespaces or self.namespaces
+        if prefix in namespaces:
+            return '{' + namespaces[prefix] + '}' + local
+        return qname
+
+
+class Tag(object):
+    """
+    A start, end or empty element tag.  Attribute edits rewrite only the
+    edited value within the raw tag text.
+    """
+
+    def __init__(self, raw, document):
+        self.raw = raw
+        self.document = document
+        self.kind = 'end' if raw[1] == '/' else ('empty' if raw.endswith('/>') else 'start')
+        self.name = TAG_NAME.match(raw).group(1)
+        self.changed = False
+
+    def __str__(self):
+        return self.raw
+
+    def expanded(self):
+        return self.document.expand(self.name)
+
+    def is_a(self, qname):
+        return self.expanded() == self.document.expand(qname, PREFIXES)
+
+    def _find(self, qname):
+        expanded = self.document.expand(qname, PREFIXES)
+        start = len(self.name) + 1
+        for match in ATTRIBUTE.finditer(self.raw, start):
+            if self.document.expand(match.group(1)) == expanded:
+                return match
+        return None
+
+    def get(self, qname, default=None):
+        match = self._find(qname)
+        if match is None:
+            return default
+        return self.document.unescape(match.group(4))
+
+    def set(self, qname, value):
+        match = self._find(qname)
+        if match is None:
+            # New attribute goes after the last one.
+            end = len(self.raw) - (2 if self.kind == 'empty' else 1)
+            self.raw = self.raw[:end].rstrip() + ' %s="%s"' % (qname, escape(value, True)) + self.raw[end:]
+        else:
+            self.raw = self.raw[:match.start(4)] + escape(value, True) + self.raw[match.end(4):]
+        self.changed = True
+
+    def attributes(self):
+        """
+        Dictionary of attribute qname -> unescaped value, in document order.
+        """
+        return {match.group(1): self.document.unescape(match.group(4))
+            for match in ATTRIBUTE.finditer(self.raw, len(self.name) + 1)}
+
+
+class Node(object):
+    """
+    An element: its start tag, its content (text strings, comments and child
+    Nodes, as raw text) and its end tag (None for an empty element).
+    """
+
+    def __init__(self, tag, content=None, end=None):
+        self.tag = tag
+        self.content = content if content is not None else []
+        self.end = end
+        self.modified = False # Content added or removed
+
+    def __str__(self):
+        if self.end is None:
+            return self.tag.raw
+        return self.tag.raw + ''.join(str(item) for item in self.content) + self.end.raw
+
+    @property
+    def name(self):
+        return self.tag.name
+
+    def is_a(self, qname):
+        return self.tag.is_a(qname)
+
+    def get(self, qname, default=None):
+        return self.tag.get(qname, default)
+
+    def set(self, qname, value):
+        self.tag.set(qname, value)
+
+    @property
+    def changed(self):
+        """
+        True if this node or any descendant was edited.
+        """
+        return any(node.modified or node.tag.changed for node in self.iter())
+
+    @property
+    def text(self):
+        """
+        Unescaped character content, or None if the element has child
+        elements or is empty.
+        """
+        if self.end is None:
+            return None
+        parts = []
+        for item in self.content:
+            if isinstance(item, Node):
+                return None
+            if item.startswith('<![CDATA['):
+                parts.append(item[9:-3])
+            elif not item.startswith('<!--'):
+                parts.append(self.tag.document.unescape(item))
+        return ''.join(parts)
+
+    def children(self):
+        return [item for item in self.content if isinstance(item, Node)]
+
+    def find(self, qname):
+        for child in self.children():
+            if child.is_a(qname):
+                return child
+        return None
+
+    def findall(self, qname):
+        return [child for child in self.children() if child.is_a(qname)]
+
+    def iter(self):
+        """
+        This node and all its descendants, depth first.
+        """
+        yield self
+        for child in self.children():
+            yield from child.iter()
+
+    def iter_tags(self):
+        for node in self.iter():
+            yield node.tag
+
+
+    def remove(self, child):
+        """
+        Remove child, along with the whitespace that indents it, so that its
+        line disappears.
+        """
+        index = self.content.index(child)
+        del self.content[index]
+        if index > 0 and isinstance(self.content[index - 1], str) and not self.content[index - 1].strip():
+            del self.content[index - 1]
+        self.modified = True
+
+
+    def child_indent(self):
+        """
+        Whitespace preceding this node's children, e.g. '\\n        '.
+        """
+        for (index, item) in enumerate(self.content):
+            if isinstance(item, Node) and index > 0 and isinstance(self.content[index - 1], str) \
+                and not self.content[index - 1].strip():
+                return self.content[index - 1]
+        return '\n        '
+
+
+    def append(self, child):
+        """
+        Append a child Node (or raw XML string, parsed with this node's
+        document) after the last child, on its own line.
+        """
+        if isinstance(child, str):
+            child = parse_fragment(child, self.tag.document)
+        if self.end is None:
+            # <x/> becomes <x>...</x>
+            raw = self.tag.raw
+            self.tag = Tag(raw[:-2].rstrip() + '>', self.tag.document)
+            self.end = Tag('</' + self.tag.name + '>', self.tag.document)
+            self.content = ['\n' + ' ' * 4]
+
+        indent = self.child_indent()
+        # Keep trailing whitespace before the end tag, e.g. '\n    '
+        if self.content and isinstance(self.content[-1], str) and not self.content[-1].strip():
+            self.content[-1:-1] = [indent, child]
+        else:
+            self.content.extend([indent, child])
+        self.modified = True
+
+
+def make_element(qname, attributes=None, text=None):
+    """
+    Raw XML for a simple element, e.g.
+    make_element('rdfs:label', {'xml:lang': 'en'}, 'apple')
+    """
+    attrs = ''.join(' %s="%s"' % (key, escape(value, True)) for (key, value) in (attributes or {}).items())
+    if text is None:
+        return '<%s%s/>' % (qname, attrs)
+    return '<%s%s>%s</%s>' % (qname, attrs, escape(text), qname)
+
+
+def tokenize(handle):
+    """
+    Generator of raw token strings read from a file handle in blocks.
+    """
+    buffer = ''
+    position = 0
+    eof = False
+    while True:
+        if not eof and len(buffer) - position < READ_SIZE:
+            block = handle.read(READ_SIZE)
+            if block:
+                buffer = buffer[position:] + block
+                position = 0
+            else:
+                eof = True
+
+        if position >= len(buffer):
+            return
+
+        match = TOKEN.match(buffer, position)
+        # A token running into the end of the buffer may be incomplete.
+        if not eof and (match is None or match.end() == len(buffer)):
+            block = handle.read(READ_SIZE)
+            if block:
+                buffer = buffer[position:] + block
+                position = 0
+                continue
+            eof = True
+            match = TOKEN.match(buffer, position)
+
+        if match is None:
+            raise ValueError('Unparseable XML near: ' + buffer[position:position + 80])
+
+        position = match.end()
+        yield match.group(0)
+
+
+def _parse_tokens(tokens, document):
+    """
+    Generator turning raw tokens into items at top level depth: strings for
+    anything outside an entity, Nodes for entities under the root element,
+    and the root's start and end Tags.
+    """
+    stack = [] # Nodes under construction; stack[0] is a top level entity
+    depth = 0  # 1 inside the root element
+
+    for raw in tokens:
+        if raw[0] != '<' or raw.startswith(('<!--', '<?', '<![CDATA[')):
+            if stack:
+                stack[-1].content.append(raw)
+            else:
+                yield raw
+            continue
+
+        if raw.startswith('<!DOCTYPE'):
+            for (name, value) in ENTITY_DECLARATION.findall(raw):
+                document.entities[name] = value
+            yield raw
+            continue
+
+        tag = Tag(raw, document)
+
+        if depth == 0:
+            # Root element: pick up its namespace declarations.
+            for match in ATTRIBUTE.finditer(raw):
+                (key, value) = (match.group(1), match.group(4))
+                if key.startswith('xmlns:'):
+                    document.namespaces[key[6:]] = value
+                elif key == 'xmlns':
+                    document.namespaces[''] = value
+            if tag.kind == 'start':
+                depth = 1
+            yield tag
+            continue
+
+        if tag.kind == 'end':
+            if not stack:
+                depth = 0
+                yield tag # Root end tag
+                continue
+            node = stack.pop()
+            node.end = tag
+            if stack:
+                stack[-1].content.append(node)
+            else:
+                yield node
+            continue
+
+        node = Node(tag)
+        if tag.kind == 'empty':
+            if stack:
+                stack[-1].content.append(node)
+            else:
+                yield node
+        else:
+            stack.append(node)
+
+
+def parse_fragment(raw, document=None):
+    """
+    Parse one raw XML element string into a Node.
+    """
+    document = document or Document()
+    # Parse as if it were an entity inside a root element.
+    items = list(_parse_tokens(['<fragment>'] + TOKEN.findall(raw) + ['</fragment>'], document))
+    return [item for item in items if isinstance(item, Node)][0]
+
+
+def iter_document(path, document=None):
+    """
+    Generator of the items of an RDF/XML file: raw strings and Tags outside
+    top level entities, and a Node per top level entity.
+    """
+    document = document or Document()
+    with open(path, 'r', encoding='utf-8', newline='') as handle:
+        yield from _parse_tokens(tokenize(handle), document)
+
+
+def iter_nodes(path):
+    """
+    Generator of the top level entity Nodes of an RDF/XML file.
+    """
+    for item in iter_document(path):
+        if isinstance(item, Node):
+            yield item
+
+
+def replace_file(tmp_path, path, mode_path=None):
+    """
+    Move a finished tmp_path over path, with the file mode of mode_path
+    (default: path) if that exists, so rewriting a file doesn't change its
+    permissions, otherwise with the usual mode of a new file.
+    """
+    mode_path = mode_path or path
+    if os.path.exists(mode_path):
+        shutil.copymode(mode_path, tmp_path)
+    else:
+        os.chmod(tmp_path, 0o666 & ~UMASK)
+    os.replace(tmp_path, path)
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode='w', **kwargs):
+    """
+    Open path for writing through a new temporary file beside it, which
+    replace_file() moves over path once the with block is done, so readers
+    never see a partial file.  Keyword arguments are passed to open().
+    """
+    (descriptor, tmp_path) = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+        dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with io.open(descriptor, mode, **kwargs) as handle:
+            yield handle
+        replace_file(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def rewrite_file(input_path, output_path, function=None, append=()):
+    """
+    Stream input_path to output_path, passing each top level entity Node
+    through function, which returns the Node (edited or not), a raw string
+    to write instead, or None to drop it.  Raw strings or Nodes in append
+    are written before the root end tag, each preceded by a blank line.
+    output_path may be input_path: it's only replaced once writing is done,
+    and only if something changed.
+    When function changes an entity's rdf:about, the OWLAPI
+    "<!-- IRI -->" comment before it is changed to match, and when it drops
+    the entity the comment goes too.  The output keeps input_path's file
+    mode.
+    Returns the number of entities changed, dropped or appended.
+    """
+    changes = 0
+    tmp_path = output_path + '.tmp'
+    with io.open(tmp_path, 'w', encoding='utf-8', newline='', buffering=READ_SIZE) as output_handle:
+        pending = '' # Whitespace not yet written, so a dropped entity can take its line with it.
+        comment = None # (offset, raw) of a comment held in pending: it may name the next entity
+        for item in iter_document(input_path):
+            if isinstance(item, str) and not item.strip():
+                pending += item
+                continue
+
+            if isinstance(item, Node) and function:
+                about = item.get('rdf:about')
+                named = comment is not None and about and comment[1][4:-3].strip() in (about, escape(about))
+                result = function(item)
+                if result is None:
+                    changes += 1
+                    if named:
+                        pending = pending[:comment[0]]
+                        comment = None
+                    if '\n' in pending:
+                        pending = pending[:pending.rfind('\n')]
+                    continue
+                if not isinstance(result, Node) or result.changed:
+                    changes += 1
+                if named and isinstance(result, Node) and result.get('rdf:about') != about:
+                    (before, raw) = comment
+                    pending = pending[:before] + '<!-- ' + escape(result.get('rdf:about')) + ' -->' + pending[before + len(raw):]
+                item = result
+
+            elif isinstance(item, str) and item.startswith('<!--') and function:
+                # Hold the comment back in case it names the next entity.
+                comment = (len(pending), item)
+                pending += item
+                continue
+
+            elif isinstance(item, Tag) and item.kind == 'end' and append:
+                pending = pending.rstrip(' \t\n')
+                for extra in append:
+                    pending += '\n\n    ' + str(extra)
+                    changes += 1
+                pending += '\n'
+
+            output_handle.write(pending)
+            output_handle.write(str(item))
+            pending = ''
+            comment = None
+
+        output_handle.write(pending)
+
+    if changes or os.path.abspath(output_path) != os.path.abspath(input_path):
+        replace_file(tmp_path, output_path, input_path)
+    else:
+        os.remove(tmp_path) # Leave an unchanged file untouched.
+    return changes
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def parse_class_expression(text, entity):
+    """
+    Parse a Manchester syntax class expression into tuples:
+
+        ('class', iri)  ('and', (...))  ('or', (...))  ('not', expr)
+        ('some' | 'only', property, expr)  ('value', property, individual)
+        ('min' | 'max' | 'exactly', property, n, expr or None)
+
+    entity(name) returns the IRI of a name token ('label', CURIE, <IRI>,
+    ...), or None if it's unknown.  Raises ExpressionError.
+    """
+    tokens = MANCHESTER_TOKEN.findall(text)
+    position = 0
+
+    def error(message):
+        return ExpressionError('%s in "%s"' % (message, text))
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        token = peek()
+        if token is None:
+            raise error('Unexpected end of expression')
+        position += 1
+        return token
+
+    def name():
+        token = take()
+        if token in ('(', ')') or token in MANCHESTER_KEYWORDS:
+            raise error('Unexpected "%s"' % token)
+        iri = entity(token)
+        if not iri:
+            raise error('Unknown label %s' % token)
+        return iri
+
+    def nary(operators, operand):
+        operands = [operand()]
+        while peek() in operators:
+            take()
+            operands.append(operand())
+        return operands[0] if len(operands) == 1 else (operators[0], tuple(operands))
+
+    def disjunction():
+        return nary(('or',), conjunction)
+
+    def conjunction():
+        return nary(('and', 'that'), primary)
+
+    def primary():
+        if peek() == 'not':
+            take()
+            return ('not', primary())
+        if peek() == '(':
+            take()
+            expression = disjunction()
+            if take() != ')':
+                raise error('Missing ")"')
+            return expression
+
+        iri = name()
+        keyword = peek()
+        if keyword in RESTRICTIONS:
+            take()
+            return (keyword, iri, primary())
+        if keyword == 'value':
+            take()
+            return ('value', iri, name())
+        if keyword in CARDINALITIES:
+            take()
+            count = take()
+            if not count.isdigit():
+                raise error('Expected a number after "%s"' % keyword)
+            filler = None
+            if peek() not in (None, ')', 'and', 'that', 'or'):
+                filler = primary()
+            return (keyword, iri, int(count), filler)
+        return ('class', iri)
+
+    expression = disjunction()
+    if peek() is not None:
+        raise error('Unexpected "%s"' % peek())
+    return expression
+
+
+def expression_key(expression):
+    """
+    OWL API order: named classes first by IRI, then anonymous expressions by
+    type.
+    """
+    if expression[0] == 'class':
+        return (0, expression[1])
+    return (EXPRESSION_ORDER[expression[0]], repr(expression))
+
+
+def write_expression(lines, expression, indent):
+    """
+    Append the RDF/XML lines of an anonymous class expression.
+    """
+    pad = ' ' * indent
+    kind = expression[0]
+
+    if kind in ('and', 'or'):
+        tag = 'owl:intersectionOf' if kind == 'and' else 'owl:unionOf'
+        lines.append(pad + '<owl:Class>')
+        lines.append(pad + '    <' + tag + ' rdf:parseType="Collection">')
+        for operand in sorted(expression[1], key=expression_key):
+            if operand[0] == 'class':
+                lines.append(pad + '        <rdf:Description rdf:about="' + escape(operand[1], True) + '"/>')
+            else:
+                write_expression(lines, operand, indent + 8)
+        lines.append(pad + '    </' + tag + '>')
+        lines.append(pad + '</owl:Class>')
+        return
+
+    if kind == 'not':
+        lines.append(pad + '<owl:Class>')
+        write_property(lines, 'owl:complementOf', expression[1], indent + 4)
+        lines.append(pad + '</owl:Class>')
+        return
+
+    lines.append(pad + '<owl:Restriction>')
+    lines.append(pad + '    <owl:onProperty rdf:resource="' + escape(expression[1], True) + '"/>')
+    if kind in RESTRICTIONS:
+        write_property(lines, RESTRICTIONS[kind], expression[2], indent + 4)
+    elif kind == 'value':
+        lines.append(pad + '    <owl:hasValue rdf:resource="' + escape(expression[2], True) + '"/>')
+    else:
+        (count, filler) = expression[2:]
+        tag = CARDINALITIES[kind]
+        if filler is None:
+            tag = tag.replace('Qualified', '').replace('qualifiedC', 'c')
+        datatype = PREFIXES['xsd'] + 'nonNegativeInteger'
+        lines.append(pad + '    <' + tag + ' rdf:datatype="' + datatype + '">' + str(count) + '</' + tag + '>')
+        if filler is not None:
+            write_property(lines, 'owl:onClass', filler, indent + 4)
+    lines.append(pad + '</owl:Restriction>')
+
+
+def write_property(lines, tag, expression, indent):
+    """
+    Append the RDF/XML lines of a tag element whose value is a class
+    expression: a resource for a named class, otherwise nested.
+    """
+    pad = ' ' * indent
+    if expression[0] == 'class':
+        lines.append(pad + '<' + tag + ' rdf:resource="' + escape(expression[1], True) + '"/>')
+    else:
+        lines.append(pad + '<' + tag + '>')
+        write_expression(lines, expression, indent + 4)
+        lines.append(pad + '</' + tag + '>')
+
+
+class Namespaces(object):
+    """
+    Prefixes for the qualified names of annotation property elements, made
+    up (ns1, ns2, ...) for namespaces without a known prefix.
+    """
+
+    def __init__(self, prefixes=PREFIXES):
+        self.prefixes = {}
+        for (prefix, namespace) in prefixes.items():
+            self.prefixes.setdefault(namespace, prefix)
+        self.used = {}
+
+    def qname(self, iri):
+        obo = PREFIXES['obo']
+        if iri.startswith(obo) and LOCAL_NAME.match(iri[len(obo):]):
+            (namespace, local) = (obo, iri[len(obo):])
+        else:
+            split = max(iri.rfind('#'), iri.rfind('/')) + 1
+            (namespace, local) = (iri[:split], iri[split:])
+            if not LOCAL_NAME.match(local):
+                raise ValueError('Can\'t write annotation property <%s> as RDF/XML' % iri)
+        return self.prefix(namespace) + ':' + local
+
+    def prefix(self, namespace):
+        prefix = self.prefixes.get(namespace)
+        if prefix is None:
+            prefix = 'ns%d' % (sum(1 for name in self.prefixes.values() if name.startswith('ns')) + 1)
+            self.prefixes[namespace] = prefix
+        self.used[prefix] = namespace
+        return prefix
+
+
+def header(namespaces, ontology_iri):
+    """
+    Lines opening an OWLAPI style RDF/XML document, declaring the prefixes
+    namespaces used.
+    """
+    lines = ['<?xml version="1.0"?>',
+        '<rdf:RDF xmlns="' + escape(ontology_iri, True) + '#"',
+        '     xml:base="' + escape(ontology_iri, True) + '"']
+    prefixes = HEADER_PREFIXES + sorted(prefix for prefix in namespaces.used if prefix not in HEADER_PREFIXES)
+    for prefix in prefixes:
+        namespace = namespaces.used.get(prefix, PREFIXES.get(prefix))
+        lines.append('     xmlns:' + prefix + '="' + escape(namespace, True) + '"')
+    lines[-1] += '>'
+    lines.extend(['    <owl:Ontology rdf:about="' + escape(ontology_iri, True) + '"/>', '    ', '', ''])
+    return lines
+
+
+def section(title):
+    """
+    Lines of an OWLAPI section banner, e.g. section('Classes').
+    """
+    return ['    <!-- ', '    ' + SECTION_RULE, '    //', '    // ' + title, '    //',
+        '    ' + SECTION_RULE, '     -->', '', '    ', '', '']
+
+
+def declaration(lines, tag, iri):
+    """
+    Append the OWLAPI lines declaring iri, e.g. as an owl:Class.
+    """
+    lines.extend(['    <!-- ' + escape(iri) + ' -->', '',
+        '    <' + tag + ' rdf:about="' + escape(iri, True) + '"/>', '    ', '', ''])
@@ -0,0 +1,710 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_robot_template.py
+Project: FoodOn
+
+Compile the ROBOT templates in imports/robot/ into their robot_*.owl import
+files without starting a JVM.  Labels in the templates, e.g.
+
+    'pome fruit' and 'derives from' some 'Malus domestica'
+
+are resolved against the labels defined by the template rows themselves, then
+the foodon-labels.tsv label index (see util_labels.py), then the --input OWL
+files: by default foodon-merged.owl if it has been made, otherwise
+imports/*.owl ("make robot_templates" gives foodon-edit.owl and the OntoFox
+imports).  Every template is compiled by its own worker process.
+
+Run from the src/ontology/ folder:
+
+    python util_robot_template.py
+        compiles every template listed in TEMPLATES below
+    python util_robot_template.py imports/robot/wine.tsv [-o out.owl] [-i imports/ro_import.owl]
+
+As in ROBOT, the first row of a template holds column names, the second the
+template strings, and the rest one entity per row.  The directives these
+files use are supported:
+
+    ID, LABEL, CLASS_TYPE (subclass or equivalent)
+    A prop, AL prop@lang, AT prop^^datatype, AI prop   annotations
+    SC %, EC %, C %                                    class expressions
+    SPLIT=|                                            many values per cell
+
+A % cell that names a single entity (by label, CURIE or IRI) is substituted
+as that entity; anything else is read as a Manchester syntax expression of
+'quoted labels', CURIEs and <IRI>s.  Output is RDF/XML laid out as the OWL
+API writes it.  Unknown directives are reported and skipped; unresolvable
+labels are errors, reported per row, and the template's output isn't
+written.
+
+Rebuilds are incremental: each row's compiled axioms and annotations are
+kept in .robot_template_state.json by a hash of the row and its column
+templates, so after an edit only changed rows are compiled again, then
+every row's axioms are laid out together exactly as a full build (--full)
+would write them.  An output that would come out the same isn't rewritten.
+The cache is dropped when this script, foodon-labels.tsv or an --input file
+changes, and a cached row is compiled again if a label it used now names a
+different template row.
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sys
+
+from util_annotations import iter_annotations, LABEL
+from util_labels import ONTOLOGY_DIR, open_label_index
+from util_rdfxml import PREFIXES, ExpressionError, Namespaces, atomic_write, declaration, escape, expression_key, \
+    header, parse_class_expression, section, write_property
+
+# (template, ontology IRI, output), relative to ONTOLOGY_DIR; see imports/robot/README.md
+TEMPLATES = [
+    ('imports/robot/wine.tsv', 'http://purl.obolibrary.org/obo/foodon/imports/robot_wine.owl', 'imports/robot_wine.owl'),
+    ('imports/robot/pasta.tsv', 'http://purl.obolibrary.org/obo/foodon/imports/robot_pasta.owl', 'imports/robot_pasta.owl'),
+    ('imports/robot/fdc.tsv', 'http://purl.obolibrary.org/obo/foodon/imports/robot_fdc.owl', 'imports/robot_fdc.owl'),
+    ('imports/robot/organismal_materials.tsv', 'http://purl.obolibrary.org/obo/foodon/imports/robot_organismal_materials.owl', 'imports/robot_organismal_materials.owl'),
+    ('imports/robot/process.tsv', 'http://purl.obolibrary.org/obo/foodon/imports/robot_process_import.owl', 'imports/robot_process_import.owl')
+]
+
+# ROBOT's prefixes: dc is Dublin Core terms there, not elements.
+TEMPLATE_PREFIXES = dict(PREFIXES)
+TEMPLATE_PREFIXES.update({
+    'dc': 'http://purl.org/dc/terms/',
+    'schema': 'http://schema.org/'
+})
+
+OBO = PREFIXES['obo']
+XSD_STRING = PREFIXES['xsd'] + 'string'
+
+ANNOTATION = re.compile(r'^(A|AL|AT|AI)\s+(.+?)(?:\s+SPLIT=(\S+))?$')
+EXPRESSION = re.compile(r'^(SC|EC|C)\s+(.+?)(?:\s+SPLIT=(\S+))?$')
+CURIE = re.compile(r'^([A-Za-z_][\w.-]*):(\S*)$')
+
+STATE_PATH = os.path.join(ONTOLOGY_DIR, '.robot_template_state.json')
+STATE_VERSION = 1
+
+# Annotation properties built into OWL, which the OWL API doesn't declare.
+BUILT_IN_ANNOTATIONS = frozenset(PREFIXES['rdfs'] + name for name in ('label', 'comment', 'seeAlso', 'isDefinedBy')) \
+    | frozenset(PREFIXES['owl'] + name for name in ('deprecated', 'versionInfo', 'priorVersion', 'backwardCompatibleWith', 'incompatibleWith'))
+
+
+class TemplateError(ValueError):
+    pass
+
+
+def expand(name, prefixes=TEMPLATE_PREFIXES):
+    """
+    Return the IRI of a CURIE or <IRI>, or None if name is neither.  Unknown
+    CURIE prefixes are taken to be OBO ontologies, e.g. FOODON:03301014.
+    """
+    if name.startswith('<') and name.endswith('>'):
+        return name[1:-1]
+    if name.startswith('http://') or name.startswith('https://'):
+        return name
+    match = CURIE.match(name)
+    if not match:
+        return None
+    (prefix, local) = match.groups()
+    if prefix in prefixes:
+        return prefixes[prefix] + local
+    return OBO + prefix + '_' + local
+
+
+def id_iri(name):
+    """
+    Return the IRI of a template ID: a CURIE or IRI, otherwise, as in ROBOT,
+    the ID itself taken as a relative IRI.  None for text with spaces.
+    """
+    name = name.strip()
+    if not name or re.search(r'\s', name):
+        return None
+    return expand(name) or name
+
+
+class Resolver(object):
+    """
+    Label -> IRI lookup: labels defined by the templates, then the label
+    index, then labels read from the --input OWL files, which are only
+    scanned once a label is missing from the others.
+
+    While lookups is a dict, each label looked up is recorded in it with
+    its IRI among the template labels (or None), for the row cache.
+    """
+
+    def __init__(self, label_index, labels=None, input_paths=()):
+        self.label_index = label_index
+        self.labels = labels or {} # lowercase label -> IRI
+        self.input_paths = input_paths
+        self.fallback = None       # lowercase label -> IRI, once scanned
+        self.lookups = None
+
+    def resolve(self, label):
+        label = label.strip()
+        key = label.lower()
+        iri = self.labels.get(key)
+        if self.lookups is not None:
+            self.lookups[key] = iri
+        if iri:
+            return iri
+        iris = self.label_index.get_iris(label) if self.label_index else []
+        for (index_label, iri) in ((self.label_index.get_label(iri), iri) for iri in iris):
+            if index_label == label:
+                return iri
+        if iris:
+            return iris[0]
+
+        if self.fallback is None:
+            self.fallback = {}
+            for input_path in self.input_paths:
+                for (iri, prop, text, language) in iter_annotations(input_path, (LABEL,)):
+                    self.fallback.setdefault(text.strip().lower(), iri)
+        return self.fallback.get(key)
+
+    def entity(self, name):
+        """
+        IRI of a single entity given by 'label', label, <IRI> or CURIE, or
+        None.  A label wins over a CURIE it happens to look like.
+        """
+        name = name.strip()
+        if len(name) > 1 and name[0] == name[-1] == "'" and "'" not in name[1:-1]:
+            return self.resolve(name[1:-1])
+        if name.startswith('<') and name.endswith('>'):
+            return name[1:-1]
+        return self.resolve(name) or expand(name)
+
+
+class Column(object):
+    """
+    One parsed template string.  kind is 'ID', 'LABEL', 'CLASS_TYPE', an
+    annotation directive ('A', 'AL', 'AT', 'AI') or an expression directive
+    ('SC', 'EC', 'C').
+    """
+
+    def __init__(self, kind, prop=None, qualifier=None, expression=None, split=None):
+        self.kind = kind
+        self.prop = prop            # annotation property IRI
+        self.qualifier = qualifier  # AL language or AT datatype IRI
+        self.expression = expression
+        self.split = split
+
+    def values(self, cell):
+        cell = cell.strip()
+        if not cell:
+            return []
+        if not self.split:
+            return [cell]
+        return [value.strip() for value in cell.split(self.split) if value.strip()]
+
+
+def parse_column(template, resolver):
+    """
+    Return the Column for a template string, or None if the column is to be
+    ignored.  Raises TemplateError for directives this compiler can't handle.
+    """
+    template = template.strip()
+    if not template:
+        return None
+    if template in ('ID', 'LABEL', 'CLASS_TYPE'):
+        return Column(template)
+    if template == 'TYPE':
+        return None # Everything compiled here is an owl:Class.
+
+    match = ANNOTATION.match(template)
+    if match:
+        (kind, prop, split) = match.groups()
+        qualifier = None
+        if kind == 'A' and '@' in prop:
+            # "A IAO:0000115@en" is meant as AL; ROBOT makes a property of it.
+            kind = 'AL'
+        if kind == 'AL':
+            (prop, qualifier) = prop.rsplit('@', 1)
+            qualifier = qualifier.lower()
+        elif kind == 'AT':
+            (prop, datatype) = prop.rsplit('^^', 1)
+            qualifier = expand(datatype)
+        prop_iri = expand(prop) if CURIE.match(prop) or prop.startswith('<') else resolver.resolve(prop)
+        if not prop_iri:
+            raise TemplateError('Unknown annotation property "%s" in template "%s"' % (prop, template))
+        return Column(kind, prop_iri, qualifier, split=split)
+
+    match = EXPRESSION.match(template)
+    if match:
+        (kind, expression, split) = match.groups()
+        return Column(kind, expression=expression, split=split)
+
+    raise TemplateError('Unsupported template "%s"' % template)
+
+
+class Entity(object):
+
+    def __init__(self, iri):
+        self.iri = iri
+        self.equivalents = []
+        self.superclasses = []
+        self.annotations = [] # (property IRI, kind, value, language or datatype IRI)
+
+
+class Compilation(object):
+    """
+    The entities compiled from one template, plus the properties and
+    classes their axioms refer to.  Rows are added as the records made by
+    compile_row(), fresh or from the row cache.
+    """
+
+    def __init__(self):
+        self.entities = {}
+        self.classes = set()
+        self.object_properties = set()
+        self.annotation_properties = set()
+        self.individuals = set()
+        self.errors = []
+
+    def add(self, record, line):
+        for error in record['errors']:
+            self.errors.append('Row %d: %s' % (line, error))
+        if not record['iri']:
+            return
+
+        entity = self.entities.setdefault(record['iri'], Entity(record['iri']))
+        for (axioms, expressions) in ((entity.equivalents, record['equivalents']),
+            (entity.superclasses, record['superclasses'])):
+            for expression in expressions:
+                self.collect(expression)
+                if expression not in axioms:
+                    axioms.append(expression)
+        for annotation in record['annotations']:
+            entity.annotations.append(annotation)
+            if annotation[0] not in BUILT_IN_ANNOTATIONS:
+                self.annotation_properties.add(annotation[0])
+
+    def collect(self, expression):
+        kind = expression[0]
+        if kind == 'class':
+            self.classes.add(expression[1])
+        elif kind in ('and', 'or'):
+            for operand in expression[1]:
+                self.collect(operand)
+        elif kind == 'not':
+            self.collect(expression[1])
+        elif kind == 'value':
+            self.object_properties.add(expression[1])
+            self.individuals.add(expression[2])
+        else:
+            self.object_properties.add(expression[1])
+            if expression[-1] is not None:
+                self.collect(expression[-1])
+
+
+def compile_row(columns, row, resolver):
+    """
+    Return the record of one template row:
+
+        {'iri': entity IRI, 'equivalents': [expression, ...],
+         'superclasses': [expression, ...],
+         'annotations': [(property IRI, kind, value, language or datatype IRI), ...],
+         'errors': [message, ...]}
+
+    or None for a row without an ID.
+    """
+    id_column = next((number for (number, column) in enumerate(columns) if column and column.kind == 'ID'), 0)
+    if id_column >= len(row) or not row[id_column].strip():
+        return None
+
+    record = {'iri': id_iri(row[id_column]), 'equivalents': [], 'superclasses': [], 'annotations': [], 'errors': []}
+    if not record['iri']:
+        record['errors'].append('unknown ID "%s"' % row[id_column].strip())
+        return record
+
+    class_type = 'subclass'
+    for (column, cell) in zip(columns, row):
+        if column and column.kind == 'CLASS_TYPE' and cell.strip():
+            class_type = cell.strip().lower()
+
+    for (column, cell) in zip(columns, row):
+        if column is None or column.kind in ('ID', 'CLASS_TYPE'):
+            continue
+        for value in column.values(cell):
+            try:
+                compile_value(record, column, value, class_type, resolver)
+            except (TemplateError, ExpressionError) as e:
+                record['errors'].append(str(e))
+    return record
+
+
+def compile_value(record, column, value, class_type, resolver):
+    if column.kind == 'LABEL':
+        record['annotations'].append((PREFIXES['rdfs'] + 'label', 'A', value, XSD_STRING))
+        return
+
+    if column.kind in ('A', 'AL', 'AT', 'AI'):
+        qualifier = column.qualifier
+        if column.kind == 'A':
+            qualifier = XSD_STRING
+        elif column.kind == 'AI':
+            value = expand(value) or value
+        record['annotations'].append((column.prop, column.kind, value, qualifier))
+        return
+
+    single = resolver.entity(value)
+    if single:
+        value = '<' + single + '>'
+    elif "'" not in value and '<' not in value:
+        # Plain text is always meant as a label, as in ROBOT.
+        raise TemplateError('Unknown label "%s"' % value)
+    expression = parse_class_expression(column.expression.replace('%', value), resolver.entity)
+
+    if column.kind == 'EC' or (column.kind == 'C' and class_type == 'equivalent'):
+        record['equivalents'].append(expression)
+    else:
+        record['superclasses'].append(expression)
+
+
+def write_annotation(lines, namespaces, annotation):
+    (prop, kind, value, qualifier) = annotation
+    qname = namespaces.qname(prop)
+    if kind == 'AI':
+        lines.append('        <' + qname + ' rdf:resource="' + escape(value, True) + '"/>')
+        return
+    if kind == 'AL':
+        attribute = ' xml:lang="' + escape(qualifier, True) + '"'
+    else:
+        attribute = ' rdf:datatype="' + escape(qualifier, True) + '"'
+    text = escape(value).replace('"', '&quot;').replace("'", '&apos;')
+    lines.append('        <' + qname + attribute + '>' + text + '</' + qname + '>')
+
+
+def serialize(compilation, ontology_iri):
+    """
+    Return the RDF/XML text of a compiled template.
+    """
+    namespaces = Namespaces(TEMPLATE_PREFIXES)
+    body = []
+
+    if compilation.annotation_properties:
+        body.extend(section('Annotation properties'))
+        for iri in sorted(compilation.annotation_properties):
+            declaration(body, 'owl:AnnotationProperty', iri)
+
+    if compilation.object_properties:
+        body.extend(section('Object Properties'))
+        for iri in sorted(compilation.object_properties):
+            declaration(body, 'owl:ObjectProperty', iri)
+
+    classes = compilation.classes | set(compilation.entities)
+    if classes:
+        body.extend(section('Classes'))
+        for iri in sorted(classes):
+            entity = compilation.entities.get(iri)
+            if entity is None or not (entity.equivalents or entity.superclasses or entity.annotations):
+                declaration(body, 'owl:Class', iri)
+                continue
+
+            body.extend(['    <!-- ' + escape(iri) + ' -->', '',
+                '    <owl:Class rdf:about="' + escape(iri, True) + '">'])
+            for expression in sorted(entity.equivalents, key=expression_key):
+                write_property(body, 'owl:equivalentClass', expression, 8)
+            for expression in sorted(entity.superclasses, key=expression_key):
+                write_property(body, 'rdfs:subClassOf', expression, 8)
+            for annotation in sorted(set(entity.annotations)):
+                write_annotation(body, namespaces, annotation)
+            body.extend(['    </owl:Class>', '    ', '', ''])
+
+    if compilation.individuals:
+        body.extend(section('Individuals'))
+        for iri in sorted(compilation.individuals):
+            declaration(body, 'owl:NamedIndividual', iri)
+
+    # Drop the spacing after the last entity.
+    while body and body[-1].strip() == '':
+        body.pop()
+
+    return '\n'.join(header(namespaces, ontology_iri) + body
+        + ['</rdf:RDF>', '', '', '', '<!-- Generated by util_robot_template.py -->', ''])
+
+
+def read_template(template_path):
+    """
+    Return (headers, templates, [(line number, row), ...]) of a TSV template.
+    """
+    with open(template_path, 'r', newline='', encoding='utf-8') as handle:
+        rows = list(csv.reader(handle, delimiter='\t'))
+    if len(rows) < 2:
+        raise TemplateError('Template %s needs a header row and a template row' % template_path)
+    return (rows[0], rows[1], [(number + 3, row) for (number, row) in enumerate(rows[2:])])
+
+
+def template_labels(template_path):
+    """
+    Generator of (label, IRI) for the rows of a template with an ID and a
+    label column.
+    """
+    (headers, templates, rows) = read_template(template_path)
+    templates = [template.strip() for template in templates]
+    id_column = templates.index('ID') if 'ID' in templates else 0
+    label_columns = [number for (number, template) in enumerate(templates)
+        if template == 'LABEL' or re.match(r'^AL?\s+rdfs:label\b', template)]
+    for (line, row) in rows:
+        iri = id_iri(row[id_column]) if id_column < len(row) else None
+        if not iri:
+            continue
+        for number in label_columns:
+            if number < len(row) and row[number].strip():
+                yield (row[number].strip(), iri)
+
+
+def column_signature(columns):
+    """
+    What a row's record depends on besides its cells and labels.
+    """
+    return [column and [column.kind, column.prop, column.qualifier, column.expression, column.split]
+        for column in columns]
+
+
+def row_key(signature, row):
+    return hashlib.sha256(json.dumps([signature, row]).encode('utf-8')).hexdigest()
+
+
+def as_tuples(value):
+    if isinstance(value, list):
+        return tuple(as_tuples(item) for item in value)
+    return value
+
+
+def cached_record(record, resolver):
+    """
+    Return a cached row record restored from JSON, or None if a label it
+    looked up now resolves differently among the template labels.  (The
+    label index and --input files are covered by the cache context.)
+    """
+    for (label, iri) in record['labels'].items():
+        if resolver.labels.get(label) != iri:
+            return None
+    return dict(record, **{name: list(as_tuples(record[name]))
+        for name in ('equivalents', 'superclasses', 'annotations')})
+
+
+def compile_template(template_path, resolver, cache=None):
+    """
+    Return (Compilation, row cache, rows reused) for one template.  Rows
+    whose key is in cache (row key -> record) and whose labels still resolve
+    the same are reused rather than compiled again.  The returned row cache
+    holds every current row that compiled without errors.
+    """
+    (headers, templates, rows) = read_template(template_path)
+    compilation = Compilation()
+
+    columns = []
+    for (number, template) in enumerate(templates):
+        try:
+            columns.append(parse_column(template, resolver))
+        except TemplateError as e:
+            name = headers[number] if number < len(headers) else str(number + 1)
+            print('%s: skipping column "%s": %s' % (template_path, name, e), file=sys.stderr)
+            columns.append(None)
+
+    if not any(column and column.kind == 'ID' for column in columns):
+        print('%s: no ID column; using the first column.' % template_path, file=sys.stderr)
+
+    signature = column_signature(columns)
+    cache = cache or {}
+    row_cache = {}
+    reused = 0
+    for (line, row) in rows:
+        key = row_key(signature, row)
+        record = cache.get(key)
+        if record is not None:
+            record = cached_record(record, resolver)
+        if record is not None:
+            reused += 1
+        else:
+            resolver.lookups = {}
+            record = compile_row(columns, row, resolver)
+            if record is None:
+                continue
+            record['labels'] = resolver.lookups
+            resolver.lookups = None
+
+        if not record['errors']:
+            row_cache[key] = record
+        compilation.add(record, line)
+
+    return (compilation, row_cache, reused)
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_context(input_paths):
+    """
+    Digest of everything outside the templates that row records depend on:
+    this code, the label index TSV and the --input files.
+    """
+    digest = hashlib.sha256(str(STATE_VERSION).encode('utf-8'))
+    for file_path in [__file__, os.path.join(ONTOLOGY_DIR, 'foodon-labels.tsv')] + list(input_paths):
+        if os.path.exists(file_path):
+            digest.update(file_digest(file_path).encode('utf-8'))
+    return digest.hexdigest()
+
+
+#
+# Row cache: {
+#   "version": 1,
+#   "context": cache_context() of the run that wrote it,
+#   "templates": {template path: {row key: record, ...}, ...}
+# }
+#
+def load_state(state_path):
+    if state_path and os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as handle:
+            state = json.load(handle)
+        if state.get('version') == STATE_VERSION:
+            return state
+    return {'version': STATE_VERSION, 'context': None, 'templates': {}}
+
+
+def save_state(state_path, state):
+    with atomic_write(state_path, encoding='utf-8') as handle:
+        json.dump(state, handle, sort_keys=True)
+
+
+# Each worker process shares one Resolver.
+_resolver = None
+
+
+def _init_worker(labels, input_paths):
+    global _resolver
+    label_index = open_label_index(os.path.join(ONTOLOGY_DIR, 'foodon-labels.idx'),
+        os.path.join(ONTOLOGY_DIR, 'foodon-labels.tsv'))
+    _resolver = Resolver(label_index, labels, input_paths)
+
+
+def _compile(job):
+    """
+    Compile and write one (template, ontology IRI, output, row cache) job.
+    Returns (template, output, entity count, errors, row cache, rows reused,
+    written); nothing is written when there are errors, or when the output
+    is already exactly what would be written.
+    """
+    (template_path, ontology_iri, output_path, cache) = job
+    try:
+        (compilation, row_cache, reused) = compile_template(template_path, _resolver, cache)
+    except (OSError, TemplateError) as e:
+        return (template_path, output_path, 0, [str(e)], {}, 0, False)
+    if compilation.errors:
+        return (template_path, output_path, len(compilation.entities), compilation.errors, row_cache, reused, False)
+
+    text = serialize(compilation, ontology_iri).encode('utf-8')
+    if os.path.exists(output_path) and file_digest(output_path) == hashlib.sha256(text).hexdigest():
+        return (template_path, output_path, len(compilation.entities), [], row_cache, reused, False)
+
+    with atomic_write(output_path, 'wb') as handle:
+        handle.write(text)
+    return (template_path, output_path, len(compilation.entities), [], row_cache, reused, True)
+
+
+def compile_templates(jobs, input_paths=(), processes=None, state_path=STATE_PATH, full=False):
+    """
+    Compile [(template, ontology IRI, output), ...] in parallel, reusing
+    unchanged rows from the row cache at state_path unless full.  Returns
+    the number of templates that failed.
+    """
+    # Labels from the templates are gathered once up front, so a template
+    # can refer to a class another template defines.
+    labels = {}
+    for (template_path, ontology_iri, output_path) in jobs:
+        for (label, iri) in template_labels(template_path):
+            labels.setdefault(label.lower(), iri)
+
+    state = load_state(state_path)
+    context = cache_context(input_paths)
+    if full or state['context'] != context:
+        state['templates'] = {}
+    state['context'] = context
+
+    failures = 0
+    tasks = [job + (state['templates'].get(os.path.abspath(job[0])),) for job in jobs]
+    with multiprocessing.Pool(min(processes or multiprocessing.cpu_count(), len(jobs)),
+        _init_worker, (labels, list(input_paths))) as pool:
+        for (template_path, output_path, count, errors, row_cache, reused, written) in pool.imap_unordered(_compile, tasks):
+            state['templates'][os.path.abspath(template_path)] = row_cache
+            if errors:
+                failures += 1
+                print('%s: %d errors, %s not written:' % (template_path, len(errors), output_path), file=sys.stderr)
+                for error in errors:
+                    print('  ' + error, file=sys.stderr)
+            elif written:
+                print('Compiled', template_path, 'into', output_path + ':', count, 'classes,', reused, 'rows reused.')
+            else:
+                print('Up to date:', output_path)
+
+    if state_path:
+        save_state(state_path, state)
+    return failures
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Compile ROBOT templates into OWL without ROBOT.')
+    parser.add_argument('templates', nargs='*',
+        help='.tsv templates to compile (default: all of imports/robot/ listed in TEMPLATES)')
+    parser.add_argument('-o', '--output', type=str, required=False,
+        help='Output .owl file, for a single template')
+    parser.add_argument('-O', '--ontology-iri', type=str, required=False,
+        help='Ontology IRI, for a single template')
+    parser.add_argument('-i', '--input', nargs='+', required=False, default=[],
+        help='OWL files to read more labels from (default: foodon-merged.owl if made, else imports/*.owl)')
+    parser.add_argument('-j', '--jobs', type=int, required=False,
+        help='Templates compiled in parallel (default: one per CPU)')
+    parser.add_argument('-s', '--state', type=str, required=False, default=STATE_PATH,
+        help='Row cache file (default: .robot_template_state.json)')
+    parser.add_argument('-f', '--full', action='store_true',
+        help='Compile every row, ignoring the row cache')
+    args = parser.parse_args()
+
+    if args.templates:
+        if len(args.templates) > 1 and (args.output or args.ontology_iri):
+            sys.exit('--output and --ontology-iri need a single template.')
+        jobs = []
+        for template_path in args.templates:
+            name = os.path.splitext(os.path.basename(template_path))[0]
+            output_path = args.output or os.path.join(os.path.dirname(template_path), '..', 'robot_' + name + '.owl')
+            ontology_iri = args.ontology_iri or 'http://purl.obolibrary.org/obo/foodon/imports/robot_' + name + '.owl'
+            jobs.append((template_path, ontology_iri, output_path))
+    else:
+        jobs = [tuple(os.path.join(ONTOLOGY_DIR, part) if number != 1 else part for (number, part) in enumerate(job))
+            for job in TEMPLATES]
+
+    for (template_path, ontology_iri, output_path) in jobs:
+        if not os.path.exists(template_path):
+            sys.exit('Unable to locate template: ' + template_path)
+    input_paths = args.input
+    if not input_paths:
+        merged = os.path.join(ONTOLOGY_DIR, 'foodon-merged.owl')
+        if os.path.exists(merged):
+            input_paths = [merged]
+        else:
+            # Not the outputs themselves, which would invalidate the row cache on every run.
+            outputs = {os.path.abspath(output_path) for (template_path, ontology_iri, output_path) in jobs}
+            input_paths = [input_path for input_path in sorted(glob.glob(os.path.join(ONTOLOGY_DIR, 'imports', '*.owl')))
+                if os.path.abspath(input_path) not in outputs]
+    for input_path in input_paths:
+        if not os.path.exists(input_path):
+            sys.exit('Unable to locate ontology file: ' + input_path)
+
+    if compile_templates(jobs, input_paths, args.jobs, args.state, args.full):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,512 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_subclass_closure.py
+Project: FoodOn
+
+Precomputed transitive closure of the asserted subclass hierarchy, so
+scripts and dashboards get descendant sets and counts from a memory-mapped
+file rather than running rdfs:subClassOf+ SPARQL queries over
+foodon-merged.owl.  It answers what owl_get_subdomains.sparql and
+owl_get_mushroom.sparql ask, which remain for use in Protege or with
+"robot query":
+
+    from util_subclass_closure import open_subclass_closure
+    closure = open_subclass_closure()
+    closure.count('http://purl.obolibrary.org/obo/FOODON_03411041')
+    closure.descendants('http://purl.obolibrary.org/obo/FOODON_00002381')
+    closure.is_subclass(iri, 'http://purl.obolibrary.org/obo/FOODON_00001287')
+
+Run from the src/ontology/ folder:
+
+    python util_subclass_closure.py                     # counts per SUBDOMAINS root
+    python util_subclass_closure.py FOODON_00002381 OBI_0100026
+    python util_subclass_closure.py FOODON_00001287 --lineage
+                                                        # ancestors and descendants, labelled
+    python util_subclass_closure.py --rebuild [-i foodon-merged.owl ...]
+
+The hierarchy is read from foodon-merged.owl if it has been made, otherwise
+from foodon.owl and its imports, with util_annotations.iter_subclass_edges():
+named superclasses, plus the named classes of an owl:intersectionOf a class
+is a subclass or equivalent of.  The SPARQL queries follow only
+rdfs:subClassOf, so their counts can be lower; build with --no-intersections
+to match them.  open_subclass_closure() rebuilds the file whenever it is
+older than its ontology files.
+
+Each class is numbered in post order along a spanning forest of the
+hierarchy, so that a class's descendants in that tree are one interval of
+numbers.  Descendants reached through its other subclasses' further parents
+add more intervals; a class's descendants are the union of its intervals,
+merged where they touch, and counting them is just adding interval lengths.
+Classes in a subclass cycle share their intervals.
+
+File layout; every number is a native-order unsigned 32 bit integer:
+
+    header          MAGIC, byte order mark, FORMAT_VERSION, class count,
+                    interval count, parent count
+    string_offsets  class count + 1 offsets into string data
+    class_rank      post order number of each class
+    rank_class      class id of each post order number
+    interval_start  class count + 1; intervals of class i are
+                    interval_start[i] .. interval_start[i+1] - 1
+    interval_low    first post order number of each interval
+    interval_high   last post order number of each interval
+    parent_start    class count + 1, indexing parent_id as above
+    parent_id       class ids of each class's asserted parents
+    string data     UTF-8 bytes of the class IRIs
+
+Class ids are positions in the IRIs sorted by their UTF-8 bytes, so an IRI's
+id is found by binary search.
+"""
+
+import argparse
+import array
+import bisect
+import multiprocessing
+import mmap
+import os
+import sys
+import time
+
+from util_annotations import iter_subclass_edges
+from util_label_extract import CATALOG_PATH, DEFAULT_INPUT, import_closure, read_catalog
+from util_labels import INDEX_PATH, LABELS_PATH, ONTOLOGY_DIR, open_label_index
+from util_rdfxml import atomic_write
+
+CLOSURE_PATH = os.path.join(ONTOLOGY_DIR, 'foodon-closure.idx')
+MERGED_PATH = os.path.join(ONTOLOGY_DIR, 'foodon-merged.owl')
+
+MAGIC = b'FOODONSC'
+BYTE_ORDER_MARK = 0x01020304
+FORMAT_VERSION = 1
+HEADER_INTS = 6 # after MAGIC
+
+OBO = 'http://purl.obolibrary.org/obo/'
+
+# The roots owl_get_subdomains.sparql counts descendants of.
+SUBDOMAINS = [
+    (OBO + 'FOODON_03411041', 'Chemical food component'),
+    (OBO + 'OBI_0100026', 'Organism (NCBI taxonomy)'),
+    (OBO + 'FOODON_03411564', 'Food product organismal source'),
+    (OBO + 'FOODON_03420116', 'Part of organism (anatomy)'),
+    (OBO + 'FOODON_00002381', 'Food product by organism (~single component food)'),
+    (OBO + 'FOODON_00002501', 'Multi-component food product'),
+    (OBO + 'FOODON_00002451', 'Food transformation process'),
+    (OBO + 'FOODON_00003368', 'Food contact material'),
+    (OBO + 'FOODON_03400361', 'Agency food product type')
+]
+
+_closure_cache = {}
+
+
+def default_ontology_paths():
+    """
+    foodon-merged.owl if it has been made, otherwise foodon.owl and the
+    local files it imports, or [] if there is neither.
+    """
+    if os.path.exists(MERGED_PATH):
+        return [MERGED_PATH]
+    if os.path.exists(DEFAULT_INPUT):
+        catalog = read_catalog(CATALOG_PATH) if os.path.exists(CATALOG_PATH) else {}
+        return import_closure([DEFAULT_INPUT], catalog)[0]
+    return []
+
+
+def read_edges(job):
+    (path, intersections) = job
+    return list(iter_subclass_edges(path, intersections))
+
+
+def merge_intervals(spans):
+    """
+    Sorted, disjoint (low, high) intervals covering spans, joining those that
+    overlap or touch.
+    """
+    merged = []
+    for (low, high) in sorted(spans):
+        if merged and low <= merged[-1][1] + 1:
+            if high > merged[-1][1]:
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append((low, high))
+    return merged
+
+
+def build_closure(edges, closure_path=CLOSURE_PATH):
+    """
+    Write a closure file from an iterable of (IRI, parent IRI) edges.
+    """
+    parents = {}
+    for (iri, parent) in edges:
+        parents.setdefault(parent, [])
+        if parent != iri and parent not in parents.setdefault(iri, []):
+            parents[iri].append(parent)
+
+    iris = sorted(parents, key=lambda iri: iri.encode('utf-8'))
+    ids = {iri: i for (i, iri) in enumerate(iris)}
+    count = len(iris)
+    parent_ids = [sorted(ids[parent] for parent in parents[iri]) for iri in iris]
+    children = [[] for i in range(count)]
+    for (child, class_parents) in enumerate(parent_ids):
+        for parent in class_parents:
+            children[parent].append(child)
+
+    # Post order numbers along a spanning forest, from the roots first so
+    # that the trees are as large as possible.
+    rank = [-1] * count
+    first = [0] * count # smallest number in the class's tree
+    rank_class = []
+    roots = [i for i in range(count) if not parent_ids[i]]
+    for start in roots + list(range(count)):
+        if rank[start] != -1:
+            continue
+        rank[start] = -2 # visiting
+        first[start] = len(rank_class)
+        pending = [(start, 0)]
+        while pending:
+            (node, position) = pending[-1]
+            if position < len(children[node]):
+                pending[-1] = (node, position + 1)
+                child = children[node][position]
+                if rank[child] == -1:
+                    rank[child] = -2
+                    first[child] = len(rank_class)
+                    pending.append((child, 0))
+                continue
+            pending.pop()
+            rank[node] = len(rank_class)
+            rank_class.append(node)
+
+    # Tarjan's strongly connected components come out children first, so
+    # each class's intervals are made from its children's.
+    intervals = [None] * count
+    order = [-1] * count
+    lowlink = [0] * count
+    on_stack = [False] * count
+    stack = []
+    counter = 0
+    for start in range(count):
+        if order[start] != -1:
+            continue
+        pending = [(start, 0)]
+        while pending:
+            (node, position) = pending[-1]
+            if position == 0 and order[node] == -1:
+                order[node] = lowlink[node] = counter
+                counter += 1
+                stack.append(node)
+                on_stack[node] = True
+            if position < len(children[node]):
+                pending[-1] = (node, position + 1)
+                child = children[node][position]
+                if order[child] == -1:
+                    pending.append((child, 0))
+                elif on_stack[child]:
+                    lowlink[node] = min(lowlink[node], order[child])
+                continue
+            pending.pop()
+            if pending:
+                parent = pending[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+            if lowlink[node] != order[node]:
+                continue
+
+            component = []
+            while True:
+                member = stack.pop()
+                on_stack[member] = False
+                component.append(member)
+                if member == node:
+                    break
+            spans = [(first[member], rank[member]) for member in component]
+            for member in component:
+                for child in children[member]:
+                    if intervals[child] is not None:
+                        spans.extend(intervals[child])
+            merged = merge_intervals(spans)
+            for member in component:
+                intervals[member] = merged
+
+    class_rank = array.array('I', rank)
+    rank_table = array.array('I', rank_class)
+    interval_start = array.array('I', [0])
+    interval_low = array.array('I')
+    interval_high = array.array('I')
+    for i in range(count):
+        for (low, high) in intervals[i]:
+            interval_low.append(low)
+            interval_high.append(high)
+        interval_start.append(len(interval_low))
+    parent_start = array.array('I', [0])
+    parent_table = array.array('I')
+    for class_parents in parent_ids:
+        parent_table.extend(class_parents)
+        parent_start.append(len(parent_table))
+
+    string_offsets = array.array('I', [0])
+    data = bytearray()
+    for iri in iris:
+        data += iri.encode('utf-8')
+        string_offsets.append(len(data))
+
+    header = array.array('I', [BYTE_ORDER_MARK, FORMAT_VERSION, count, len(interval_low), len(parent_table), 0])
+
+    # Write to a temporary file first so readers never map a partial file.
+    with atomic_write(closure_path, 'wb') as handle:
+        handle.write(MAGIC)
+        for table in (header, string_offsets, class_rank, rank_table, interval_start, interval_low, interval_high,
+            parent_start, parent_table):
+            table.tofile(handle)
+        handle.write(data)
+    return (count, len(interval_low))
+
+
+class SubclassClosure(object):
+    """
+    Read-only, memory-mapped view of a closure file.
+    """
+
+    def __init__(self, closure_path):
+        self.path = closure_path
+        with open(closure_path, 'rb') as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[0:len(MAGIC)] != MAGIC:
+            raise ValueError('Not a FoodOn subclass closure: ' + closure_path)
+
+        ints = memoryview(self._map)[len(MAGIC):].cast('B')
+        size = (len(ints) // 4) * 4
+        ints = ints[:size].cast('I')
+        (bom, version, self.class_count, interval_count, parent_count, _) = ints[0:HEADER_INTS]
+        if bom != BYTE_ORDER_MARK or version != FORMAT_VERSION:
+            raise ValueError('Incompatible FoodOn subclass closure (rebuild it): ' + closure_path)
+
+        position = HEADER_INTS
+        def table(length):
+            nonlocal position
+            view = ints[position: position + length]
+            position += length
+            return view
+
+        self._string_offsets = table(self.class_count + 1)
+        self._class_rank = table(self.class_count)
+        self._rank_class = table(self.class_count)
+        self._interval_start = table(self.class_count + 1)
+        self._interval_low = table(interval_count)
+        self._interval_high = table(interval_count)
+        self._parent_start = table(self.class_count + 1)
+        self._parent_id = table(parent_count)
+        self._data_start = len(MAGIC) + position * 4
+
+
+    def close(self):
+        for name in ('_string_offsets', '_class_rank', '_rank_class', '_interval_start', '_interval_low',
+            '_interval_high', '_parent_start', '_parent_id'):
+            getattr(self, name).release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _bytes(self, class_id):
+        start = self._data_start + self._string_offsets[class_id]
+        return self._map[start: self._data_start + self._string_offsets[class_id + 1]]
+
+    def _string(self, class_id):
+        return self._bytes(class_id).decode('utf-8')
+
+    def class_id(self, iri):
+        """
+        Return the id of iri, or None if it is in no subclass axiom.
+        """
+        key = iri.encode('utf-8')
+        low = 0
+        high = self.class_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._bytes(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.class_count and self._bytes(low) == key:
+            return low
+        return None
+
+    def _intervals(self, class_id):
+        return range(self._interval_start[class_id], self._interval_start[class_id + 1])
+
+
+    def __len__(self):
+        return self.class_count
+
+    def __contains__(self, iri):
+        return self.class_id(iri) is not None
+
+    def __iter__(self):
+        for class_id in range(self.class_count):
+            yield self._string(class_id)
+
+
+    def count(self, iri, include_self=False):
+        """
+        Return the number of classes under iri (rdfs:subClassOf+, or * with
+        include_self).
+        """
+        class_id = self.class_id(iri)
+        if class_id is None:
+            return 0
+        total = sum(self._interval_high[i] - self._interval_low[i] + 1 for i in self._intervals(class_id))
+        return total if include_self else total - 1
+
+    def descendants(self, iri, include_self=False):
+        """
+        Return the IRIs of the classes under iri, in post order.
+        """
+        class_id = self.class_id(iri)
+        if class_id is None:
+            return []
+        return [self._string(self._rank_class[rank]) for i in self._intervals(class_id)
+            for rank in range(self._interval_low[i], self._interval_high[i] + 1)
+            if include_self or self._rank_class[rank] != class_id]
+
+    def is_subclass(self, iri, ancestor):
+        """
+        Return True if iri is ancestor or one of its descendants.
+        """
+        class_id = self.class_id(iri)
+        ancestor_id = self.class_id(ancestor)
+        if class_id is None or ancestor_id is None:
+            return iri == ancestor
+        rank = self._class_rank[class_id]
+        intervals = self._intervals(ancestor_id)
+        lows = self._interval_low[intervals.start: intervals.stop]
+        position = bisect.bisect_right(lows, rank) - 1
+        return position >= 0 and rank <= self._interval_high[intervals.start + position]
+
+    def parents(self, iri):
+        class_id = self.class_id(iri)
+        if class_id is None:
+            return []
+        return [self._string(self._parent_id[i]) for i in range(self._parent_start[class_id], self._parent_start[class_id + 1])]
+
+    def ancestors(self, iri, include_self=False):
+        """
+        Return the IRIs of the classes above iri, nearest first.
+        """
+        class_id = self.class_id(iri)
+        if class_id is None:
+            return [iri] if include_self else []
+        found = [class_id]
+        seen = {class_id}
+        for node in found:
+            for i in range(self._parent_start[node], self._parent_start[node + 1]):
+                parent = self._parent_id[i]
+                if parent not in seen:
+                    seen.add(parent)
+                    found.append(parent)
+        return [self._string(node) for node in (found if include_self else found[1:])]
+
+    def subdomain_counts(self, roots=None):
+        """
+        Return [(root IRI, number of classes under it), ...] for roots, by
+        default the SUBDOMAINS.
+        """
+        return [(root, self.count(root)) for root in (roots or [iri for (iri, title) in SUBDOMAINS])]
+
+
+def is_stale(closure_path, ontology_paths):
+    return not os.path.exists(closure_path) \
+        or any(os.path.getmtime(closure_path) < os.path.getmtime(path) for path in ontology_paths)
+
+
+def open_subclass_closure(closure_path=CLOSURE_PATH, ontology_paths=None, intersections=True):
+    """
+    Return a shared SubclassClosure for closure_path, first (re)building it
+    from ontology_paths (by default default_ontology_paths()) if it is
+    missing or older than any of them.
+    """
+    closure_path = os.path.abspath(closure_path)
+    if ontology_paths is None:
+        ontology_paths = default_ontology_paths()
+    if ontology_paths and is_stale(closure_path, ontology_paths):
+        build_closure((edge for path in ontology_paths for edge in iter_subclass_edges(path, intersections)),
+            closure_path)
+
+    key = (closure_path, os.path.getmtime(closure_path))
+    if key not in _closure_cache:
+        _closure_cache[key] = SubclassClosure(closure_path)
+
+    return _closure_cache[key]
+
+
+def expand_term(term):
+    """
+    Full IRI of an IRI, OBO id (FOODON_00001287) or CURIE (FOODON:00001287).
+    """
+    if '://' in term:
+        return term
+    return OBO + term.replace(':', '_', 1)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Count and list subclasses from a precomputed subclass closure.')
+    parser.add_argument('terms', nargs='*',
+        help='Classes, as IRIs or ids like FOODON_00002381 (default: the subdomain roots)')
+    parser.add_argument('-l', '--lineage', action='store_true',
+        help='List the ancestors and descendants of each class rather than counting its descendants')
+    parser.add_argument('-r', '--rebuild', action='store_true',
+        help='Rebuild the closure file even if it is up to date')
+    parser.add_argument('-i', '--input', action='append', default=[],
+        help='Ontology files to build from (default: foodon-merged.owl, or else foodon.owl and its imports)')
+    parser.add_argument('-o', '--output', type=str, required=False, default=CLOSURE_PATH,
+        help='Closure file (default: foodon-closure.idx)')
+    parser.add_argument('--no-intersections', action='store_true',
+        help='Follow only rdfs:subClassOf a named class, as the SPARQL queries do')
+    parser.add_argument('-j', '--jobs', type=int, required=False,
+        help='Files read in parallel (default: one per CPU)')
+    args = parser.parse_args()
+
+    ontology_paths = args.input or default_ontology_paths()
+    for path in ontology_paths:
+        if not os.path.exists(path):
+            sys.exit('Unable to locate ontology file: ' + path)
+
+    if args.rebuild or (ontology_paths and is_stale(args.output, ontology_paths)):
+        if not ontology_paths:
+            sys.exit('No ontology files to build from: make foodon-merged.owl or give --input.')
+        started = time.time()
+        with multiprocessing.Pool(min(args.jobs or multiprocessing.cpu_count(), len(ontology_paths))) as pool:
+            jobs = [(path, not args.no_intersections) for path in ontology_paths]
+            (count, intervals) = build_closure((edge for edges in pool.imap(read_edges, jobs) for edge in edges),
+                args.output)
+        print('Built', args.output, 'from', len(ontology_paths), 'files: %d classes, %d intervals in %.2fs.'
+            % (count, intervals, time.time() - started), file=sys.stderr)
+    elif not os.path.exists(args.output):
+        sys.exit('No closure file ' + args.output + ': make foodon-merged.owl or give --input.')
+
+    closure = SubclassClosure(args.output)
+    labels = open_label_index(INDEX_PATH, LABELS_PATH) if os.path.exists(LABELS_PATH) or os.path.exists(INDEX_PATH) else None
+    def label(iri):
+        return (labels.get_label(iri) if labels else None) or ''
+
+    iris = [expand_term(term) for term in args.terms] or [iri for (iri, title) in SUBDOMAINS]
+    if args.lineage:
+        # As owl_get_mushroom.sparql does: the class, its ancestors and descendants.
+        print('?class\t?label')
+        for iri in iris:
+            for related in closure.ancestors(iri, include_self=True) + closure.descendants(iri):
+                print('<%s>\t%s' % (related, label(related)))
+    else:
+        print('?search\t?name\t?total')
+        for (iri, total) in closure.subdomain_counts(iris):
+            print('<%s>\t%s\t%d' % (iri, label(iri), total))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+#
+# Housecleaning across the whole ontology: eliminate synonymy tags
+# (oboInOwl:hasSynonym, oboInOwl:hasExactSynonym) and IAO:0000118 alternate
+# term tags whose text matches the entity's rdfs:label, ignoring case.  This
+# is the duplicate synonym pass of util_taxon_conversion.py, applied to every
+# import file and to the SIREN subset (foodon_siren.owl) rather than just
+# foodon-edit.owl.  The imports/ subset modules, e.g. subset_siren_import.owl,
+# are covered by imports/*.owl.
+#
+# Each file is cleaned by its own worker process and streamed through
+# util_rdfxml.py, so only one entity per file is in memory at a time and
+# everything but the removed lines is left exactly as it was.  Files with
+# nothing to remove aren't rewritten.
+#
+# The label compared against is the entity's English rdfs:label, or if it
+# has none, its rdfs:label without a language tag (as OntoFox imports have).
+#
+# example, run from the src/ontology/ folder:
+# python util_synonym_cleanup.py
+#   cleans imports/*.owl and foodon_siren.owl
+# python util_synonym_cleanup.py imports/general_import.owl foodon_siren.owl [-j 4]
+#
+
+import argparse
+import glob
+import multiprocessing
+import sys
+from os import path
+
+from util_rdfxml import rewrite_file
+from util_taxon_conversion import SYNONYMS
+
+DEFAULT_FILES = ['imports/*.owl', 'foodon_siren.owl']
+
+
+def find_label(entity):
+	untagged = None
+	for label in entity.findall('rdfs:label'):
+		language = label.get('xml:lang')
+		if language == 'en':
+			return label.text
+		if not language and untagged is None:
+			untagged = label.text
+	return untagged
+
+#
+# Remove synonyms of entity that duplicate its label. Returns count removed.
+#
+def remove_duplicate_synonyms(entity):
+
+	label = find_label(entity)
+	if not label:
+		return 0
+
+	label = label.lower()
+	count = 0
+	for synonymy in SYNONYMS:
+		for synonym in entity.findall(synonymy):
+			if synonym.text and synonym.text.lower() == label:
+				entity.remove(synonym)
+				count += 1
+
+	return count
+
+#
+# Clean one file in place.  Returns (file path, entities scanned, synonyms
+# removed).
+#
+def clean_file(file_path):
+
+	scanned = 0
+	removed = 0
+	def update(entity):
+		nonlocal scanned, removed
+		scanned += 1
+		removed += remove_duplicate_synonyms(entity)
+		return entity
+
+	rewrite_file(file_path, file_path, update)
+	return (file_path, scanned, removed)
+
+
+def main():
+
+	parser = argparse.ArgumentParser(description='Remove synonyms and alternate terms that duplicate an entity\'s label.')
+	parser.add_argument('files', nargs='*',
+		help='.owl files to clean (default: ' + ' '.join(DEFAULT_FILES) + ')')
+	parser.add_argument('-j', '--jobs', type=int, required=False,
+		help='Files cleaned in parallel (default: one per CPU)')
+	args = parser.parse_args()
+
+	file_paths = args.files
+	if not file_paths:
+		file_paths = sorted(file_path for pattern in DEFAULT_FILES for file_path in glob.glob(pattern))
+
+	for file_path in file_paths:
+		if not path.exists(file_path):
+			sys.exit('Unable to locate ontology file: ' + file_path);
+
+	if not file_paths:
+		sys.exit('No ontology files to clean.')
+
+	total = 0
+	with multiprocessing.Pool(min(args.jobs or multiprocessing.cpu_count(), len(file_paths))) as pool:
+		# Report each file as soon as it's done.
+		for (file_path, scanned, removed) in pool.imap_unordered(clean_file, file_paths):
+			print ('Cleaned', file_path + ':', removed, 'duplicate synonyms in', scanned, 'entities.')
+			total += removed
+
+	print ('Removed', total, 'duplicate synonyms from', len(file_paths), 'files.')
+
+
+if __name__ == '__main__':
+	main()
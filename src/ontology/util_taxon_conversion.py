@@ -18,24 +18,32 @@
 # NOTE: Trick with result = elementTree.find(...) 
 #  - it can only be tested with "if result != None:""
 #
-# NOTE: Currently this cannot be run twice on the same i/o file because save
-# in first pass the xml: entity prefix is not included in entity declaration 
-# section but file content still contains this prefix, so searches for xml:...
-# error out.
+# NOTE: Files are streamed through util_rdfxml.py, which rewrites only the
+# parts of foodon-edit.owl that change and appends new deprecations to
+# deprecation_import.owl, leaving all other formatting as Protege saved it.
+# (Protege will sort the appended deprecations on its next save.)
 #  
 # NOTE: In case one needs to retrieve a good deprecation_import.owl file:
 # This one not infected with output of 'in taxon' script:
 # git show f0aed4b:src/ontology/imports/deprecated_import.owl > imports/deprecation_import.owl
 #
 #
+# foodon-edit.owl is read once into a small index of candidate classes (leaf
+# status, 'in taxon' axioms, labels, dbxrefs, synonyms), from which a plan of
+# conversions and duplicate synonym removals is made and then applied in one
+# rewrite.  To review the plan first without changing any files:
+# python util_taxon_conversion.py --plan-only > taxon_plan.json
+#
 # Order of operations:
 # python util_taxon_conversion.py
-# python util_obsoletion_update.py imports/deprecation_import.owl foodon-edit.owl
-# python util_obsoletion_update.py imports/deprecation_import.owl imports/foodon_product_import.owl
+# python util_obsoletion_update.py -d imports/deprecation_import.owl -t foodon-edit.owl imports/foodon_product_import.owl
+
+import argparse
+import contextlib
+import json
+import sys
 
-# see https://stackabuse.com/reading-and-writing-xml-files-in-python/
-import xml.etree.ElementTree as ET
-import os
+from util_rdfxml import iter_nodes, make_element, rewrite_file
 
 # .owl file to store new deprecations in
 deprecated_file_path = 'imports/deprecation_import.owl';
@@ -44,169 +52,273 @@ deprecated_file_path = 'imports/deprecation_import.owl';
 input_file_path = 'foodon-edit.owl'
 output_file_path = input_file_path;
 
-# Preserve comments in XML files: 
-# https://stackoverflow.com/questions/33573807/faithfully-preserve-comments-in-parsed-xml
-#class CommentedTreeBuilder(ET.TreeBuilder):
-#    def comment(self, data):
-#        self.start(ET.Comment, {})
-#        self.data(data)
-#        self.end(ET.Comment)
-#
-#parser = ET.XMLParser(target=CommentedTreeBuilder())
-
-#Python 3.8
-#parser = ET.XMLParser(target=ET.TreeBuilder(insert_comments=True))
-# problem is it errors out on owl rdf/xml
+IN_TAXON = 'http://purl.obolibrary.org/obo/RO_0002162'
+SYNONYMS = ['oboInOwl:hasSynonym','oboInOwl:hasExactSynonym', 'obo:IAO_0000118']
 
-# Had to dig for this code to re-establish namespace from given XML file:
-# Have to fetch existing file's dictionary of prefix:uri namespaces
-namespace = dict([
-    node for (_, node) in ET.iterparse(input_file_path, events=['start-ns'])
-])
-# Oddly this one can get dropped on write of file, so must add it:
-namespace['xml'] = 'http://www.w3.org/XML/1998/namespace';
+#
+# Return an XML/RDF owl:Class about about_uri, with replaced_by link to
+# owl_taxon_uri, for appending to the deprecation_import.owl file.
+#
+def deprecate_term(about_uri, label, owl_taxon_uri):
 
-for prefix in namespace:
-	ET.register_namespace(prefix, namespace[prefix]);
+	# One extra check could be done to ensure duplicate deprecation not added.
+	return '\n'.join([
+		'<!-- ' + about_uri + ' -->',
+		'',
+		'    ' + make_element('owl:Class', {'rdf:about': about_uri})[:-2] + '>',
+		'        ' + make_element('owl:deprecated', {'rdf:datatype': 'http://www.w3.org/2001/XMLSchema#boolean'}, 'true'),
+		'        ' + make_element('rdfs:label', {'xml:lang': 'en'}, 'obsolete: ' + label),
+		# "replaced by" (IAO:0100001) taxonomy term.
+		'        ' + make_element('obo:IAO_0100001', {'rdf:resource': owl_taxon_uri}),
+		'    </owl:Class>'
+	])
+
+
+def find_english_label(owl_class):
+	for label in owl_class.findall('rdfs:label'):
+		if label.get('xml:lang') == 'en':
+			return label
+	return None
 
-tree = ET.parse(input_file_path); 
-root = tree.getroot();
+#
+# For an "'in taxon' some [taxon]" restriction return the [taxon] uri, or None
+# if the filler isn't a named taxon, e.g. (x or y ...).  Other restrictions
+# return ''.
+#
+def in_taxon_filler(owl_restriction):
 
-deprecations = ET.parse(deprecated_file_path); # replaced ET.parse()
-deprecation_root = deprecations.getroot();
+	owl_property = owl_restriction.find('owl:onProperty')
+	if owl_property is None or owl_property.get('rdf:resource') != IN_TAXON:
+		return ''
 
-# For working with ElementTree attributes, it seems we need to use this format of namespace:
-ns = {
-	'owl':  '{http://www.w3.org/2002/07/owl#}',
-	'rdfs': '{http://www.w3.org/2000/01/rdf-schema#}',
-	'rdf':  '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}',
-	'obo':  '{http://purl.obolibrary.org/obo/}'
-}
+	owl_taxon = owl_restriction.find('owl:someValuesFrom')
+	return owl_taxon.get('rdf:resource') if owl_taxon is not None else None
 
 #
-# IN deprecation_root owl file, add an XML/RDF owl:Class about about_uri, with
-# replaced_by link to owl_taxon_uri.
+# The index kept per owl:Class by scan_classes(); only classes that may need
+# a change are kept, so the index stays small however big the file is.
 #
-def deprecate_term(deprecation_root, about_uri, label, owl_taxon_uri):
-
-	# One extra check could be done to ensure duplicate deprecation not added.
-	obs_element = deprecation_root.makeelement('owl:Class', {'rdf:about': about_uri});
+def index_class(owl_class):
 
-	deprecated = obs_element.makeelement('owl:deprecated', {'rdf:datatype': 'http://www.w3.org/2001/XMLSchema#boolean'});
-	deprecated.text = 'true';
-	obs_element.append(deprecated);
+	label = find_english_label(owl_class)
+	entry = {
+		'label': label.text if label is not None else None,
+		'taxa': [],  # 'in taxon' restriction fillers; None for (x or y ...)
+		'dbxrefs': [],
+		'synonyms': []
+	}
 
-	obs_label = obs_element.makeelement('rdfs:label', {'xml:lang':'en'});
-	obs_label.text = 'obsolete: ' + label.text;
-	obs_element.append(obs_label);
+	for owl_subclassof in owl_class.findall('rdfs:subClassOf'):
+		for owl_restriction in owl_subclassof.findall('owl:Restriction'):
+			owl_taxon_uri = in_taxon_filler(owl_restriction)
+			if owl_taxon_uri != '':
+				entry['taxa'].append(owl_taxon_uri)
 
-	# "replaced by" (IAO:0100001) taxonomy term.
-	replaced = obs_element.makeelement('obo:IAO_0100001', {'rdf:resource':owl_taxon_uri});
-	obs_element.append(replaced);
+	for taxon_xref in owl_class.findall('oboInOwl:hasDbXref'):
+		if taxon_xref.get('rdf:resource'):
+			entry['dbxrefs'].append(taxon_xref.get('rdf:resource'))
 
-	deprecation_root.append(obs_element);
+	for synonymy in SYNONYMS:
+		for synonym in owl_class.findall(synonymy):
+			entry['synonyms'].append((synonymy, synonym.text))
 
+	return entry
 
+#
+# One streaming pass over input_file_path.  Returns (parent_uris, classes):
+# every owl:Class/rdfs:subClassOf[@rdf:resource] parent, and an index entry
+# for each owl:Class having an 'in taxon' axiom or any synonyms.
+#
+def scan_classes(input_file_path):
 
-rdf_resource_lookup = {};
-# Create index on all owl:Class/rdfs:subClassOf[@rdf:resource tags; only needs 1 entry
-for tag in root.findall('owl:Class/rdfs:subClassOf[@rdf:resource]', namespace):
-	rdf_resource_lookup[tag.attrib['{rdf}resource'.format(**ns)]] = [tag];
+	parent_uris = set()
+	classes = {}
+	for owl_class in iter_nodes(input_file_path):
+		if not owl_class.is_a('owl:Class'):
+			continue
 
+		for owl_subclassof in owl_class.findall('rdfs:subClassOf'):
+			if owl_subclassof.get('rdf:resource'):
+				parent_uris.add(owl_subclassof.get('rdf:resource'))
 
-# For all classes in main ontology file, see if they are FoodOn uri's and have
-# an "'in taxon' some [taxon]" axiom, and if so, convert class to be about 
-# [taxon], and deprecate the class'es existing uri in deprecated terms owl file
+		about = owl_class.get('rdf:about')
+		if about:
+			entry = index_class(owl_class)
+			if entry['taxa'] or entry['synonyms']:
+				classes[about] = entry
 
-count = 0;
+	return (parent_uris, classes)
 
-for owl_class in root.findall('owl:Class', namespace):
-	about = owl_class.get('{rdf}about'.format(**ns)); # owl_class.attrib['{rdf}about'.format(**ns)];
-	if (about and 'FOODON_' in about):
+#
+# Decide, from the scan index alone, what to change.  A FoodOn class is
+# converted to be about [taxon] when it is a leaf and has an
+# "'in taxon' some [taxon]" axiom.  Classes that aren't converted have
+# synonymy tags and IAO:0000118 alternate terms matching their label removed.
+#
+def make_plan(parent_uris, classes):
 
-		# ONLY DO TAXON CONVERSION IF THIS CLASS HAS NO EXPLICIT SUBCLASSES.
-		# PARENT CONVERSIONS MUST BE MANUALLY REVIEWED - TOO OFTEN THEY HAVE
-		# THEMSELVES AS A CHILD if 'in taxon' Y is too general.
-		if about in rdf_resource_lookup:
-			continue;
+	plan = {'conversions': [], 'duplicate_synonyms': []}
 
-		# Here we're only dealing with a leaf (no subclasses)
-		for owl_subclassof in owl_class.findall('rdfs:subClassOf', namespace):
+	for (about, entry) in classes.items():
+		conversion = plan_conversion(about, entry, parent_uris)
+		if conversion:
+			plan['conversions'].append(conversion)
+			continue # Its label becomes an IAO:0000118 alternate term.
 
-			for owl_restriction in owl_subclassof.findall('owl:Restriction', namespace):
+		if not entry['label']:
+			continue
+		label = entry['label'].lower()
+		for (synonymy, text) in entry['synonyms']:
+			if not text:
+				# Sometimes synonym has URI by accident instead of text
+				print ("Error in ", synonymy, "in", entry['label']);
+			elif text.lower() == label:
+				print ("Found duplicate", synonymy, entry['label']);
+				plan['duplicate_synonyms'].append({'about': about, 'property': synonymy, 'text': text})
 
-				# Find 'in taxon'
-				owl_property = owl_restriction.find('owl:onProperty[@rdf:resource = "http://purl.obolibrary.org/obo/RO_0002162"]', namespace)
+	return plan
 
-				if owl_property != None:
-					owl_taxon = owl_restriction.find('owl:someValuesFrom[@rdf:resource]', namespace);
 
-					if owl_taxon != None:
+def plan_conversion(about, entry, parent_uris):
 
-						owl_taxon_uri = owl_taxon.attrib['{rdf}resource'.format(**ns)];
+	if not ('FOODON_' in about and entry['taxa']):
+		return None
 
-						label = owl_class.find('rdfs:label[@xml:lang="en"]', namespace);
-						if label != None:
-							# Not converting items that are animal /human as consumer
-							if label.text.find('consumer') != -1: 
-								print ("Skipping consumer ", label.text);
-								continue;
+	# ONLY DO TAXON CONVERSION IF THIS CLASS HAS NO EXPLICIT SUBCLASSES.
+	# PARENT CONVERSIONS MUST BE MANUALLY REVIEWED - TOO OFTEN THEY HAVE
+	# THEMSELVES AS A CHILD if 'in taxon' Y is too general.
+	if about in parent_uris:
+		return None
 
-							alt_term = owl_class.makeelement('obo:IAO_0000118', {'xml:lang': 'en'});
-							alt_term.text = label.text;
-							owl_class.append(alt_term);
-							owl_class.remove(label);
+	for owl_taxon_uri in entry['taxa']:
+		if not owl_taxon_uri:
+			print ("Skipped ", about, "as it has multiple taxa expression");
+			continue
 
-						# HERE WE MAKE CHANGES
-						# FoodOn plant and animal organism may have duplicate dbxref to taxon:
-						taxon_xref = owl_class.find('oboInOwl:hasDbXref[@rdf:resource = "'+owl_taxon_uri+'"]', namespace)
-						if taxon_xref != None:
-							#print ('found dbxref')
-							owl_class.remove(taxon_xref);
+		# Not converting items that are animal /human as consumer
+		if entry['label'] and entry['label'].find('consumer') != -1:
+			print ("Skipping consumer ", entry['label']);
+			continue
 
+		return {
+			'about': about,
+			'taxon': owl_taxon_uri,
+			'label': entry['label'],
+			# FoodOn plant and animal organism may have duplicate dbxref to taxon:
+			'remove_dbxref': owl_taxon_uri in entry['dbxrefs']
+		}
 
-						# Remove existing rdf:about and add new one to class:
-						owl_class.attrib.pop('{rdf}about'.format(**ns), None)
-						owl_class.set('rdf:about', owl_taxon_uri);
+	return None
 
-						# Remove 'in taxon' some NCBITaxon axiom
-						owl_class.remove(owl_subclassof);
+#
+# Carry out a planned conversion on owl_class, returning the deprecation
+# entry for its existing uri.
+#
+def convert_class(owl_class, conversion):
 
-						# Prepare the obsoleted FoodOn class
-						deprecate_term(deprecation_root, about, label, owl_taxon_uri);
+	about = conversion['about']
+	owl_taxon_uri = conversion['taxon']
 
-						count += 1;
+	label = find_english_label(owl_class)
+	label_text = label.text if label is not None else ''
+	if label is not None:
+		owl_class.append(make_element('obo:IAO_0000118', {'xml:lang': 'en'}, label_text))
+		owl_class.remove(label)
 
-					else:
-						print ("Skipped ", about, "as it has multiple taxa expression");
+	if conversion['remove_dbxref']:
+		for taxon_xref in owl_class.findall('oboInOwl:hasDbXref'):
+			if taxon_xref.get('rdf:resource') == owl_taxon_uri:
+				owl_class.remove(taxon_xref)
+				break
 
-print ('Processed', count , 'taxa conversions.');
+	# Replace existing rdf:about with taxon (rewrite_file() renames the
+	# <!-- IRI --> comment above the class to match):
+	owl_class.set('rdf:about', owl_taxon_uri)
 
-# 2nd pass eliminates synonomy tags and IAO:0000118 alternate term tags that match rdfs:label
-for owl_class in root.findall('owl:Class', namespace):
-	label_node = owl_class.find('rdfs:label[@xml:lang="en"]', namespace);
-	if label_node != None:
-		label = label_node.text.lower();
-		# Housecleaning: get rid of synonyms that match label
-		# See https://docs.python.org/2/library/xml.etree.elementtree.html
-		for synonymy in ['oboInOwl:hasSynonym','oboInOwl:hasExactSynonym', 'obo:IAO_0000118']:
-			for synonym in owl_class.findall(synonymy, namespace):
-				if not synonym.text:
-					# Sometimes synonym has URI by accident instead of text
-					print ("Error in ", synonymy, "in",label);
-					pass
+	# Remove 'in taxon' some NCBITaxon axiom
+	for owl_subclassof in owl_class.findall('rdfs:subClassOf'):
+		if owl_taxon_uri in map(in_taxon_filler, owl_subclassof.findall('owl:Restriction')):
+			owl_class.remove(owl_subclassof)
+			break
 
-				elif synonym.text.lower() == label:
-					print ("Found duplicate", synonymy, label);
-					owl_class.remove(synonym);
+	return deprecate_term(about, label_text, owl_taxon_uri)
 
+#
+# Housecleaning: remove planned duplicate synonyms [(property, text), ...]
+# from owl_class.  Returns count removed.
+#
+def remove_duplicate_synonyms(owl_class, duplicates):
 
-if (count > 0):
-	tree.write(output_file_path, xml_declaration=True, encoding='utf-8', method="xml", );
-	cmd = f'robot reduce -i {output_file_path} -r ELK -o {output_file_path}' # Note no --xml-entities
-	os.system(cmd)
+	count = 0
+	for (synonymy, text) in duplicates:
+		for synonym in owl_class.findall(synonymy):
+			if synonym.text == text:
+				owl_class.remove(synonym);
+				count += 1
+				break
 
-	deprecations.write(deprecated_file_path, xml_declaration=True, encoding='utf-8', method="xml");
-	cmd = f'robot reduce -i {deprecated_file_path} -r ELK -o {deprecated_file_path}' # Note no --xml-entities
-	os.system(cmd)
+	return count
 
+#
+# Apply a plan to input_file_path in a single rewrite, appending
+# deprecations to deprecated_file_path.
+#
+def apply_plan(plan, input_file_path, output_file_path, deprecated_file_path):
+
+	conversions = {conversion['about']: conversion for conversion in plan['conversions']}
+	duplicates = {}
+	for duplicate in plan['duplicate_synonyms']:
+		duplicates.setdefault(duplicate['about'], []).append((duplicate['property'], duplicate['text']))
+
+	deprecations = []
+	removed = 0
+	def update(owl_class):
+		nonlocal removed
+		if owl_class.is_a('owl:Class'):
+			about = owl_class.get('rdf:about')
+			if about in conversions:
+				deprecations.append(convert_class(owl_class, conversions[about]))
+			elif about in duplicates:
+				removed += remove_duplicate_synonyms(owl_class, duplicates[about])
+		return owl_class
+
+	if conversions or duplicates:
+		rewrite_file(input_file_path, output_file_path, update)
+
+	print ('Processed', len(deprecations), 'taxa conversions.');
+	print ('Removed', removed, 'duplicate synonyms.');
+
+	if deprecations:
+		rewrite_file(deprecated_file_path, deprecated_file_path, append=deprecations)
+
+
+def main():
+
+	parser = argparse.ArgumentParser(description='Convert FoodOn organism classes having an \'in taxon\' axiom to NCBITaxon classes.')
+	parser.add_argument('-i', '--input', type=str, required=False, default=input_file_path,
+		help='Ontology file to convert classes in')
+	parser.add_argument('-d', '--deprecated', type=str, required=False, default=deprecated_file_path,
+		help='.owl file to append new deprecations to')
+	parser.add_argument('-p', '--plan-only', action='store_true',
+		help='Print the planned conversions and synonym removals as JSON; change nothing')
+	args = parser.parse_args()
+
+	# For all classes in main ontology file, see if they are FoodOn uri's and have
+	# an "'in taxon' some [taxon]" axiom, and if so, convert class to be about
+	# [taxon], and deprecate the class'es existing uri in deprecated terms owl file.
+	# Then eliminate duplicate synonyms of all classes.
+	(parent_uris, classes) = scan_classes(args.input)
+
+	if args.plan_only:
+		# Keep stdout for the JSON.
+		with contextlib.redirect_stdout(sys.stderr):
+			plan = make_plan(parent_uris, classes)
+		json.dump(plan, sys.stdout, indent=1)
+		print ()
+	else:
+		plan = make_plan(parent_uris, classes)
+		apply_plan(plan, args.input, args.input, args.deprecated)
+
+
+if __name__ == '__main__':
+	main()
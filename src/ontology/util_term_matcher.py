@@ -0,0 +1,310 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_term_matcher.py
+Project: FoodOn
+
+A LexMapr style matcher of free text food descriptions to FoodOn terms.
+
+Labels (from foodon-labels.tsv via util_labels) and hasExactSynonym /
+hasNarrowSynonym values (scanned from foodon-merged.owl, or else from
+foodon-edit.owl and the OWL files in imports/) are normalized, tokenized and
+indexed by their word unigrams and (unordered) bigrams in an inverted
+index.  A description is ranked against every phrase sharing a word n-gram
+with it:
+
+    score = source weight * (share of phrase n-grams matched
+                             + share of description n-grams matched) / 2
+
+so an exact label match scores 1.0, while partial matches rank by how much
+of each side the other covers.
+
+Examples, run from the src/ontology/ folder:
+
+    python util_term_matcher.py "raw apple slices"
+
+    python util_term_matcher.py --batch samples.csv --column description \
+        --output samples_mapped.csv --jobs 8
+
+Batch mode streams the CSV through a process pool in chunks, so input size
+is limited only by disk.  Each output row is the input row followed by the
+best match's IRI, label and score.  Building the index takes a few seconds;
+--save-index / --index keep a pickled copy for repeated runs.
+"""
+
+import argparse
+import csv
+import functools
+import glob
+import itertools
+import multiprocessing
+import os
+import pickle
+import re
+import sys
+import unicodedata
+
+from util_annotations import iter_annotations, EXACT_SYNONYM, NARROW_SYNONYM, SYNONYMS
+from util_labels import ONTOLOGY_DIR, open_label_index
+
+# Relative trust in each source of phrase text.
+SOURCE_WEIGHTS = {
+    'label': 1.0,
+    EXACT_SYNONYM: 0.95,
+    NARROW_SYNONYM: 0.8
+}
+
+WORD = re.compile(r'[a-z0-9]+')
+CHUNK_SIZE = 1000
+
+
+def normalize(text):
+    """
+    Return the list of normalized word tokens of text: accents stripped,
+    lowercased, punctuation dropped, simple plurals singularized.
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+
+    tokens = []
+    for token in WORD.findall(text):
+        if len(token) > 4 and token.endswith('ies'):
+            token = token[:-3] + 'y'
+        elif len(token) > 3 and token[-1] == 's' and token[-2] not in 'sui':
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def ngrams(tokens):
+    """
+    Set of word unigrams and bigrams of a token list.  Bigram words are
+    sorted, so "apple (raw)" and "raw apple" share their bigram.
+    """
+    grams = set(tokens)
+    grams.update(' '.join(sorted(pair)) for pair in zip(tokens, tokens[1:]))
+    return grams
+
+
+class TermMatcher(object):
+
+    def __init__(self):
+        self.phrases = []       # phrase id -> normalized phrase key
+        self.phrase_ids = {}    # normalized phrase key -> phrase id
+        self.phrase_grams = []  # phrase id -> n-gram count
+        self.entries = []       # phrase id -> [(iri, source, original text), ...]
+        self.index = {}         # n-gram -> [phrase id, ...]
+        self.labels = {}        # iri -> label
+
+
+    def add(self, iri, text, source='label'):
+        tokens = normalize(text)
+        if not tokens:
+            return
+
+        key = ' '.join(tokens)
+        phrase_id = self.phrase_ids.get(key)
+        if phrase_id is None:
+            phrase_id = len(self.phrases)
+            self.phrase_ids[key] = phrase_id
+            self.phrases.append(key)
+            self.entries.append([])
+            grams = ngrams(tokens)
+            self.phrase_grams.append(len(grams))
+            for gram in grams:
+                self.index.setdefault(gram, []).append(phrase_id)
+
+        entry = (iri, source, text)
+        if entry not in self.entries[phrase_id]:
+            self.entries[phrase_id].append(entry)
+        if source == 'label' and iri not in self.labels:
+            self.labels[iri] = text
+
+
+    @classmethod
+    def from_ontology(cls, ontology_dir=ONTOLOGY_DIR, owl_paths=None):
+        """
+        Index English labels from foodon-labels.tsv and synonyms from
+        owl_paths.  By default these are foodon-merged.owl if it has been
+        made.  Otherwise they are foodon-edit.owl, which holds FoodOn's own
+        synonyms, and every imports/*.owl file.
+        """
+        matcher = cls()
+        label_index = open_label_index(os.path.join(ontology_dir, 'foodon-labels.idx'),
+            os.path.join(ontology_dir, 'foodon-labels.tsv'))
+        for iri in label_index:
+            for (label, language) in label_index.get_labels(iri):
+                if language in ('', 'en'):
+                    matcher.add(iri, label)
+
+        if owl_paths is None:
+            merged = os.path.join(ontology_dir, 'foodon-merged.owl')
+            if os.path.exists(merged):
+                owl_paths = [merged]
+            else:
+                edit = os.path.join(ontology_dir, 'foodon-edit.owl')
+                owl_paths = ([edit] if os.path.exists(edit) else []) \
+                    + sorted(glob.glob(os.path.join(ontology_dir, 'imports', '*.owl')))
+        for path in owl_paths:
+            for (iri, prop, text, language) in iter_annotations(path, SYNONYMS):
+                if language in ('', 'en'):
+                    matcher.add(iri, text, prop)
+
+        return matcher
+
+
+    def save(self, path):
+        with open(path, 'wb') as handle:
+            pickle.dump(self, handle, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as handle:
+            return pickle.load(handle)
+
+
+    def match(self, text, limit=5, iri_prefix=''):
+        """
+        Return up to limit [(iri, score, matched text, source), ...] for text,
+        best first.  Only IRIs starting with iri_prefix are returned.
+        """
+        grams = ngrams(normalize(text))
+        if not grams:
+            return []
+
+        shared = {}
+        for gram in grams:
+            for phrase_id in self.index.get(gram, ()):
+                shared[phrase_id] = shared.get(phrase_id, 0) + 1
+
+        best = {}
+        for (phrase_id, count) in shared.items():
+            coverage = (count / self.phrase_grams[phrase_id] + count / len(grams)) / 2
+            for (iri, source, original) in self.entries[phrase_id]:
+                if not iri.startswith(iri_prefix):
+                    continue
+                score = round(SOURCE_WEIGHTS[source] * coverage, 4)
+                # Prefer the higher score, then the shorter matched phrase.
+                if iri not in best or (score, -len(original)) > (best[iri][1], -len(best[iri][2])):
+                    best[iri] = (iri, score, original, source)
+
+        return sorted(best.values(), key=lambda result: (-result[1], len(result[2]), result[0]))[:limit]
+
+
+    def get_label(self, iri):
+        return self.labels.get(iri, '')
+
+
+# Batch mode: each worker process holds one matcher and a cache of results.
+_worker_matcher = None
+_worker_options = None
+
+
+def _init_worker(matcher, options):
+    global _worker_matcher, _worker_options
+    _worker_matcher = matcher
+    _worker_options = options
+
+
+@functools.lru_cache(maxsize=100000)
+def _best_match(text):
+    results = _worker_matcher.match(text, 1, _worker_options['iri_prefix'])
+    if not results:
+        return ('', '', '')
+    (iri, score, original, source) = results[0]
+    return (iri, _worker_matcher.get_label(iri) or original, str(score))
+
+
+def _match_chunk(rows):
+    column = _worker_options['column']
+    return [row + list(_best_match(row[column])) if column < len(row) else row + ['', '', '']
+        for row in rows]
+
+
+def _chunks(reader, size):
+    while True:
+        chunk = list(itertools.islice(reader, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def match_csv(matcher, input_path, output_path, column=None, jobs=None, iri_prefix=''):
+    """
+    Stream a CSV of descriptions through a pool of jobs worker processes.
+    column is a header name or 0 based index; the first column by default.
+    Output rows keep input order.  Returns the number of rows matched.
+    """
+    count = 0
+    with open(input_path, 'r', newline='', encoding='utf-8') as input_handle:
+        reader = csv.reader(input_handle)
+        header = next(reader, None)
+        if header is None:
+            return 0
+        if column is None:
+            column_index = 0
+        elif column in header:
+            column_index = header.index(column)
+        elif column.isdigit() and int(column) < len(header):
+            column_index = int(column)
+        else:
+            sys.exit('No column "%s" in %s; its columns are: %s' % (column, input_path, ', '.join(header)))
+
+        with open(output_path, 'w', newline='', encoding='utf-8') as output_handle:
+            writer = csv.writer(output_handle)
+            writer.writerow(header + ['foodon_iri', 'foodon_label', 'foodon_score'])
+
+            options = {'column': column_index, 'iri_prefix': iri_prefix}
+            with multiprocessing.Pool(jobs, _init_worker, (matcher, options)) as pool:
+                for rows in pool.imap(_match_chunk, _chunks(reader, CHUNK_SIZE)):
+                    writer.writerows(rows)
+                    count += len(rows)
+
+    return count
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Match free text food descriptions to FoodOn terms.')
+    parser.add_argument('text', nargs='*',
+                        help='Description(s) to match')
+    parser.add_argument('-b', '--batch', type=str, required=False,
+                        help='CSV file of descriptions to match')
+    parser.add_argument('-o', '--output', type=str, required=False,
+                        help='Output CSV file for --batch')
+    parser.add_argument('-c', '--column', type=str, required=False,
+                        help='Name or 0 based index of the --batch description column')
+    parser.add_argument('-j', '--jobs', type=int, required=False,
+                        help='Worker processes for --batch (default: one per CPU)')
+    parser.add_argument('-l', '--limit', type=int, required=False, default=5,
+                        help='Number of ranked matches to show per description')
+    parser.add_argument('-p', '--prefix', type=str, required=False, default='',
+                        help='Only return IRIs with this prefix, e.g. http://purl.obolibrary.org/obo/FOODON_')
+    parser.add_argument('-i', '--index', type=str, required=False,
+                        help='Load a pickled matcher index saved with --save-index')
+    parser.add_argument('-s', '--save-index', type=str, required=False,
+                        help='Save the matcher index to this file')
+    args = parser.parse_args()
+
+    if args.index:
+        matcher = TermMatcher.load(args.index)
+    else:
+        matcher = TermMatcher.from_ontology()
+    if args.save_index:
+        matcher.save(args.save_index)
+
+    if args.batch:
+        if not args.output:
+            sys.exit('--batch requires --output')
+        count = match_csv(matcher, args.batch, args.output, args.column, args.jobs, args.prefix)
+        print ('Matched', count, 'descriptions into', args.output)
+
+    for text in args.text:
+        print (text)
+        for (iri, score, original, source) in matcher.match(text, args.limit, args.prefix):
+            print ('  %s\t%s\t%s' % (score, iri, original))
+
+
+if __name__ == '__main__':
+    main()
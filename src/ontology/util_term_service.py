@@ -0,0 +1,210 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+util_term_service.py
+Project: FoodOn
+
+A small local HTTP service answering batched FoodOn term lookups from
+in-memory indexes that are loaded once at startup, so annotation workers
+don't each re-parse foodon-labels.tsv or the OWL files.  Standard library
+only.  Run from the src/ontology/ folder:
+
+    python util_term_service.py --port 8765 [--ontology foodon-merged.owl]
+
+Every request is a POST of a JSON object holding a list; every response is a
+JSON object keyed by the given items:
+
+    POST /labels     {"iris": [IRI, ...]}     -> {IRI: label or null}
+    POST /iris       {"labels": [text, ...]}  -> {text: [IRI, ...]}
+    POST /match      {"texts": [text, ...], "limit": 5}
+                     -> {text: [[IRI, score, matched text], ...]}
+    POST /ancestors  {"iris": [IRI, ...]}     -> {IRI: [ancestor IRI, ...]}
+
+GET /status reports index sizes and cache statistics.  Answers for single
+items are kept in LRU caches (--cache entries each), so repeated queries
+are served without touching the indexes.
+
+The subclass hierarchy for /ancestors comes from the --ontology files; by
+default foodon-merged.owl if it has been made, otherwise imports/*.owl.
+"""
+
+import argparse
+import functools
+import glob
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from util_annotations import iter_subclass_edges
+from util_labels import ONTOLOGY_DIR, open_label_index
+from util_term_matcher import TermMatcher
+
+
+def strings(request, field):
+    """
+    The list of strings request[field].  Raises KeyError if it is missing,
+    TypeError if it is anything else.
+    """
+    items = request[field]
+    if not isinstance(items, list) or not all(isinstance(item, str) for item in items):
+        raise TypeError('"%s" should be a list of strings' % field)
+    return items
+
+
+class TermService(object):
+
+    def __init__(self, label_index, matcher, parents, cache_size=100000):
+        self.label_index = label_index
+        self.matcher = matcher
+        self.parents = parents # IRI -> [parent IRI, ...]
+
+        self.get_label = functools.lru_cache(maxsize=cache_size)(label_index.get_label)
+        self.get_iris = functools.lru_cache(maxsize=cache_size)(label_index.get_iris)
+        self.match = functools.lru_cache(maxsize=cache_size)(self._match)
+        self.get_ancestors = functools.lru_cache(maxsize=cache_size)(self._ancestors)
+
+
+    @classmethod
+    def from_ontology(cls, ontology_dir=ONTOLOGY_DIR, ontology_paths=None, matcher_path=None, cache_size=100000):
+        label_index = open_label_index(os.path.join(ontology_dir, 'foodon-labels.idx'),
+            os.path.join(ontology_dir, 'foodon-labels.tsv'))
+
+        if matcher_path:
+            matcher = TermMatcher.load(matcher_path)
+        else:
+            matcher = TermMatcher.from_ontology(ontology_dir)
+
+        if not ontology_paths:
+            merged = os.path.join(ontology_dir, 'foodon-merged.owl')
+            if os.path.exists(merged):
+                ontology_paths = [merged]
+            else:
+                ontology_paths = sorted(glob.glob(os.path.join(ontology_dir, 'imports', '*.owl')))
+
+        parents = {}
+        for path in ontology_paths:
+            for (iri, parent) in iter_subclass_edges(path):
+                if parent not in parents.setdefault(iri, []):
+                    parents[iri].append(parent)
+
+        return cls(label_index, matcher, parents, cache_size)
+
+
+    def _match(self, text, limit):
+        return tuple((iri, score, original) for (iri, score, original, source) in self.matcher.match(text, limit))
+
+
+    def _ancestors(self, iri):
+        """
+        All superclasses of iri, nearest first.  Cycles are tolerated.
+        """
+        ancestors = []
+        seen = {iri}
+        queue = list(self.parents.get(iri, ()))
+        while queue:
+            parent = queue.pop(0)
+            if parent in seen:
+                continue
+            seen.add(parent)
+            ancestors.append(parent)
+            queue.extend(self.parents.get(parent, ()))
+        return tuple(ancestors)
+
+
+    def handle(self, path, request):
+        """
+        Answer one batched request, or return None for an unknown path.
+        Raises KeyError, ValueError or TypeError when the request is malformed.
+        """
+        if path == '/labels':
+            return {iri: self.get_label(iri) for iri in strings(request, 'iris')}
+        if path == '/iris':
+            return {label: self.get_iris(label) for label in strings(request, 'labels')}
+        if path == '/match':
+            limit = int(request.get('limit', 5))
+            return {text: self.match(text, limit) for text in strings(request, 'texts')}
+        if path == '/ancestors':
+            return {iri: self.get_ancestors(iri) for iri in strings(request, 'iris')}
+        return None
+
+
+    def status(self):
+        caches = {}
+        for name in ('get_label', 'get_iris', 'match', 'get_ancestors'):
+            info = getattr(self, name).cache_info()
+            caches[name] = {'hits': info.hits, 'misses': info.misses, 'size': info.currsize}
+        return {
+            'labelled_iris': len(self.label_index),
+            'matcher_phrases': len(self.matcher.phrases),
+            'classes_with_parents': len(self.parents),
+            'caches': caches
+        }
+
+
+class TermRequestHandler(BaseHTTPRequestHandler):
+
+    service = None # TermService shared by all handler threads
+
+    def send_json(self, code, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self.send_json(200, self.service.status())
+        else:
+            self.send_json(404, {'error': 'Unknown path ' + self.path})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            response = self.service.handle(self.path, request)
+        except KeyError as e:
+            self.send_json(400, {'error': 'Missing request field ' + str(e)})
+            return
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {'error': 'Bad request: ' + str(e)})
+            return
+
+        if response is None:
+            self.send_json(404, {'error': 'Unknown path ' + self.path})
+        else:
+            self.send_json(200, response)
+
+    def log_message(self, format, *args):
+        pass # Thousands of requests a second; don't log each one.
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Local batch FoodOn term lookup service.')
+    parser.add_argument('-H', '--host', type=str, required=False, default='127.0.0.1',
+                        help='Interface to listen on')
+    parser.add_argument('-p', '--port', type=int, required=False, default=8765,
+                        help='Port to listen on')
+    parser.add_argument('-o', '--ontology', nargs='+', required=False,
+                        help='OWL files to read the subclass hierarchy from')
+    parser.add_argument('-i', '--index', type=str, required=False,
+                        help='Pickled matcher index saved by util_term_matcher.py --save-index')
+    parser.add_argument('-c', '--cache', type=int, required=False, default=100000,
+                        help='LRU cache entries per lookup type')
+    args = parser.parse_args()
+
+    TermRequestHandler.service = TermService.from_ontology(ONTOLOGY_DIR, args.ontology, args.index, args.cache)
+
+    server = ThreadingHTTPServer((args.host, args.port), TermRequestHandler)
+    print ('Serving FoodOn term lookups on http://%s:%s' % (args.host, args.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()